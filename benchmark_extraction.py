@@ -0,0 +1,542 @@
+#!/usr/bin/env python3
+"""
+⏱️ Benchmark de Extracción - Robot AI
+Compara tiempo y precisión de caracteres de las variantes del pipeline de extracción
+sobre un corpus de muestra.
+
+Corpus: una carpeta con imágenes (.png, .jpg, .tif...) y/o PDFs.
+Texto de referencia opcional junto a cada archivo:
+  - imagen.png  -> imagen.txt
+  - pliego.pdf  -> pliego_p1.txt, pliego_p2.txt, ... (una por página)
+
+Uso:
+  python benchmark_extraction.py ocr carpeta_corpus [--max-paginas 20]
+  python benchmark_extraction.py motores carpeta_corpus
+  python benchmark_extraction.py vision carpeta_corpus   (OPENAI_API_KEY opcional: latencia y precisión reales)
+  python benchmark_extraction.py docx carpeta_con_docx
+  python benchmark_extraction.py imagenes carpeta_con_fotos
+"""
+
+import argparse
+import difflib
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.tiff', '.tif', '.bmp', '.webp'}
+
+
+def character_accuracy(reference, hypothesis):
+    """Fracción de caracteres de la referencia reconocidos en el mismo orden"""
+    reference = " ".join(reference.split())
+    hypothesis = " ".join(hypothesis.split())
+    if not reference:
+        return 1.0 if not hypothesis else 0.0
+    matcher = difflib.SequenceMatcher(None, reference, hypothesis, autojunk=False)
+    matched = sum(block.size for block in matcher.get_matching_blocks())
+    return matched / len(reference)
+
+
+def load_corpus_pages(corpus_dir, max_pages=None):
+    """Genera (nombre, imagen PIL, texto_referencia o None) para cada página del corpus"""
+    from PIL import Image
+    from modules.document_processor import iter_pdf_page_images
+
+    produced = 0
+    for path in sorted(Path(corpus_dir).iterdir()):
+        suffix = path.suffix.lower()
+        if suffix in IMAGE_EXTENSIONS:
+            reference_path = path.with_suffix('.txt')
+            reference = reference_path.read_text(encoding='utf-8') if reference_path.exists() else None
+            with Image.open(path) as img:
+                yield path.name, img.convert('RGB'), reference
+            produced += 1
+        elif suffix == '.pdf':
+            for page_index, image in iter_pdf_page_images(path.read_bytes()):
+                reference_path = path.with_name(f"{path.stem}_p{page_index + 1}.txt")
+                reference = reference_path.read_text(encoding='utf-8') if reference_path.exists() else None
+                yield f"{path.name}#p{page_index + 1}", image, reference
+                produced += 1
+                if max_pages and produced >= max_pages:
+                    return
+        if max_pages and produced >= max_pages:
+            return
+
+
+def benchmark_ocr(corpus_dir, max_pages=None):
+    """Cascada de tres configuraciones vs. una pasada guiada por confianza"""
+    from modules.document_processor import (
+        preprocess_image_for_ocr, ocr_page_cascade, ocr_page_confidence, OCR_PAGE_TIMEOUT
+    )
+
+    print("⏱️ ===== BENCHMARK OCR: CASCADA vs CONFIANZA =====\n")
+    rows = []
+    for name, image, reference in load_corpus_pages(corpus_dir, max_pages):
+        processed = preprocess_image_for_ocr(image, as_array=True)
+
+        start = time.perf_counter()
+        cascade_text = ocr_page_cascade(processed, OCR_PAGE_TIMEOUT)
+        cascade_seconds = time.perf_counter() - start
+
+        details = {}
+        start = time.perf_counter()
+        confidence_text = ocr_page_confidence(processed, OCR_PAGE_TIMEOUT, details)
+        confidence_seconds = time.perf_counter() - start
+
+        row = {
+            "pagina": name,
+            "cascada_segundos": round(cascade_seconds, 3),
+            "confianza_segundos": round(confidence_seconds, 3),
+            "confianza_media": details.get("confianza_media"),
+            "regiones_reprocesadas": details.get("regiones_reprocesadas", 0),
+            "cascada_caracteres": len(cascade_text),
+            "confianza_caracteres": len(confidence_text)
+        }
+        if reference is not None:
+            row["cascada_precision"] = round(character_accuracy(reference, cascade_text), 4)
+            row["confianza_precision"] = round(character_accuracy(reference, confidence_text), 4)
+        rows.append(row)
+
+        accuracy = ""
+        if reference is not None:
+            accuracy = f" | precisión {row['cascada_precision']:.1%} → {row['confianza_precision']:.1%}"
+        print(f"📄 {name}: {cascade_seconds:.2f}s → {confidence_seconds:.2f}s{accuracy}")
+
+    if not rows:
+        print("❌ El corpus no contiene páginas")
+        return None
+
+    with_reference = [r for r in rows if "cascada_precision" in r]
+    summary = {
+        "paginas": len(rows),
+        "cascada_segundos_total": round(sum(r["cascada_segundos"] for r in rows), 2),
+        "confianza_segundos_total": round(sum(r["confianza_segundos"] for r in rows), 2),
+        "paginas_con_referencia": len(with_reference)
+    }
+    summary["aceleracion"] = round(
+        summary["cascada_segundos_total"] / summary["confianza_segundos_total"], 2
+    ) if summary["confianza_segundos_total"] else None
+    if with_reference:
+        summary["cascada_precision_media"] = round(sum(r["cascada_precision"] for r in with_reference) / len(with_reference), 4)
+        summary["confianza_precision_media"] = round(sum(r["confianza_precision"] for r in with_reference) / len(with_reference), 4)
+
+    print(f"\n📊 ===== RESUMEN =====")
+    print(f"📄 Páginas: {summary['paginas']}")
+    print(f"⏱️ Cascada: {summary['cascada_segundos_total']}s | Confianza: {summary['confianza_segundos_total']}s (x{summary['aceleracion']})")
+    if with_reference:
+        print(f"🎯 Precisión media: cascada {summary['cascada_precision_media']:.1%} | confianza {summary['confianza_precision_media']:.1%}")
+
+    return {"resumen": summary, "paginas": rows}
+
+
+def benchmark_ocr_engines(corpus_dir, max_pages=None, overhead_calls=20):
+    """Motor persistente (tesserocr) vs. pytesseract: sobrecosto fijo por llamada y por página"""
+    import numpy as np
+    from modules.document_processor import (
+        preprocess_image_for_ocr, PytesseractBackend, TesserocrBackend, OCR_REGION_PSM
+    )
+
+    print("⏱️ ===== BENCHMARK MOTORES OCR: PYTESSERACT vs PERSISTENTE =====\n")
+    fallback = PytesseractBackend()
+    try:
+        start = time.perf_counter()
+        persistent = TesserocrBackend()
+        init_seconds = time.perf_counter() - start
+    except Exception as e:
+        print(f"❌ Motor persistente no disponible (pip install tesserocr): {str(e)}")
+        return None
+    print(f"🧠 Inicialización única del motor persistente: {init_seconds:.2f}s")
+
+    # Sobrecosto fijo: imagen casi vacía, el reconocimiento en sí es despreciable
+    blank = np.full((64, 64), 255, dtype=np.uint8)
+    overhead = {}
+    for backend in (fallback, persistent):
+        start = time.perf_counter()
+        for _ in range(overhead_calls):
+            backend.image_to_string(blank, OCR_REGION_PSM)
+        overhead[backend.name] = (time.perf_counter() - start) / overhead_calls
+        print(f"🔁 {backend.name}: {overhead[backend.name] * 1000:.1f} ms por llamada (imagen vacía)")
+
+    rows = []
+    for name, image, reference in load_corpus_pages(corpus_dir, max_pages):
+        processed = preprocess_image_for_ocr(image, as_array=True)
+        row = {"pagina": name}
+        for backend in (fallback, persistent):
+            start = time.perf_counter()
+            text = backend.image_to_string(processed, OCR_REGION_PSM)
+            row[f"{backend.name}_segundos"] = round(time.perf_counter() - start, 3)
+            if reference is not None:
+                row[f"{backend.name}_precision"] = round(character_accuracy(reference, text), 4)
+        rows.append(row)
+        print(f"📄 {name}: pytesseract {row['pytesseract_segundos']:.2f}s → tesserocr {row['tesserocr_segundos']:.2f}s")
+
+    summary = {
+        "inicializacion_persistente_segundos": round(init_seconds, 3),
+        "sobrecosto_por_llamada_ms": {name: round(value * 1000, 1) for name, value in overhead.items()},
+        "sobrecosto_eliminado_ms": round((overhead["pytesseract"] - overhead["tesserocr"]) * 1000, 1),
+        "paginas": len(rows)
+    }
+    if rows:
+        summary["pytesseract_segundos_total"] = round(sum(r["pytesseract_segundos"] for r in rows), 2)
+        summary["tesserocr_segundos_total"] = round(sum(r["tesserocr_segundos"] for r in rows), 2)
+        summary["ahorro_por_pagina_ms"] = round(
+            (summary["pytesseract_segundos_total"] - summary["tesserocr_segundos_total"]) * 1000 / len(rows), 1
+        )
+
+    print(f"\n📊 ===== RESUMEN =====")
+    print(f"⚡ Sobrecosto eliminado por llamada: {summary['sobrecosto_eliminado_ms']} ms")
+    if rows:
+        print(f"📄 Ahorro medio por página: {summary['ahorro_por_pagina_ms']} ms")
+
+    return {"resumen": summary, "paginas": rows}
+
+
+def benchmark_vision_images(corpus_dir, max_pages=None):
+    """Preparación original de imágenes para Vision AI vs. recorte + grises + rejilla de tiles"""
+    from modules.document_processor import (
+        encode_image_for_vision, extract_text_with_vision_api, new_vision_stats,
+        preprocess_image_for_ocr, get_ocr_backend, OCR_LAYOUT_PSM
+    )
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    print("⏱️ ===== BENCHMARK VISION: TOKENS DE IMAGEN =====\n")
+    if not api_key:
+        print("ℹ️ Sin OPENAI_API_KEY: solo se comparan tokens estimados\n")
+
+    rows = []
+    for name, image, reference in load_corpus_pages(corpus_dir, max_pages):
+        ocr_text = get_ocr_backend().image_to_string(preprocess_image_for_ocr(image, as_array=True), OCR_LAYOUT_PSM)
+        row = {"pagina": name}
+        for label, optimize in (("original", False), ("optimizada", True)):
+            _, detail, tokens = encode_image_for_vision(image, ocr_text, optimize)
+            row[f"{label}_tokens_imagen"] = tokens
+            row[f"{label}_detalle"] = detail
+            if api_key:
+                usage = new_vision_stats()
+                start = time.perf_counter()
+                text = extract_text_with_vision_api(image, api_key, usage, ocr_text, optimize)
+                row[f"{label}_segundos"] = round(time.perf_counter() - start, 3)
+                row[f"{label}_prompt_tokens"] = usage["prompt_tokens"]
+                if reference is not None:
+                    row[f"{label}_precision"] = round(character_accuracy(reference, text), 4)
+        rows.append(row)
+        print(f"📄 {name}: {row['original_tokens_imagen']} → {row['optimizada_tokens_imagen']} tokens ({row['optimizada_detalle']})")
+
+    if not rows:
+        print("❌ El corpus no contiene páginas")
+        return None
+
+    summary = {"paginas": len(rows)}
+    for label in ("original", "optimizada"):
+        summary[f"{label}_tokens_imagen_total"] = sum(r[f"{label}_tokens_imagen"] for r in rows)
+        if api_key:
+            summary[f"{label}_segundos_total"] = round(sum(r[f"{label}_segundos"] for r in rows), 2)
+            summary[f"{label}_prompt_tokens_total"] = sum(r[f"{label}_prompt_tokens"] for r in rows)
+            with_reference = [r for r in rows if f"{label}_precision" in r]
+            if with_reference:
+                summary[f"{label}_precision_media"] = round(
+                    sum(r[f"{label}_precision"] for r in with_reference) / len(with_reference), 4
+                )
+    summary["paginas_detalle_bajo"] = sum(1 for r in rows if r["optimizada_detalle"] == "low")
+    summary["reduccion_tokens_imagen"] = round(
+        1 - summary["optimizada_tokens_imagen_total"] / summary["original_tokens_imagen_total"], 4
+    ) if summary["original_tokens_imagen_total"] else None
+
+    print(f"\n📊 ===== RESUMEN =====")
+    print(f"🖼️ Tokens de imagen: {summary['original_tokens_imagen_total']} → {summary['optimizada_tokens_imagen_total']} "
+          f"(-{summary['reduccion_tokens_imagen']:.1%}), {summary['paginas_detalle_bajo']} páginas en detalle bajo")
+    if api_key:
+        print(f"⏱️ Latencia: {summary['original_segundos_total']}s → {summary['optimizada_segundos_total']}s")
+        if "original_precision_media" in summary and "optimizada_precision_media" in summary:
+            print(f"🎯 Precisión media: {summary['original_precision_media']:.1%} → {summary['optimizada_precision_media']:.1%}")
+
+    return {"resumen": summary, "paginas": rows}
+
+
+def _measure(function, *args):
+    """Ejecuta function(*args) y devuelve (resultado, segundos, pico de memoria Python en MB)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak / (1024 * 1024)
+
+
+def benchmark_docx(corpus_dir, max_pages=None):
+    """Extractor DOCX en streaming vs. modelo de objetos de python-docx"""
+    from modules.document_processor import extract_text_from_docx, extract_text_from_docx_object_model
+
+    print("⏱️ ===== BENCHMARK DOCX: PYTHON-DOCX vs STREAMING =====\n")
+    rows = []
+    for path in sorted(Path(corpus_dir).glob("*.docx"))[:max_pages or None]:
+        content = path.read_bytes()
+        row = {"archivo": path.name, "mb": round(len(content) / (1024 * 1024), 2)}
+        for label, function in (("python_docx", extract_text_from_docx_object_model), ("streaming", extract_text_from_docx)):
+            text, seconds, peak_mb = _measure(function, content)
+            row[f"{label}_segundos"] = round(seconds, 3)
+            row[f"{label}_memoria_pico_mb"] = round(peak_mb, 1)
+            row[f"{label}_caracteres"] = len(text)
+        rows.append(row)
+        print(f"📄 {path.name}: {row['python_docx_segundos']:.2f}s/{row['python_docx_memoria_pico_mb']}MB → "
+              f"{row['streaming_segundos']:.2f}s/{row['streaming_memoria_pico_mb']}MB | "
+              f"{row['python_docx_caracteres']} → {row['streaming_caracteres']} caracteres")
+
+    if not rows:
+        print("❌ El corpus no contiene archivos .docx")
+        return None
+
+    summary = {"archivos": len(rows)}
+    for label in ("python_docx", "streaming"):
+        summary[f"{label}_segundos_total"] = round(sum(r[f"{label}_segundos"] for r in rows), 2)
+        summary[f"{label}_memoria_pico_max_mb"] = max(r[f"{label}_memoria_pico_mb"] for r in rows)
+        summary[f"{label}_caracteres_total"] = sum(r[f"{label}_caracteres"] for r in rows)
+    summary["aceleracion"] = round(
+        summary["python_docx_segundos_total"] / summary["streaming_segundos_total"], 2
+    ) if summary["streaming_segundos_total"] else None
+
+    print(f"\n📊 ===== RESUMEN =====")
+    print(f"⏱️ python-docx: {summary['python_docx_segundos_total']}s | streaming: {summary['streaming_segundos_total']}s (x{summary['aceleracion']})")
+    print(f"🧠 Memoria pico: {summary['python_docx_memoria_pico_max_mb']}MB → {summary['streaming_memoria_pico_max_mb']}MB")
+    print(f"📝 Caracteres (incluye tablas, encabezados y pies): {summary['python_docx_caracteres_total']} → {summary['streaming_caracteres_total']}")
+
+    return {"resumen": summary, "archivos": rows}
+
+
+# Pipeline original de imágenes (archivos temporales), solo como referencia del benchmark
+
+def convert_and_clean_image(image_path: str) -> str:
+    """
+    Convierte la imagen a un formato compatible y retorna la ruta temporal
+    """
+    from PIL import Image
+
+    try:
+        # Abrir imagen con PIL (más robusto que ImageMagick)
+        with Image.open(image_path) as img:
+            # Convertir a RGB si es necesario (elimina transparencias, etc.)
+            if img.mode in ('RGBA', 'LA', 'P'):
+                background = Image.new('RGB', img.size, (255, 255, 255))
+                if img.mode == 'P':
+                    img = img.convert('RGBA')
+                background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
+                img = background
+            elif img.mode != 'RGB':
+                img = img.convert('RGB')
+
+            # Crear archivo temporal con formato PNG (más compatible)
+            temp_dir = tempfile.gettempdir()
+            temp_path = os.path.join(temp_dir, f"cleaned_image_{os.getpid()}.png")
+
+            # Guardar con alta calidad
+            img.save(temp_path, 'PNG', optimize=True, quality=95)
+
+            return temp_path
+
+    except Exception as e:
+        logging.error(f"Error convirtiendo imagen {image_path}: {str(e)}")
+        return image_path  # Retornar original si falla la conversión
+
+
+def extract_text_from_image(image_path: str) -> str:
+    """
+    Extrae texto de una imagen usando OCR con manejo robusto de errores
+    """
+    import pytesseract
+    from PIL import Image
+
+    cleaned_image_path = None
+    try:
+        # Verificar que el archivo existe
+        if not os.path.exists(image_path):
+            logging.error(f"Archivo de imagen no encontrado: {image_path}")
+            return ""
+
+        # Convertir y limpiar imagen primero
+        cleaned_image_path = convert_and_clean_image(image_path)
+
+        # Configuración de Tesseract para mejor reconocimiento
+        custom_config = r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz.,;:!?()[]{}"\'-+=/\\ áéíóúñüÁÉÍÓÚÑÜ'
+
+        # Extraer texto de la imagen limpia
+        with Image.open(cleaned_image_path) as img:
+            text = pytesseract.image_to_string(img, config=custom_config, lang='spa+eng')
+
+        # Limpiar texto
+        text = text.strip()
+        text = '\n'.join(line.strip() for line in text.split('\n') if line.strip())
+
+        logging.info(f"✅ Texto extraído exitosamente de {image_path} ({len(text)} caracteres)")
+        return text
+
+    except Exception as e:
+        logging.error(f"❌ Error extrayendo texto de imagen {image_path}: {str(e)}")
+
+        # Intentar método alternativo con configuración básica
+        try:
+            if cleaned_image_path and os.path.exists(cleaned_image_path):
+                with Image.open(cleaned_image_path) as img:
+                    text = pytesseract.image_to_string(img, lang='spa+eng')
+                    return text.strip()
+        except:
+            pass
+
+        return ""
+
+    finally:
+        # Limpiar archivo temporal si se creó uno nuevo
+        if cleaned_image_path and cleaned_image_path != image_path:
+            try:
+                if os.path.exists(cleaned_image_path):
+                    os.remove(cleaned_image_path)
+            except:
+                pass
+
+
+def extract_text_from_image_with_temp_files(file_content):
+    """Pipeline original de imágenes basado en archivos temporales; referencia del benchmark"""
+    from modules.document_processor import read_source
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp_file:
+        temp_file.write(read_source(file_content))
+        temp_file_path = temp_file.name
+
+    verified_path = verify_and_repair_image(temp_file_path)
+    try:
+        return extract_text_from_image(verified_path)
+    finally:
+        os.remove(temp_file_path)
+        if verified_path != temp_file_path and os.path.exists(verified_path):
+            os.remove(verified_path)
+
+
+def verify_and_repair_image(file_path: str) -> str:
+    """
+    Verifica si una imagen es válida y la repara si es necesario
+    """
+    from PIL import Image
+
+    try:
+        # Verificar extensión
+        file_ext = Path(file_path).suffix.lower()
+
+        # Extensiones soportadas
+        supported_formats = {'.png', '.jpg', '.jpeg', '.tiff', '.tif', '.bmp', '.gif', '.webp'}
+
+        if file_ext not in supported_formats:
+            logging.warning(f"Formato de imagen no soportado: {file_ext}")
+            return file_path
+
+        # Intentar abrir y validar
+        with Image.open(file_path) as img:
+            img.verify()  # Verificar integridad
+
+        # Si llegamos aquí, la imagen es válida
+        return file_path
+
+    except Exception as e:
+        logging.warning(f"Imagen dañada o formato incompatible {file_path}: {str(e)}")
+
+        # Intentar reparar convirtiendo a PNG
+        try:
+            with Image.open(file_path) as img:
+                # Crear nueva imagen limpia
+                temp_path = file_path.replace(Path(file_path).suffix, '_repaired.png')
+
+                if img.mode != 'RGB':
+                    img = img.convert('RGB')
+
+                img.save(temp_path, 'PNG')
+                logging.info(f"✅ Imagen reparada guardada en: {temp_path}")
+                return temp_path
+
+        except Exception as repair_error:
+            logging.error(f"❌ No se pudo reparar la imagen: {repair_error}")
+            return file_path
+
+
+def benchmark_images(corpus_dir, max_pages=None):
+    """Pipeline de imágenes con archivos temporales vs. decodificación única en memoria"""
+    from modules.document_processor import extract_text_from_image_bytes
+
+    print("⏱️ ===== BENCHMARK IMÁGENES: ARCHIVOS TEMPORALES vs MEMORIA =====\n")
+    paths = [p for p in sorted(Path(corpus_dir).iterdir()) if p.suffix.lower() in IMAGE_EXTENSIONS]
+    rows = []
+    for path in paths[:max_pages or None]:
+        content = path.read_bytes()
+        reference_path = path.with_suffix('.txt')
+        reference = reference_path.read_text(encoding='utf-8') if reference_path.exists() else None
+        row = {"imagen": path.name, "mb": round(len(content) / (1024 * 1024), 2)}
+        for label, function in (("temporales", extract_text_from_image_with_temp_files), ("memoria", extract_text_from_image_bytes)):
+            start = time.perf_counter()
+            text = function(content)
+            row[f"{label}_segundos"] = round(time.perf_counter() - start, 3)
+            row[f"{label}_caracteres"] = len(text)
+            if reference is not None:
+                row[f"{label}_precision"] = round(character_accuracy(reference, text), 4)
+        rows.append(row)
+        print(f"📄 {path.name}: {row['temporales_segundos']:.2f}s → {row['memoria_segundos']:.2f}s")
+
+    if not rows:
+        print("❌ El corpus no contiene imágenes")
+        return None
+
+    summary = {"imagenes": len(rows)}
+    for label in ("temporales", "memoria"):
+        total = sum(r[f"{label}_segundos"] for r in rows)
+        summary[f"{label}_segundos_total"] = round(total, 2)
+        summary[f"{label}_imagenes_por_segundo"] = round(len(rows) / total, 2) if total else None
+        with_reference = [r for r in rows if f"{label}_precision" in r]
+        if with_reference:
+            summary[f"{label}_precision_media"] = round(sum(r[f"{label}_precision"] for r in with_reference) / len(with_reference), 4)
+
+    print(f"\n📊 ===== RESUMEN =====")
+    print(f"⚡ Throughput: {summary['temporales_imagenes_por_segundo']} → {summary['memoria_imagenes_por_segundo']} imágenes/s")
+    if "memoria_precision_media" in summary and "temporales_precision_media" in summary:
+        print(f"🎯 Precisión media: {summary['temporales_precision_media']:.1%} → {summary['memoria_precision_media']:.1%}")
+
+    return {"resumen": summary, "imagenes": rows}
+
+
+BENCHMARKS = {
+    "ocr": benchmark_ocr,
+    "motores": benchmark_ocr_engines,
+    "vision": benchmark_vision_images,
+    "docx": benchmark_docx,
+    "imagenes": benchmark_images,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline de extracción de Robot AI")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS), help="Benchmark a ejecutar")
+    parser.add_argument("corpus", help="Carpeta con los archivos de muestra")
+    parser.add_argument("--max-paginas", type=int, default=None, help="Límite de páginas/archivos a evaluar")
+    parser.add_argument("--salida", default=None, help="Ruta del reporte JSON")
+    args = parser.parse_args()
+
+    if not Path(args.corpus).is_dir():
+        print(f"❌ Carpeta de corpus no encontrada: {args.corpus}")
+        sys.exit(1)
+
+    report = BENCHMARKS[args.benchmark](args.corpus, args.max_paginas)
+    if report is None:
+        sys.exit(1)
+
+    output = args.salida or f"benchmark_{args.benchmark}_report.json"
+    report["benchmark"] = args.benchmark
+    report["timestamp"] = datetime.now().isoformat()
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"📄 Reporte: {output}")
+
+
+if __name__ == "__main__":
+    main()
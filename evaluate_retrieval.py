@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+🔎 Evaluación offline de la selección de contexto - Robot AI
+Compara, sin llamar a OpenAI, cuántos tokens recibe cada pregunta y si el contexto
+enviado contiene la respuesta esperada, para las estrategias de selección:
+  - todos:        todos los fragmentos (sin selección)
+  - relevancia:   ChunkSelector (fragmentos con algún término de la pregunta)
+  - bm25:         top-k pasajes BM25 dentro del presupuesto (modules.retrieval)
+
+Corpus: una carpeta con el texto extraído de cada documento y sus respuestas esperadas:
+  - pliego.txt   -> texto completo (p. ej. el texto_completo de /procesar)
+  - pliego.json  -> {"respuestas": {"1": "Alcaldía de ...", "2": "890123456", ...}}
+    (claves = número de pregunta predefinida, 1-10, o el texto de una pregunta)
+
+Uso:
+  python evaluate_retrieval.py carpeta_corpus [--top-k 8] [--max-tokens 2500] [--pasaje-tokens 250]
+"""
+
+import argparse
+import json
+import re
+import sys
+from datetime import datetime
+from pathlib import Path
+
+from modules.text_merge import normalize_text
+
+# Fracción de las palabras de una respuesta larga que debe contener el contexto
+RECALL_MIN_COVERAGE = 0.8
+
+
+def answer_found(answer, context):
+    """
+    True si el contexto contiene la respuesta: igual sin acentos ni puntuación
+    (890.123.456 = 890123456) o, si es larga, con la mayoría de sus palabras.
+    """
+    compact_answer = re.sub(r'[^a-z0-9]', '', normalize_text(answer))
+    compact_context = re.sub(r'[^a-z0-9]', '', normalize_text(context))
+    if compact_answer and compact_answer in compact_context:
+        return True
+    words = {w for w in re.findall(r'[a-z0-9]+', normalize_text(answer)) if len(w) >= 4}
+    if len(words) < 3:
+        return False
+    context_words = set(re.findall(r'[a-z0-9]+', normalize_text(context)))
+    return len(words & context_words) / len(words) >= RECALL_MIN_COVERAGE
+
+
+def load_corpus(corpus_dir, questions):
+    """Genera (nombre, texto, {índice de pregunta: respuesta esperada})"""
+    for path in sorted(Path(corpus_dir).glob('*.txt')):
+        answers_path = path.with_suffix('.json')
+        if not answers_path.exists():
+            print(f"⚠️ {path.name}: sin {answers_path.name}, omitido")
+            continue
+        expected = {}
+        for key, answer in json.loads(answers_path.read_text(encoding='utf-8')).get("respuestas", {}).items():
+            if key.isdigit() and 1 <= int(key) <= len(questions):
+                expected[int(key) - 1] = answer
+            elif key in questions:
+                expected[questions.index(key)] = answer
+            else:
+                print(f"⚠️ {path.name}: pregunta desconocida {key!r}")
+        yield path.name, path.read_text(encoding='utf-8'), expected
+
+
+def select_contexts(strategy, chunks, questions, options):
+    """{índice de pregunta: texto enviado} según la estrategia"""
+    from modules.chunking import ChunkSelector
+    from modules.retrieval import build_retriever
+
+    if strategy == "todos":
+        text = "\n\n".join(chunk["texto"] for chunk in chunks)
+        return {q: text for q in range(len(questions))}
+    if strategy == "relevancia":
+        selector = ChunkSelector(questions, mode='relevancia', max_tokens=0)
+        contexts = {q: [] for q in range(len(questions))}
+        for chunk in chunks:
+            for q in selector.select(chunk):
+                contexts[q].append(chunk["texto"])
+        return {q: "\n\n".join(parts) for q, parts in contexts.items()}
+    retriever = build_retriever(chunks, options["passage_tokens"], top_k=options["top_k"], max_tokens=options["max_tokens"])
+    return {q: retriever.context(retriever.retrieve(question)[0]) for q, question in enumerate(questions)}
+
+
+def evaluate(corpus_dir, questions, options):
+    from modules.chunking import chunk_document
+    from modules.text_merge import estimate_tokens
+
+    strategies = ("todos", "relevancia", "bm25")
+    print("🔎 ===== EVALUACIÓN DE SELECCIÓN DE CONTEXTO =====\n")
+    rows = []
+    for name, text, expected in load_corpus(corpus_dir, questions):
+        chunks = chunk_document(text)
+        row = {"documento": name, "fragmentos": len(chunks), "preguntas": len(expected)}
+        for strategy in strategies:
+            contexts = select_contexts(strategy, chunks, questions, options)
+            found = sum(1 for q, answer in expected.items() if answer_found(answer, contexts[q]))
+            row[f"{strategy}_tokens"] = sum(estimate_tokens(contexts[q]) for q in expected)
+            row[f"{strategy}_encontradas"] = found
+            row[f"{strategy}_faltantes"] = [q + 1 for q, answer in expected.items() if not answer_found(answer, contexts[q])]
+        rows.append(row)
+        print(f"📄 {name}: " + " | ".join(
+            f"{s} {row[f'{s}_encontradas']}/{len(expected)} en {row[f'{s}_tokens']:,} tokens" for s in strategies
+        ))
+
+    if not rows:
+        print("❌ El corpus no contiene documentos con respuestas esperadas")
+        return None
+
+    total_questions = sum(r["preguntas"] for r in rows)
+    summary = {"documentos": len(rows), "preguntas": total_questions, "parametros": options}
+    for strategy in strategies:
+        tokens = sum(r[f"{strategy}_tokens"] for r in rows)
+        found = sum(r[f"{strategy}_encontradas"] for r in rows)
+        summary[strategy] = {
+            "recall": round(found / total_questions, 4) if total_questions else None,
+            "tokens_total": tokens,
+            "tokens_por_pregunta": round(tokens / total_questions) if total_questions else 0
+        }
+    for strategy in ("relevancia", "bm25"):
+        baseline = summary["todos"]["tokens_total"]
+        summary[strategy]["reduccion_tokens"] = round(1 - summary[strategy]["tokens_total"] / baseline, 4) if baseline else None
+
+    print(f"\n📊 ===== RESUMEN =====")
+    print(f"📄 Documentos: {summary['documentos']} | Preguntas con respuesta esperada: {total_questions}")
+    for strategy in strategies:
+        stats = summary[strategy]
+        reduction = f" (-{stats['reduccion_tokens']:.0%} tokens)" if stats.get("reduccion_tokens") is not None else ""
+        print(f"🎯 {strategy}: recall {stats['recall']:.1%}, {stats['tokens_por_pregunta']:,} tokens por pregunta{reduction}")
+
+    return {"resumen": summary, "documentos": rows}
+
+
+def main():
+    from modules.retrieval import RETRIEVAL_TOP_K, RETRIEVAL_MAX_TOKENS, RETRIEVAL_PASSAGE_TOKENS
+
+    parser = argparse.ArgumentParser(description="Evaluación offline de la selección de contexto de Robot AI")
+    parser.add_argument("corpus", help="Carpeta con .txt extraídos y .json de respuestas esperadas")
+    parser.add_argument("--top-k", type=int, default=RETRIEVAL_TOP_K, help="Pasajes por pregunta")
+    parser.add_argument("--max-tokens", type=int, default=RETRIEVAL_MAX_TOKENS, help="Presupuesto de tokens por pregunta")
+    parser.add_argument("--pasaje-tokens", type=int, default=RETRIEVAL_PASSAGE_TOKENS, help="Tamaño de cada pasaje")
+    parser.add_argument("--salida", default="evaluacion_recuperacion_report.json", help="Ruta del reporte JSON")
+    args = parser.parse_args()
+
+    if not Path(args.corpus).is_dir():
+        print(f"❌ Carpeta de corpus no encontrada: {args.corpus}")
+        sys.exit(1)
+
+    from modules.questions import DEFAULT_QUESTIONS
+    options = {"top_k": args.top_k, "max_tokens": args.max_tokens, "passage_tokens": args.pasaje_tokens}
+    report = evaluate(args.corpus, DEFAULT_QUESTIONS, options)
+    if report is None:
+        sys.exit(1)
+
+    report["timestamp"] = datetime.now().isoformat()
+    with open(args.salida, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"📄 Reporte: {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
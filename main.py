@@ -1,7 +1,8 @@
 """
 The `/lista-procesos` endpoint is corrected to handle errors gracefully when listing local and Google Drive processes, ensuring that the endpoint returns a valid response even if some processes fail to load.
 """
-from fastapi import FastAPI, File, UploadFile, HTTPException, status
+from fastapi import FastAPI, File, UploadFile, HTTPException, status, Depends
+from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from fastapi.responses import JSONResponse, HTMLResponse, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 from typing import List
@@ -51,6 +52,28 @@ GOOGLE_CREDENTIALS = get_google_credentials() or ""
 ADMIN_USERNAME = os.getenv("ADMIN_USERNAME", "")
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "")
 
+security_basic = HTTPBasic(auto_error=False)
+
+def verificar_admin(credentials: HTTPBasicCredentials = None):
+    """Valida credenciales de administrador; sin ADMIN_USERNAME/ADMIN_PASSWORD configurados, rechaza"""
+    if not ADMIN_USERNAME or not ADMIN_PASSWORD:
+        print("⚠️ ADMIN_USERNAME/ADMIN_PASSWORD no configurados - operación administrativa rechazada")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Operación administrativa no disponible: credenciales de administrador no configuradas"
+        )
+    import secrets
+    if (
+        credentials is None
+        or not secrets.compare_digest(credentials.username, ADMIN_USERNAME)
+        or not secrets.compare_digest(credentials.password, ADMIN_PASSWORD)
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Credenciales de administrador inválidas",
+            headers={"WWW-Authenticate": "Basic"}
+        )
+
 # Import Replit Object Storage para almacenamiento externo (lazy loading)
 REPLIT_STORAGE_AVAILABLE = False
 ReplitStorageClient = None
@@ -131,6 +154,9 @@ async def api_info():
         "endpoints": {
             "POST /procesar": "Procesa documentos y los analiza con IA",
             "GET /health": "Verifica el estado de la API",
+            "GET /metricas-rendimiento": "Métricas de rendimiento de la extracción",
+            "GET /cache-extraccion": "Estado de la caché de extracción",
+            "DELETE /cache-extraccion": "Purga la caché de extracción (admin)",
             "GET /lista-procesos": "Lista procesos completados",
             "GET /dashboard": "Dashboard principal",
             "GET /panel-filtros": "Panel de gestión"
@@ -233,6 +259,37 @@ async def health_check():
         ]
     }
 
+@app.get("/metricas-rendimiento")
+async def metricas_rendimiento():
+    """Métricas de rendimiento del pipeline de extracción"""
+    try:
+        from modules.document_processor import get_ocr_metrics
+        from modules.extraction_cache import get_extraction_cache_stats
+        from modules.openai_scheduler import get_scheduler_stats, get_rate_limit_stats
+        return {
+            "timestamp": datetime.now().isoformat(),
+            "ocr": get_ocr_metrics(),
+            "cache_extraccion": get_extraction_cache_stats(),
+            "planificador_openai": get_scheduler_stats(),
+            "limites_tasa_openai": get_rate_limit_stats()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error obteniendo métricas: {str(e)}")
+
+@app.get("/cache-extraccion")
+async def estado_cache_extraccion():
+    """Aciertos, fallos y ocupación de la caché de extracción"""
+    from modules.extraction_cache import get_extraction_cache_stats
+    return get_extraction_cache_stats()
+
+@app.delete("/cache-extraccion")
+async def purgar_cache_extraccion(credentials: HTTPBasicCredentials = Depends(security_basic)):
+    """Purga la caché de extracción (requiere credenciales de administrador)"""
+    verificar_admin(credentials)
+    from modules.extraction_cache import purge_extraction_cache
+    eliminadas = purge_extraction_cache()
+    return {"success": True, "entradas_eliminadas": eliminadas}
+
 @app.get("/drive-links")
 async def get_drive_links():
     """Obtiene todos los links directos de Google Drive"""
@@ -512,9 +569,18 @@ async def get_drive_files():
 async def procesar_documentos(
     archivos: List[UploadFile] = File(...),
     preguntas_personalizadas: str = None,
-    carpeta_original: str = None
+    carpeta_original: str = None,
+    modo_analisis: str = None,
+    perfil_extraccion: str = None
 ):
-    """Endpoint principal para procesar documentos"""
+    """
+    Endpoint principal para procesar documentos.
+    modo_analisis: 'recuperacion' (solo los pasajes BM25 más relevantes de cada pregunta),
+    'fragmentos' (cada pregunta sobre cada fragmento relevante) o 'jerarquico' (map-reduce,
+    para conjuntos de cientos de páginas). Por defecto ANALYSIS_MODE ('recuperacion').
+    perfil_extraccion: fija el perfil de los PDF ('solo_nativo', 'ocr', 'ocr_vision_selectiva',
+    'vision_completa'); por defecto cada documento se clasifica automáticamente.
+    """
 
     if not OPENAI_API_KEY:
         raise HTTPException(
@@ -528,31 +594,85 @@ async def procesar_documentos(
             detail="No se enviaron archivos para procesar"
         )
 
+    spool = None
+    tarea_analisis = None
     try:
         print(f"\n🚀 ===== PROCESAMIENTO MODULAR INICIADO =====")
         print(f"📊 Archivos recibidos: {len(archivos)}")
 
         # Lazy loading - Cargar módulos solo cuando se necesiten
         _, process_custom_questions, _ = lazy_import_ai_analyzer()
-        process_file, chunk_text = lazy_import_document_processor()
+        from modules.document_processor import aiter_process_file
+        from modules.chunking import TokenChunker
+        from modules.ai_analyzer import (
+            analyze_questions_streaming, analyze_questions_hierarchical, analyze_questions_retrieval, ANALYSIS_MODE
+        )
+        from modules.upload_spool import UploadSpool, UploadLimitError
+        from modules.document_classifier import EXTRACTION_PROFILES
+        import asyncio
+
+        modo_analisis = (modo_analisis or ANALYSIS_MODE).lower()
+        if modo_analisis not in ("fragmentos", "jerarquico", "recuperacion"):
+            raise HTTPException(status_code=400, detail="modo_analisis debe ser 'fragmentos', 'jerarquico' o 'recuperacion'")
+        print(f"🧠 Modo de análisis: {modo_analisis}")
+        if perfil_extraccion and perfil_extraccion not in EXTRACTION_PROFILES:
+            raise HTTPException(status_code=400, detail=f"perfil_extraccion debe ser uno de: {', '.join(EXTRACTION_PROFILES)}")
+
+        # Copiar las subidas a disco por bloques, con límites por archivo y por solicitud:
+        # la extracción y la copia a Drive leen desde disco, no desde memoria
+        spool = UploadSpool()
+        subidas = []
+        try:
+            for archivo in archivos:
+                subidas.append(await spool.add(archivo))
+        except UploadLimitError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        print(f"📥 Archivos en disco: {spool.total_bytes/1024/1024:.1f} MB en {spool.directory}")
 
         # Procesar preguntas personalizadas
         preguntas_finales = process_custom_questions(preguntas_personalizadas)
         print(f"❓ Preguntas a analizar: {len(preguntas_finales)}")
 
-        # FASE 1: Extraer texto de archivos
-        print(f"\n📁 ===== FASE 1: EXTRACCIÓN DE TEXTO =====")
+        # FASES 1-3 EN PIPELINE: extracción por páginas → fragmentación → análisis.
+        # Cada fragmento se analiza apenas se llena, mientras siguen extrayéndose páginas.
+        print(f"\n📁 ===== FASE 1: EXTRACCIÓN DE TEXTO (pipeline con fragmentación y análisis) =====")
         texto_completo = ""
         archivos_procesados = []
         errores = []
+        inicio_pipeline = time.perf_counter()
+
+        cola_fragmentos = asyncio.Queue()
+        chunker = TokenChunker()
+        fragmentos = []
+
+        def encolar_fragmentos(nuevos):
+            for fragmento in nuevos:
+                fragmentos.append(fragmento)
+                cola_fragmentos.put_nowait(fragmento)
+
+        async def flujo_fragmentos():
+            while True:
+                fragmento = await cola_fragmentos.get()
+                if fragmento is None:
+                    return
+                yield fragmento
+
+        # Cada modo arma su propia selección: ChunkSelector (fragmentos, jerarquico) o BM25 (recuperacion)
+        analizar = {
+            "jerarquico": analyze_questions_hierarchical,
+            "recuperacion": analyze_questions_retrieval
+        }.get(modo_analisis, analyze_questions_streaming)
+        tarea_analisis = asyncio.create_task(
+            analizar(flujo_fragmentos(), preguntas_finales, OPENAI_API_KEY)
+        )
 
         for i, archivo in enumerate(archivos, 1):
             print(f"\n📄 [{i}/{len(archivos)}] Procesando: {archivo.filename}")
             print(f"   📋 Tipo de archivo: {archivo.content_type}")
 
             try:
-                contenido = await archivo.read()
-                print(f"   💾 Tamaño: {len(contenido)/1024:.1f} KB ({len(contenido):,} bytes)")
+                subida = subidas[i-1]
+                print(f"   💾 Tamaño: {subida['tamaño']/1024:.1f} KB ({subida['tamaño']:,} bytes)")
 
                 # FORZAR uso de OCR y Vision AI para documentos críticos
                 if not OPENAI_API_KEY:
@@ -560,12 +680,23 @@ async def procesar_documentos(
                 else:
                     print(f"   🤖 Vision AI habilitado para máxima extracción")
 
-                texto_extraido = process_file(
-                    contenido, 
-                    archivo.content_type, 
-                    archivo.filename, 
-                    OPENAI_API_KEY
-                )
+                estadisticas_extraccion = {}
+                partes = []
+                async for parte in aiter_process_file(
+                    subida["ruta"],
+                    archivo.content_type,
+                    archivo.filename,
+                    OPENAI_API_KEY,
+                    estadisticas_extraccion,
+                    perfil_extraccion
+                ):
+                    # El encabezado va con la primera parte: así nunca queda solo en un fragmento
+                    encabezado = "" if partes else f"\n\n=== DOCUMENTO: {archivo.filename} ===\n\n"
+                    partes.append(parte)
+                    encolar_fragmentos(chunker.add(encabezado + parte))
+                if partes:
+                    encolar_fragmentos(chunker.add("\n\n"))
+                texto_extraido = "".join(partes)
 
                 print(f"   📊 Texto extraído: {len(texto_extraido) if texto_extraido else 0:,} caracteres")
 
@@ -575,10 +706,11 @@ async def procesar_documentos(
                     archivos_procesados.append({
                         "nombre": archivo.filename,
                         "tipo": archivo.content_type,
-                        "tamaño": len(contenido),
+                        "tamaño": subida["tamaño"],
                         "caracteres_extraidos": len(texto_extraido),
                         "procesado": True,
-                        "metodo_extraccion": "OCR+Vision AI" if OPENAI_API_KEY else "Básico"
+                        "metodo_extraccion": "OCR+Vision AI" if OPENAI_API_KEY else "Básico",
+                        "estadisticas_extraccion": estadisticas_extraccion
                     })
                 else:
                     error_msg = f"❌ FALLO: No se extrajo texto válido de {archivo.filename}"
@@ -588,10 +720,11 @@ async def procesar_documentos(
                     archivos_procesados.append({
                         "nombre": archivo.filename,
                         "tipo": archivo.content_type,
-                        "tamaño": len(contenido),
+                        "tamaño": subida["tamaño"],
                         "caracteres_extraidos": 0,
                         "procesado": False,
-                        "error": "Sin texto extraído"
+                        "error": "Sin texto extraído",
+                        "estadisticas_extraccion": estadisticas_extraccion
                     })
 
             except Exception as e:
@@ -608,9 +741,11 @@ async def procesar_documentos(
                 })
 
         archivos_exitosos = [a for a in archivos_procesados if a["procesado"]]
+        tiempo_extraccion = time.perf_counter() - inicio_pipeline
         print(f"\n📊 ===== RESUMEN EXTRACCIÓN =====")
         print(f"✅ Archivos exitosos: {len(archivos_exitosos)}/{len(archivos)}")
         print(f"📝 Caracteres totales: {len(texto_completo):,}")
+        print(f"⏱️ Extracción completada en {tiempo_extraccion:.1f} segundos")
 
         if not texto_completo.strip():
             raise HTTPException(
@@ -618,28 +753,21 @@ async def procesar_documentos(
                 detail="No se pudo extraer texto de ningún archivo"
             )
 
-        # FASE 2: Fragmentar texto
+        # FASE 2: Fragmentación (los fragmentos completos ya están en análisis)
         print(f"\n🔪 ===== FASE 2: FRAGMENTACIÓN =====")
-        fragmentos = chunk_text(texto_completo, max_words=3000)
-        print(f"📋 Fragmentos creados: {len(fragmentos)}")
+        encolar_fragmentos(chunker.finish())
+        cola_fragmentos.put_nowait(None)
+        print(f"📋 Fragmentos creados: {len(fragmentos)} ({sum(f['tokens'] for f in fragmentos):,} tokens estimados)")
 
-        # FASE 3: Análisis con IA - PARALELO OPTIMIZADO
+        # FASE 3: Análisis con IA - en curso desde el primer fragmento
         print(f"\n🚀 ===== FASE 3: ANÁLISIS PARALELO CON IA =====")
+        print(f"⚡ Esperando las {len(preguntas_finales)} preguntas sobre los últimos fragmentos...")
+        resultados_paralelos = await tarea_analisis
 
-        # Importar función paralela
-        from modules.ai_analyzer import analyze_questions_parallel
-
-        # Ejecutar análisis paralelo
-        print(f"⚡ Procesando {len(preguntas_finales)} preguntas en paralelo...")
-        inicio_analisis = datetime.now()
-
-        # Usar asyncio para el análisis paralelo
-        import asyncio
-        resultados_paralelos = await analyze_questions_parallel(fragmentos, preguntas_finales, OPENAI_API_KEY)
-
-        fin_analisis = datetime.now()
-        tiempo_analisis = (fin_analisis - inicio_analisis).total_seconds()
-        print(f"⏱️ Análisis completado en {tiempo_analisis:.1f} segundos")
+        tiempo_total_pipeline = time.perf_counter() - inicio_pipeline
+        tiempo_analisis = tiempo_total_pipeline - tiempo_extraccion
+        print(f"⏱️ Análisis completado {tiempo_analisis:.1f} segundos después de la extracción "
+              f"(total pipeline: {tiempo_total_pipeline:.1f}s)")
 
         # Procesar resultados
         resultados = []
@@ -727,6 +855,16 @@ async def procesar_documentos(
                 "hash_contenido": hash(texto_completo[:1000]) if texto_completo else None,
                 "calidad_extraccion": calidad_extraccion,
                 "vision_ai_usado": bool(OPENAI_API_KEY),
+                "modo_analisis": modo_analisis,
+                "filtro_paginas": resumir_filtro_paginas(archivos_procesados),
+                "perfiles_extraccion": {
+                    archivo["nombre"]: {
+                        "tipo": archivo["estadisticas_extraccion"]["clasificacion"]["tipo"],
+                        "perfil": archivo["estadisticas_extraccion"]["clasificacion"]["perfil"]
+                    }
+                    for archivo in archivos_procesados
+                    if (archivo.get("estadisticas_extraccion") or {}).get("clasificacion")
+                },
                 "metodo_procesamiento": "Vision AI + OCR" if OPENAI_API_KEY else "Básico"
             },
             "resumen": {
@@ -734,6 +872,18 @@ async def procesar_documentos(
                 "archivos_procesados_exitosamente": len(archivos_exitosos),
                 "caracteres_totales_extraidos": len(texto_completo),
                 "fragmentos_de_texto": len(fragmentos),
+                "fragmentos_detalle": [
+                    {
+                        "indice": f["indice"],
+                        "documento": f["documento"],
+                        "pagina_inicio": f["pagina_inicio"],
+                        "pagina_fin": f["pagina_fin"],
+                        "caracter_inicio": f["caracter_inicio"],
+                        "caracter_fin": f["caracter_fin"],
+                        "tokens": f["tokens"]
+                    }
+                    for f in fragmentos
+                ],
                 "preguntas_analizadas": len(resultados),
                 "respuestas_con_informacion": len(respuestas_con_info),
                 "tasa_exito_procesamiento": round((len(archivos_exitosos) / len(archivos)) * 100, 1) if len(archivos) > 0 else 0
@@ -743,7 +893,8 @@ async def procesar_documentos(
                 "tokens_totales_usados": tokens_totales_proceso,
                 "modelo_utilizado": "gpt-4o-mini",
                 "costo_promedio_por_pregunta": round(costo_total_proceso / len(resultados) if len(resultados) > 0 else 0, 4),
-                "costo_por_archivo_procesado": round(costo_total_proceso / len(archivos_exitosos) if len(archivos_exitosos) > 0 else 0, 4)
+                "costo_por_archivo_procesado": round(costo_total_proceso / len(archivos_exitosos) if len(archivos_exitosos) > 0 else 0, 4),
+                "vision_ai": resumir_vision_ai(archivos_procesados)
             },
             "datos_financieros": {
                 "valores_detectados": valores_detectados,
@@ -756,6 +907,11 @@ async def procesar_documentos(
                 "errores_criticos": len(errores),
                 "requiere_revision": calidad_extraccion == "BAJA" or len(errores) > 0
             },
+            "rendimiento_pipeline": {
+                "segundos_extraccion": round(tiempo_extraccion, 2),
+                "segundos_analisis_tras_extraccion": round(tiempo_analisis, 2),
+                "segundos_totales": round(tiempo_total_pipeline, 2)
+            },
             "archivos": archivos_procesados,
             "errores": errores,
             "analisis": resultados,
@@ -847,20 +1003,16 @@ async def procesar_documentos(
                     print(f"📁 Subiendo archivos originales a Drive empresarial...")
                     archivos_originales_subidos = []
                     
-                    for i, archivo in enumerate(archivos, 1):
+                    for i, (archivo, subida) in enumerate(zip(archivos, subidas), 1):
                         try:
                             print(f"📄 [{i}/{len(archivos)}] Subiendo original: {archivo.filename}")
                             
-                            # Obtener contenido del archivo original
-                            await archivo.seek(0)  # Resetear posición del archivo
-                            contenido_original = await archivo.read()
-                            
-                            # Subir archivo original a Drive empresarial
-                            original_result = drive_client.upload_from_content(
-                                contenido_original,
+                            # Subir archivo original a Drive empresarial en streaming desde disco
+                            original_result = drive_client.upload_file(
+                                os.fspath(subida["ruta"]),
                                 archivo.filename,
                                 empresa_process_folder_id,
-                                archivo.content_type
+                                mime_type=archivo.content_type
                             )
                             
                             if original_result:
@@ -869,7 +1021,7 @@ async def procesar_documentos(
                                     'tipo': archivo.content_type,
                                     'drive_id': original_result['id'],
                                     'drive_link': original_result['web_view_link'],
-                                    'tamaño': len(contenido_original)
+                                    'tamaño': subida["tamaño"]
                                 })
                                 print(f"   ✅ Original subido: {archivo.filename}")
                             else:
@@ -964,6 +1116,14 @@ async def procesar_documentos(
             status_code=500,
             detail=f"Error interno del servidor: {str(e)}"
         )
+    finally:
+        # Si el análisis no terminó (error, sin texto o cliente desconectado) se cancela
+        # y se espera, para no dejar llamadas a OpenAI en curso sin respuesta
+        if tarea_analisis is not None and not tarea_analisis.done():
+            tarea_analisis.cancel()
+            await asyncio.gather(tarea_analisis, return_exceptions=True)
+        if spool is not None:
+            spool.cleanup()
 
 # Función de inicialización del cliente Google Drive
 
@@ -1012,6 +1172,65 @@ def detectar_carpeta_original(archivos):
     print(f"⚠️ Usando fallback: {carpeta_fallback}")
     return carpeta_fallback
 
+def resumir_vision_ai(archivos_procesados):
+    """Agrega llamadas, costos y aciertos de caché de Vision AI de todos los archivos"""
+    resumen = {
+        "llamadas": 0,
+        "tokens_usados": 0,
+        "costo_usd": 0.0,
+        "cache_aciertos_exactos": 0,
+        "cache_aciertos_perceptuales": 0,
+        "cache_fallos": 0,
+        "usd_ahorrados_cache": 0.0,
+        "lotes": 0,
+        "llamadas_ahorradas_lote": 0,
+        "lotes_fallidos": 0,
+        "tokens_duplicados_eliminados": 0,
+        "llamadas_evitadas_tablas": 0,
+        "segundos_extraccion_tablas": 0.0
+    }
+    for archivo in archivos_procesados:
+        estadisticas = archivo.get("estadisticas_extraccion") or {}
+        vision = estadisticas.get("vision_ai") or {}
+        if estadisticas.get("cache_extraccion") == "acierto":
+            # Archivo completo servido desde caché: el costo de Vision AI no se volvió a pagar
+            resumen["usd_ahorrados_cache"] += vision.get("costo_usd", 0.0) + vision.get("usd_ahorrados_cache", 0.0)
+            continue
+        resumen["llamadas"] += vision.get("llamadas", 0)
+        resumen["tokens_usados"] += vision.get("prompt_tokens", 0) + vision.get("completion_tokens", 0)
+        resumen["costo_usd"] += vision.get("costo_usd", 0.0)
+        resumen["cache_aciertos_exactos"] += vision.get("cache_aciertos_exactos", 0)
+        resumen["cache_aciertos_perceptuales"] += vision.get("cache_aciertos_perceptuales", 0)
+        resumen["cache_fallos"] += vision.get("cache_fallos", 0)
+        resumen["usd_ahorrados_cache"] += vision.get("usd_ahorrados_cache", 0.0)
+        for clave in ("lotes", "llamadas_ahorradas_lote", "lotes_fallidos"):
+            resumen[clave] += vision.get(clave, 0)
+        resumen["tokens_duplicados_eliminados"] += (estadisticas.get("fusion_ocr_vision") or {}).get("tokens_eliminados", 0)
+        tablas = estadisticas.get("tablas") or {}
+        resumen["llamadas_evitadas_tablas"] += tablas.get("llamadas_vision_evitadas", 0)
+        resumen["segundos_extraccion_tablas"] += tablas.get("segundos_totales", 0.0)
+
+    consultas_cache = resumen["cache_aciertos_exactos"] + resumen["cache_aciertos_perceptuales"] + resumen["cache_fallos"]
+    resumen["tasa_aciertos_cache"] = round(
+        (resumen["cache_aciertos_exactos"] + resumen["cache_aciertos_perceptuales"]) / consultas_cache, 3
+    ) if consultas_cache else 0.0
+    resumen["costo_usd"] = round(resumen["costo_usd"], 4)
+    resumen["usd_ahorrados_cache"] = round(resumen["usd_ahorrados_cache"], 4)
+    resumen["segundos_extraccion_tablas"] = round(resumen["segundos_extraccion_tablas"], 3)
+    return resumen
+
+def resumir_filtro_paginas(archivos_procesados):
+    """Agrega las páginas omitidas por el prefiltro (en blanco / duplicadas) y el tiempo ahorrado"""
+    resumen = {"paginas_omitidas": 0, "paginas_en_blanco": 0, "paginas_duplicadas": 0, "segundos_ahorrados_estimados": 0.0}
+    for archivo in archivos_procesados:
+        filtro = (archivo.get("estadisticas_extraccion") or {}).get("filtro_paginas") or {}
+        resumen["paginas_en_blanco"] += filtro.get("paginas_en_blanco", 0)
+        resumen["paginas_duplicadas"] += filtro.get("paginas_duplicadas", 0)
+        resumen["segundos_ahorrados_estimados"] += filtro.get("segundos_ahorrados_estimados", 0.0)
+    resumen["paginas_omitidas"] = resumen["paginas_en_blanco"] + resumen["paginas_duplicadas"]
+    resumen["segundos_ahorrados_estimados"] = round(resumen["segundos_ahorrados_estimados"], 2)
+    return resumen
+
 # ===================== ENDPOINTS DE PÁGINAS =====================
 
 @app.get("/dashboard", response_class=HTMLResponse)
@@ -6,369 +6,601 @@ Maneja las consultas a OpenAI y el análisis de preguntas con procesamiento para
 import asyncio
 import json
 import time
-from concurrent.futures import ThreadPoolExecutor
-from datetime import datetime, timedelta
 from typing import List, Dict, Any
 import openai
-from openai import OpenAI
-import random
-import threading
 import os
 
 # Precios de GPT-4o-mini (por 1M tokens)
 PRECIO_INPUT_POR_1M_TOKENS = 5.0
 PRECIO_OUTPUT_POR_1M_TOKENS = 15.0
 
-# Preguntas DEFAULT del sistema Robot AI (optimizadas para máxima precisión)
-DEFAULT_QUESTIONS = [
-    "¿Cuál es el nombre oficial de la entidad contratante o institución que está comprando o contratando? Responde ÚNICAMENTE con el nombre de la organización, sin frases como 'El nombre oficial es' o explicaciones adicionales. No incluyas ciudades, direcciones ni ubicaciones geográficas.",
-    "¿Cuál es el número de NIT o identificación tributaria de la entidad contratante? Responde ÚNICAMENTE con los números del NIT, sin frases como 'El NIT es' o explicaciones adicionales. Sin espacios ni caracteres especiales.",
-    "¿Cuál es la dirección física completa de la entidad contratante? Responde ÚNICAMENTE con la dirección postal, sin frases como 'La dirección es' o explicaciones adicionales. No incluyas nombres de entidades.",
-    "¿En qué ciudad está ubicada la entidad contratante? Responde ÚNICAMENTE con el nombre de la ciudad, sin frases como 'La ciudad es' o explicaciones adicionales.",
-    "¿Cuál es el objeto específico del contrato, licitación o proceso de compra? Responde ÚNICAMENTE con la descripción del objeto, sin frases como 'El objeto es' o explicaciones adicionales.",
-    "¿Cuál es el valor total del contrato, presupuesto o monto estimado? Responde ÚNICAMENTE con la cifra numérica y su moneda, sin frases como 'El valor es' o explicaciones adicionales.",
-    "¿Qué requisitos de experiencia específica se mencionan para los proponentes o contratistas? Responde ÚNICAMENTE con los requisitos, sin frases introductorias o explicaciones adicionales.",
-    "¿Qué requisitos se mencionan sobre afiliación a salud, pensión o seguridad social? Responde ÚNICAMENTE con los requisitos, sin frases introductorias o explicaciones adicionales.",
-    "¿Qué documentos anexos, formatos específicos o certificados se requieren entregar? Responde ÚNICAMENTE con la lista de documentos, sin frases introductorias o explicaciones adicionales.",
-    "¿Cuál es el cronograma detallado del proceso? Responde ÚNICAMENTE con las fechas, horarios y actividades tal como aparecen en el documento, sin frases introductorias o explicaciones adicionales."
-]
-
-# Configuración de OpenAI
-openai.api_key = os.getenv('OPENAI_API_KEY')
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-
-# Configuración para rate limiting
-MAX_RETRIES = 5
-BASE_DELAY = 1.0
-MAX_DELAY = 60.0
-
-# Control inteligente de rate limiting
-class RateLimitManager:
-    def __init__(self):
-        self.requests_per_minute = 0
-        self.tokens_per_minute = 0
-        self.last_reset = datetime.now()
-        self.request_times = []
-        self.token_usage = []
-
-        # Límites conservadores para gpt-4o-mini (Tier 1)
-        self.MAX_REQUESTS_PER_MINUTE = 500  # Límite real es 3000, usamos margen
-        self.MAX_TOKENS_PER_MINUTE = 150000  # Límite real es 200K, usamos margen
-        self.PAUSE_THRESHOLD_REQUESTS = 450  # Pausar cuando lleguemos a 450 requests
-        self.PAUSE_THRESHOLD_TOKENS = 130000  # Pausar cuando lleguemos a 130K tokens
-
-    def should_pause(self):
-        """Determina si debemos hacer una pausa antes de la siguiente request"""
-        now = datetime.now()
-
-        # Limpiar requests y tokens de hace más de 1 minuto
-        self._cleanup_old_data(now)
+# Preguntas DEFAULT del sistema Robot AI (modules/questions, sin dependencias)
+from modules.questions import DEFAULT_QUESTIONS
 
-        current_requests = len(self.request_times)
-        current_tokens = sum(self.token_usage)
-
-        print(f"📊 Rate limit actual: {current_requests}/{self.MAX_REQUESTS_PER_MINUTE} requests, {current_tokens}/{self.MAX_TOKENS_PER_MINUTE} tokens")
+# Configuración de OpenAI: cliente compartido que pasa por el planificador global de llamadas
+from modules.openai_scheduler import get_openai_scheduler
+openai.api_key = os.getenv('OPENAI_API_KEY')
+client = get_openai_scheduler().async_client(os.getenv('OPENAI_API_KEY'))
 
-        # Verificar si estamos cerca de los límites
-        if current_requests >= self.PAUSE_THRESHOLD_REQUESTS:
-            print(f"⚠️ Cerca del límite de requests ({current_requests}/{self.MAX_REQUESTS_PER_MINUTE})")
-            return True, "requests"
+# Extracción estructurada: cada fragmento se envía una sola vez con todas las preguntas
+# predefinidas y respuesta JSON restringida por esquema; las preguntas personalizadas
+# (texto libre) siguen por la ruta de una consulta por pregunta
+STRUCTURED_EXTRACTION = os.getenv('STRUCTURED_EXTRACTION', 'true').lower() not in ('0', 'false', 'no')
+STRUCTURED_MAX_TOKENS = int(os.getenv('STRUCTURED_MAX_TOKENS', '2000'))
+STRUCTURED_NOT_FOUND = "NO_ENCONTRADO"
 
-        if current_tokens >= self.PAUSE_THRESHOLD_TOKENS:
-            print(f"⚠️ Cerca del límite de tokens ({current_tokens}/{self.MAX_TOKENS_PER_MINUTE})")
-            return True, "tokens"
+# El control de tasa (solicitudes y tokens por minuto) y los reintentos los hace el
+# planificador global (modules/openai_scheduler y modules/rate_limiter), que se ajusta
+# con las cabeceras de OpenAI
 
-        return False, None
+async def call_openai_with_retry(messages: list, max_tokens: int = 500) -> dict:
+    """
+    Llama a OpenAI a través del planificador, que reintenta los rate limits, timeouts y
+    errores 5xx pasando cada intento por el limitador de tasa.
+    """
+    try:
+        print(f"🤖 Llamada a OpenAI...")
+        response = await client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=0.3,
+            timeout=30.0  # Timeout de 30 segundos
+        )
+        return {
+            'success': True,
+            'response': response
+        }
 
-    def _cleanup_old_data(self, now):
-        """Limpia datos de hace más de 1 minuto"""
-        one_minute_ago = now - timedelta(minutes=1)
+    except Exception as e:
+        if isinstance(e, openai.RateLimitError):
+            error_type, message = 'rate_limit', 'Rate limit'
+        elif isinstance(e, openai.APITimeoutError):
+            error_type, message = 'timeout', 'Timeout'
+        else:
+            error_type, message = 'unknown', 'Error'
+        attempts = getattr(e, 'intentos', 1)
+        print(f"❌ {message} después de {attempts} intentos: {str(e)}")
+        return {
+            'success': False,
+            'error': f'{message} después de {attempts} intentos: {str(e)}',
+            'error_type': error_type,
+            'attempt': attempts
+        }
 
-        # Filtrar requests antiguos
-        self.request_times = [t for t in self.request_times if t > one_minute_ago]
+async def analyze_chunk_for_question(client, chunk, question):
+    """
+    Consulta una pregunta sobre un fragmento.
+    Devuelve (respuesta válida o None, tokens usados, costo estimado).
+    """
+    # 🚀 OPTIMIZACIÓN 2: Prompt compacto y eficiente
+    prompt = get_optimized_prompt_template(question).format(chunk=chunk_text_of(chunk), question=question)
 
-        # Como token_usage corresponde 1:1 con request_times, mantener la misma longitud
-        if len(self.token_usage) > len(self.request_times):
-            self.token_usage = self.token_usage[-len(self.request_times):]
+    try:
+        print(f"         🤖 Consultando GPT-4o-mini con contexto mejorado...")
+
+        response = await client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=600,
+            temperature=0.0,
+            timeout=45
+        )
+
+        tokens_usados = 0
+        costo = 0.0
+        if hasattr(response, 'usage') and response.usage:
+            prompt_tokens = response.usage.prompt_tokens or 0
+            completion_tokens = response.usage.completion_tokens or 0
+            tokens_usados = response.usage.total_tokens or 0
+
+            input_cost = (prompt_tokens / 1_000_000) * PRECIO_INPUT_POR_1M_TOKENS
+            output_cost = (completion_tokens / 1_000_000) * PRECIO_OUTPUT_POR_1M_TOKENS
+            costo = input_cost + output_cost
+
+            print(f"         💰 Tokens: entrada={prompt_tokens}, salida={completion_tokens}, total={tokens_usados}")
+            print(f"         💸 Costo estimado: ${costo:.4f}")
+        else:
+            print("         💰 Tokens: No se pudo calcular el uso de tokens")
 
-    def record_request(self, tokens_used=0):
-        """Registra una nueva request con su uso de tokens"""
-        now = datetime.now()
-        self.request_times.append(now)
-        self.token_usage.append(tokens_used)
+        answer = response.choices[0].message.content.strip()
+        print(f"         📝 Respuesta: {answer[:80]}{'...' if len(answer) > 80 else ''}")
+        return (answer if is_valid_answer(answer) else None), tokens_usados, costo
 
-        # Mantener solo el último minuto de datos
-        self._cleanup_old_data(now)
+    except Exception as e:
+        print(f"         ❌ Error en fragmento: {str(e)}")
+        return None, 0, 0.0
 
-    def calculate_pause_time(self, limit_type):
-        """Calcula cuánto tiempo pausar basado en el tipo de límite"""
-        now = datetime.now()
+def is_valid_answer(answer):
+    """Descarta respuestas vacías, muy cortas o que indican que no se encontró la información"""
+    if not answer or len(answer.strip()) <= 3:
+        print(f"         ❌ Respuesta muy corta o vacía")
+        return False
 
-        if limit_type == "requests":
-            # Encontrar la request más antigua dentro del minuto actual
-            if self.request_times:
-                oldest_request = min(self.request_times)
-                time_until_reset = 60 - (now - oldest_request).total_seconds()
-                return max(time_until_reset + 5, 10)  # Mínimo 10 segundos de buffer
+    # Validación básica menos restrictiva
+    respuestas_invalidas = [
+        "no encontrado", "no se encontró", "no aparece", "no está disponible",
+        "no mencionado", "no especificado", "sin información", STRUCTURED_NOT_FOUND.lower()
+    ]
 
-        elif limit_type == "tokens":
-            # Para tokens, hacer una pausa más conservadora
-            return 30  # Pausa fija de 30 segundos
+    # Solo rechazar si la respuesta es claramente inválida
+    if any(invalida in answer.lower() for invalida in respuestas_invalidas):
+        print(f"         ⚠️ Respuesta indica que no se encontró información")
+        return False
+    return True
 
-        return 15  # Pausa por defecto
+def structured_question_indexes(questions):
+    """Preguntas que van por la extracción estructurada: las predefinidas del sistema"""
+    if not STRUCTURED_EXTRACTION:
+        return set()
+    defaults = set(DEFAULT_QUESTIONS)
+    return {q for q, question in enumerate(questions) if question in defaults}
 
-# Instancia global del gestor de rate limiting
-rate_limit_manager = RateLimitManager()
+def build_answers_schema(question_indexes):
+    """Esquema JSON estricto: un campo de texto por pregunta (p<n>)"""
+    fields = [f"p{q + 1}" for q in question_indexes]
+    return {
+        "type": "object",
+        "properties": {field: {"type": "string"} for field in fields},
+        "required": fields,
+        "additionalProperties": False
+    }
 
-async def wait_for_rate_limit(error_message: str, attempt: int) -> float:
+async def analyze_chunk_structured(client, chunk, questions, question_indexes):
     """
-    Calcula el tiempo de espera basado en el error de rate limit
+    Consulta varias preguntas sobre un fragmento en una sola llamada, con respuesta
+    JSON restringida por esquema (un campo por pregunta, STRUCTURED_NOT_FOUND si no está).
+    Devuelve ({índice de pregunta: respuesta válida o None}, tokens usados, costo estimado);
+    si la respuesta no es un JSON válido, consulta cada pregunta por separado.
     """
-    try:
-        # Extraer tiempo de espera del mensaje de error si está disponible
-        if "Please try again in" in error_message:
-            # Buscar patrón como "Please try again in 11.087s"
-            import re
-            match = re.search(r'try again in ([\d.]+)s', error_message)
-            if match:
-                suggested_wait = float(match.group(1))
-                # Agregar un poco de buffer adicional
-                return min(suggested_wait + random.uniform(1.0, 3.0), MAX_DELAY)
-    except:
-        pass
-
-    # Fallback: exponential backoff con jitter
-    delay = min(BASE_DELAY * (2 ** attempt) + random.uniform(0.1, 1.0), MAX_DELAY)
-    return delay
+    questions_text = "\n".join(f"p{q + 1}: {questions[q]}" for q in question_indexes)
+    prompt = f"""Eres un asistente experto en contratos y documentos públicos colombianos.
 
-async def call_openai_with_retry(messages: list, max_tokens: int = 500) -> dict:
-    """
-    Llama a OpenAI con manejo automático de rate limits y reintentos
-    """
-    # 🚀 PAUSA INTELIGENTE: Verificar si debemos pausar antes de hacer la request
-    should_pause, limit_type = rate_limit_manager.should_pause()
-    if should_pause:
-        pause_time = rate_limit_manager.calculate_pause_time(limit_type)
-        print(f"🛑 PAUSA INTELIGENTE: Límite de {limit_type} alcanzado")
-        print(f"⏱️ Pausando {pause_time:.1f} segundos para evitar rate limit...")
-        await asyncio.sleep(pause_time)
-        print(f"✅ Pausa completada, reanudando procesamiento...")
-
-    for attempt in range(MAX_RETRIES):
-        try:
-            print(f"🤖 Intento {attempt + 1}/{MAX_RETRIES} - Llamada a OpenAI...")
+INSTRUCCIONES:
+- Responde cada pregunta únicamente con base en el DOCUMENTO, sin agregar información externa.
+- Respeta el formato de respuesta que pide cada pregunta.
+- Si la información de una pregunta no está en el documento, usa exactamente: {STRUCTURED_NOT_FOUND}
+- Devuelve un objeto JSON con un campo por pregunta (p1, p2, ...).
 
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=messages,
-                max_tokens=max_tokens,
-                temperature=0.3,
-                timeout=30.0  # Timeout de 30 segundos
-            )
+PREGUNTAS:
+{questions_text}
 
-            # 📊 Registrar la request en el rate limit manager
-            tokens_used = response.usage.total_tokens if hasattr(response, 'usage') and response.usage else 0
-            rate_limit_manager.record_request(tokens_used)
+DOCUMENTO:
+{chunk_text_of(chunk)}"""
 
-            return {
-                'success': True,
-                'response': response,
-                'attempt': attempt + 1
+    tokens_usados, costo = 0, 0.0
+    try:
+        print(f"         🤖 Consulta estructurada: {len(question_indexes)} preguntas en una llamada...")
+        response = await client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=STRUCTURED_MAX_TOKENS,
+            temperature=0.0,
+            timeout=60,
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": "respuestas", "strict": True, "schema": build_answers_schema(question_indexes)}
             }
+        )
+        if getattr(response, 'usage', None):
+            prompt_tokens = response.usage.prompt_tokens or 0
+            completion_tokens = response.usage.completion_tokens or 0
+            tokens_usados = response.usage.total_tokens or 0
+            costo = (prompt_tokens / 1_000_000) * PRECIO_INPUT_POR_1M_TOKENS + (completion_tokens / 1_000_000) * PRECIO_OUTPUT_POR_1M_TOKENS
+            print(f"         💰 Tokens: entrada={prompt_tokens}, salida={completion_tokens}, total={tokens_usados}")
+        data = json.loads(response.choices[0].message.content)
+        answers = {}
+        for q in question_indexes:
+            answer = str(data.get(f"p{q + 1}", "")).strip()
+            answers[q] = answer if is_valid_answer(answer) else None
+        print(f"         📝 Respuestas con información: {sum(1 for a in answers.values() if a)}/{len(question_indexes)}")
+        return answers, tokens_usados, costo
+    except Exception as e:
+        print(f"         ⚠️ Consulta estructurada falló ({str(e)}) - consultando pregunta por pregunta")
+
+    answers = {}
+    results = await asyncio.gather(*(analyze_chunk_for_question(client, chunk, questions[q]) for q in question_indexes))
+    for q, (answer, tokens, cost) in zip(question_indexes, results):
+        answers[q] = answer
+        tokens_usados += tokens
+        costo += cost
+    return answers, tokens_usados, costo
+
+def chunk_text_of(chunk):
+    """Texto de un fragmento (str o dict de modules.chunking)"""
+    return chunk["texto"] if isinstance(chunk, dict) else chunk
+
+def combine_chunk_answers(all_answers):
+    """Combina las respuestas válidas de varios fragmentos en la respuesta final"""
+    if not all_answers:
+        print(f"      ❌ No se encontró información específica válida")
+        return "No se encontró información específica para esta pregunta"
 
-        except openai.RateLimitError as e:
-            print(f"⏳ Rate limit alcanzado en intento {attempt + 1}: {str(e)}")
-
-            if attempt < MAX_RETRIES - 1:
-                wait_time = await wait_for_rate_limit(str(e), attempt)
-                print(f"⏱️ Esperando {wait_time:.1f} segundos antes del siguiente intento...")
-                await asyncio.sleep(wait_time)
-            else:
-                print(f"❌ Máximo de reintentos alcanzado")
-                return {
-                    'success': False,
-                    'error': f'Rate limit después de {MAX_RETRIES} intentos: {str(e)}',
-                    'error_type': 'rate_limit'
-                }
+    if len(all_answers) == 1:
+        final_answer = all_answers[0]
+    else:
+        sorted_answers = sorted(all_answers, key=len, reverse=True)
+        final_answer = sorted_answers[0]
 
-        except openai.APITimeoutError as e:
-            print(f"⏰ Timeout en intento {attempt + 1}: {str(e)}")
-
-            if attempt < MAX_RETRIES - 1:
-                wait_time = min(5.0 * (attempt + 1), 20.0)
-                print(f"⏱️ Esperando {wait_time:.1f} segundos por timeout...")
-                await asyncio.sleep(wait_time)
-            else:
-                return {
-                    'success': False,
-                    'error': f'Timeout después de {MAX_RETRIES} intentos: {str(e)}',
-                    'error_type': 'timeout'
-                }
+        unique_answers = []
+        for ans in sorted_answers:
+            if not any(ans.lower() in existing.lower() or existing.lower() in ans.lower() 
+                      for existing in unique_answers):
+                unique_answers.append(ans)
 
-        except Exception as e:
-            print(f"❌ Error inesperado en intento {attempt + 1}: {str(e)}")
-
-            if attempt < MAX_RETRIES - 1:
-                wait_time = min(2.0 * (attempt + 1), 10.0)
-                await asyncio.sleep(wait_time)
-            else:
-                return {
-                    'success': False,
-                    'error': f'Error después de {MAX_RETRIES} intentos: {str(e)}',
-                    'error_type': 'unknown'
-                }
+        if len(unique_answers) > 1:
+            final_answer = " | ".join(unique_answers[:2])
+        else:
+            final_answer = unique_answers[0] if unique_answers else sorted_answers[0]
 
-    return {
-        'success': False,
-        'error': 'No se pudo completar la llamada a OpenAI',
-        'error_type': 'unknown'
-    }
+    print(f"      ✅ Respuesta final validada: {final_answer[:100]}{'...' if len(final_answer) > 100 else ''}")
+    return final_answer
 
-async def analyze_questions_parallel(text_chunks, questions, api_key, max_workers=3):
-    """Analiza múltiples preguntas en paralelo - OPTIMIZACIÓN PRINCIPAL"""
-    print(f"🚀 ANÁLISIS PARALELO: {len(questions)} preguntas con {max_workers} workers")
+async def analyze_questions_streaming(chunk_stream, questions, api_key, selector=None):
+    """
+    Análisis en pipeline: consume un iterador asíncrono de fragmentos y lanza las
+    preguntas sobre cada fragmento apenas llega, mientras la extracción continúa.
+    El selector (modules.chunking.ChunkSelector) decide qué preguntas recibe cada fragmento.
+    Las preguntas predefinidas de un fragmento van juntas en una consulta estructurada
+    (una llamada por fragmento); las personalizadas, una llamada por pregunta.
+    Las consultas se lanzan como tareas async; la concurrencia la limita el planificador global.
+    Devuelve [(respuesta, métricas), ...] en el orden de las preguntas.
+    """
+    from modules.chunking import ChunkSelector
+    print(f"🚀 ANÁLISIS EN PIPELINE: {len(questions)} preguntas")
 
     if not api_key or api_key == "tu_api_key_aqui":
         return [(f"API Key no configurada", {"tokens_usados": 0, "costo_estimado": 0.0}) for _ in questions]
 
-    # Ejecutar análisis en paralelo
-    loop = asyncio.get_event_loop()
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        tasks = [
-            loop.run_in_executor(
-                executor, 
-                analyze_single_question_optimized, 
-                text_chunks, 
-                question, 
-                api_key,
-                i+1,
-                len(questions)
-            ) for i, question in enumerate(questions)
-        ]
-
-        results = await asyncio.gather(*tasks)
-
-    print(f"✅ ANÁLISIS PARALELO COMPLETADO")
-    return results
+    selector = selector or ChunkSelector(questions)
+    structured = structured_question_indexes(questions)
+    client = get_openai_scheduler().async_client(api_key)
+    tasks = []  # (índices de preguntas, índice de fragmento, tarea)
+    chunk_count = 0
+    async for chunk in chunk_stream:
+        chunk_count += 1
+        selected = [q for q in selector.select(chunk) if questions[q].strip()]
+        print(f"   📄 Fragmento {chunk_count} listo ({len(chunk_text_of(chunk).split())} palabras): "
+              f"{len(selected)}/{len(questions)} preguntas relevantes")
+        grouped = [q for q in selected if q in structured]
+        if len(grouped) > 1:
+            future = asyncio.create_task(analyze_chunk_structured(client, chunk, questions, grouped))
+            tasks.append((grouped, chunk_count, future))
+        for q in selected:
+            if len(grouped) <= 1 or q not in structured:
+                future = asyncio.create_task(analyze_chunk_for_question(client, chunk, questions[q]))
+                tasks.append(([q], chunk_count, future))
+
+    results = await asyncio.gather(*(future for _, _, future in tasks))
+
+    answers = {q: [] for q in range(len(questions))}
+    metrics = {q: {"tokens_usados": 0, "costo_estimado": 0.0, "fragmentos_procesados": chunk_count,
+                   "respuestas_encontradas": 0, "consultas": 0, "consultas_estructuradas": 0,
+                   "seleccion": selector.report[q]} for q in range(len(questions))}
+    # Orden de fragmento para una combinación determinista
+    for (indexes, _, _), result in sorted(zip(tasks, results), key=lambda item: item[0][1]):
+        answer, tokens, cost = result
+        by_question = answer if isinstance(answer, dict) else {indexes[0]: answer}
+        for q in indexes:
+            # Costo de una consulta compartida: repartido por igual entre sus preguntas
+            metrics[q]["tokens_usados"] += tokens // len(indexes)
+            metrics[q]["costo_estimado"] += cost / len(indexes)
+            metrics[q]["consultas"] += 1
+            metrics[q]["consultas_estructuradas"] += 1 if isinstance(answer, dict) else 0
+            if by_question.get(q):
+                answers[q].append(by_question[q])
+                metrics[q]["respuestas_encontradas"] += 1
+
+    final = []
+    for q, question in enumerate(questions):
+        if not question.strip():
+            final.append(("Pregunta vacía", {"tokens_usados": 0, "costo_estimado": 0.0}))
+        else:
+            final.append((combine_chunk_answers(answers[q]), metrics[q]))
+
+    individual = sum(len(indexes) for indexes, _, _ in tasks)
+    print(f"✅ ANÁLISIS EN PIPELINE COMPLETADO: {chunk_count} fragmentos, {len(tasks)} consultas "
+          f"({individual} si fuera una por pregunta)")
+    return final
+
+# Análisis jerárquico (map-reduce) para documentos muy largos
+ANALYSIS_MODE = os.getenv('ANALYSIS_MODE', 'recuperacion')  # 'recuperacion' (BM25), 'fragmentos' o 'jerarquico'
+HIER_MAP_CONCURRENCY = int(os.getenv('HIER_MAP_CONCURRENCY', '6'))
+HIER_REDUCE_CONCURRENCY = int(os.getenv('HIER_REDUCE_CONCURRENCY', '3'))
+HIER_DIGEST_MAX_TOKENS = int(os.getenv('HIER_DIGEST_MAX_TOKENS', '700'))      # Salida de cada resumen
+HIER_REDUCE_MAX_TOKENS = int(os.getenv('HIER_REDUCE_MAX_TOKENS', '12000'))    # Entrada de cada reducción
+HIER_NO_INFO = "SIN INFORMACIÓN RELEVANTE"
+
+def _question_core(question):
+    """Solo la pregunta, sin las instrucciones de formato de respuesta"""
+    return question.split('?')[0].strip() + '?' if '?' in question else question.strip()
+
+async def _complete(client, prompt, max_tokens):
+    """Llamada simple al modelo: devuelve (texto, tokens usados, costo estimado)"""
+    response = await client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=max_tokens,
+        temperature=0.0,
+        timeout=60
+    )
+    tokens, cost = 0, 0.0
+    if getattr(response, 'usage', None):
+        prompt_tokens = response.usage.prompt_tokens or 0
+        completion_tokens = response.usage.completion_tokens or 0
+        tokens = response.usage.total_tokens or 0
+        cost = (prompt_tokens / 1_000_000) * PRECIO_INPUT_POR_1M_TOKENS + (completion_tokens / 1_000_000) * PRECIO_OUTPUT_POR_1M_TOKENS
+    return response.choices[0].message.content.strip(), tokens, cost
+
+async def map_chunk_digest(client, chunk, questions):
+    """
+    Paso map: condensa un fragmento en un resumen con solo los datos útiles para las preguntas.
+    Devuelve (resumen o None si no hay nada relevante, tokens, costo).
+    """
+    questions_text = "\n".join(f"{i}. {_question_core(q)}" for i, q in enumerate(questions, 1))
+    prompt = f"""Eres un asistente experto en contratos y documentos públicos colombianos.
 
-def analyze_single_question_optimized(text_chunks, question, api_key, question_num=1, total_questions=1):
-    """Analiza una pregunta con optimizaciones de velocidad"""
-    print(f"      🤖 [{question_num}/{total_questions}] Análisis optimizado...")
+Del FRAGMENTO, copia de forma condensada ÚNICAMENTE los datos que sirvan para responder las PREGUNTAS
+(nombres, NIT, direcciones, valores, fechas, requisitos, documentos). Conserva cifras, fechas y nombres
+exactamente como aparecen e indica la página cuando haya un encabezado '--- PÁGINA N'.
+Si el fragmento no contiene nada relevante, responde exactamente: {HIER_NO_INFO}
 
-    if not api_key:
-        return "API Key de OpenAI no configurada", {"tokens_usados": 0, "costo_estimado": 0.0}
+PREGUNTAS:
+{questions_text}
 
-    if not question.strip():
-        return "Pregunta vacía", {"tokens_usados": 0, "costo_estimado": 0.0}
+FRAGMENTO:
+{chunk_text_of(chunk)}
 
+DATOS RELEVANTES:"""
     try:
-        client = openai.OpenAI(api_key=api_key)
+        digest, tokens, cost = await _complete(client, prompt, HIER_DIGEST_MAX_TOKENS)
     except Exception as e:
-        return f"Error al configurar OpenAI: {str(e)}", {"tokens_usados": 0, "costo_estimado": 0.0}
+        print(f"         ❌ Error resumiendo fragmento: {str(e)}")
+        return None, 0, 0.0
+    if not digest or HIER_NO_INFO in digest.upper():
+        return None, tokens, cost
+    return digest, tokens, cost
 
-    # 🚀 OPTIMIZACIÓN 1: Análisis inteligente de fragmentos
-    relevant_chunks = smart_chunk_selection(text_chunks, question)
-    print(f"      ⚡ Optimización: {len(relevant_chunks)}/{len(text_chunks)} fragmentos relevantes")
+async def reduce_digests(client, digests, questions):
+    """Paso reduce: fusiona varios resúmenes en uno solo, sin perder datos ni duplicarlos"""
+    questions_text = "\n".join(f"{i}. {_question_core(q)}" for i, q in enumerate(questions, 1))
+    joined = "\n\n---\n\n".join(digests)
+    prompt = f"""Eres un asistente experto en contratos y documentos públicos colombianos.
 
-    all_answers = []
-    total_tokens_usados = 0
-    total_costo_estimado = 0.0
+Fusiona los RESÚMENES PARCIALES en un único resumen para responder las PREGUNTAS. Elimina duplicados,
+conserva todas las cifras, fechas, nombres y páginas exactamente como aparecen y no inventes datos.
 
-    # 🚀 OPTIMIZACIÓN 2: Prompt compacto y eficiente
-    prompt_template = get_optimized_prompt_template(question)
+PREGUNTAS:
+{questions_text}
 
-    for i, chunk in enumerate(relevant_chunks, 1):
-        print(f"         📄 Fragmento {i}/{len(relevant_chunks)} ({len(chunk.split())} palabras)...")
+RESÚMENES PARCIALES:
+{joined}
 
-        prompt = prompt_template.format(chunk=chunk, question=question)
+RESUMEN FUSIONADO:"""
+    try:
+        return await _complete(client, prompt, HIER_DIGEST_MAX_TOKENS * 2)
+    except Exception as e:
+        print(f"         ❌ Error fusionando resúmenes: {str(e)}")
+        # Sin reducción posible: conservar los resúmenes tal cual
+        return joined, 0, 0.0
+
+def _group_by_tokens(digests, max_tokens):
+    groups, current, current_tokens = [], [], 0
+    for digest in digests:
+        tokens = estimate_tokens(digest)
+        if current and current_tokens + tokens > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(digest)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+async def analyze_questions_hierarchical(chunk_stream, questions, api_key, selector=None,
+                                         map_workers=HIER_MAP_CONCURRENCY, reduce_workers=HIER_REDUCE_CONCURRENCY):
+    """
+    Análisis jerárquico (map-reduce) para documentos muy largos:
+    - map: una llamada barata por fragmento (todas las preguntas a la vez) que lo condensa
+      en un resumen relevante; corre mientras la extracción sigue produciendo fragmentos.
+    - reduce: fusiona los resúmenes por grupos, nivel a nivel, hasta que caben en una llamada.
+    - respuesta: cada pregunta se responde sobre el resumen final.
+    El costo crece casi linealmente con las páginas. Concurrencia separada por nivel.
+    Devuelve [(respuesta, métricas), ...] en el orden de las preguntas.
+    """
+    from modules.chunking import ChunkSelector
 
-        try:
-            print(f"         🤖 Consultando GPT-4o-mini con contexto mejorado...")
-
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=600,
-                temperature=0.0,
-                timeout=45
-            )
-
-            if hasattr(response, 'usage') and response.usage:
-                prompt_tokens = response.usage.prompt_tokens if response.usage else 0
-                completion_tokens = response.usage.completion_tokens if response.usage else 0
-                total_tokens = response.usage.total_tokens if response.usage else 0
-
-                input_cost = (prompt_tokens / 1_000_000) * PRECIO_INPUT_POR_1M_TOKENS
-                output_cost = (completion_tokens / 1_000_000) * PRECIO_OUTPUT_POR_1M_TOKENS
-                chunk_cost = input_cost + output_cost
-
-                print(f"         💰 Tokens: entrada={prompt_tokens}, salida={completion_tokens}, total={total_tokens}")
-                print(f"         💸 Costo estimado: ${chunk_cost:.4f}")
-
-                total_tokens_usados += total_tokens
-                total_costo_estimado += chunk_cost
-            else:
-                print("         💰 Tokens: No se pudo calcular el uso de tokens")
-                total_costo_estimado = 0
-                total_tokens_usados = 0
-
-            answer = response.choices[0].message.content.strip()
-            print(f"         📝 Respuesta: {answer[:80]}{'...' if len(answer) > 80 else ''}")
-
-            if answer and len(answer.strip()) > 3:
-                # Validación básica menos restrictiva
-                respuestas_invalidas = [
-                    "no encontrado", "no se encontró", "no aparece", "no está disponible",
-                    "no mencionado", "no especificado", "sin información"
-                ]
-
-                # Solo rechazar si la respuesta es claramente inválida
-                if not any(invalida in answer.lower() for invalida in respuestas_invalidas):
-                    all_answers.append(answer)
-                    print(f"         ✅ Respuesta encontrada en fragmento {i}")
-                else:
-                    print(f"         ⚠️ Respuesta indica que no se encontró información")
-            else:
-                print(f"         ❌ Respuesta muy corta o vacía")
+    print(f"🚀 ANÁLISIS JERÁRQUICO: {len(questions)} preguntas (map x{map_workers}, reduce x{reduce_workers})")
 
-        except Exception as e:
-            error_msg = f"Error en fragmento {i+1}: {str(e)}"
-            print(f"         ❌ {error_msg}")
+    if not api_key or api_key == "tu_api_key_aqui":
+        return [(f"API Key no configurada", {"tokens_usados": 0, "costo_estimado": 0.0}) for _ in questions]
+
+    selector = selector or ChunkSelector(questions)
+    client = get_openai_scheduler().async_client(api_key)
+    map_slots = asyncio.Semaphore(max(1, map_workers))
+    reduce_slots = asyncio.Semaphore(max(1, reduce_workers))
+    totals = {"tokens": 0, "costo": 0.0, "llamadas_map": 0, "llamadas_reduce": 0}
+
+
+    async def run(slots, function, *args):
+        async with slots:
+            return await function(*args)
+
+    # MAP: a medida que llegan los fragmentos
+    map_tasks = []
+    chunk_count = 0
+    async for chunk in chunk_stream:
+        chunk_count += 1
+        selected = [questions[q] for q in selector.select(chunk) if questions[q].strip()]
+        if not selected:
+            print(f"   📄 Fragmento {chunk_count}: sin preguntas relevantes, omitido")
+            continue
+        print(f"   📄 Fragmento {chunk_count} listo: resumen para {len(selected)} preguntas")
+        map_tasks.append(asyncio.create_task(run(map_slots, map_chunk_digest, client, chunk, selected)))
+
+    digests = []
+    for digest, tokens, cost in await asyncio.gather(*map_tasks):
+        totals["tokens"] += tokens
+        totals["costo"] += cost
+        totals["llamadas_map"] += 1
+        if digest:
+            digests.append(digest)
+    print(f"   🗺️ Map: {len(digests)}/{len(map_tasks)} fragmentos con información relevante")
+
+    # REDUCE: por niveles hasta que el resumen cabe en una sola llamada
+    level = 0
+    while len(digests) > 1 and estimate_tokens("\n\n".join(digests)) > HIER_REDUCE_MAX_TOKENS:
+        groups = _group_by_tokens(digests, HIER_REDUCE_MAX_TOKENS)
+        if len(groups) == len(digests):
+            break  # Cada resumen ya llena un grupo: no se puede reducir más
+        level += 1
+        results = await asyncio.gather(*(
+            run(reduce_slots, reduce_digests, client, group, questions) if len(group) > 1
+            else asyncio.sleep(0, result=(group[0], 0, 0.0))
+            for group in groups
+        ))
+        digests = []
+        for digest, tokens, cost in results:
+            totals["tokens"] += tokens
+            totals["costo"] += cost
+            totals["llamadas_reduce"] += 1 if tokens else 0
+            digests.append(digest)
+        print(f"   🔁 Reduce nivel {level}: {len(groups)} grupos → {len(digests)} resúmenes")
+
+    final_digest = "\n\n".join(digests)
+
+    # RESPUESTA: sobre el resumen final (predefinidas en una consulta estructurada)
+    answers = [(None, 0, 0.0) for _ in questions]
+    if final_digest.strip():
+        grouped = sorted(q for q in structured_question_indexes(questions) if questions[q].strip())
+        if len(grouped) <= 1:
+            grouped = []
+        single = [q for q, question in enumerate(questions) if question.strip() and q not in grouped]
+        calls = [run(reduce_slots, analyze_chunk_for_question, client, final_digest, questions[q]) for q in single]
+        if grouped:
+            calls.append(run(reduce_slots, analyze_chunk_structured, client, final_digest, questions, grouped))
+        results = await asyncio.gather(*calls)
+        for q, result in zip(single, results):
+            answers[q] = result
+        if grouped:
+            by_question, tokens, cost = results[-1]
+            for q in grouped:
+                answers[q] = (by_question.get(q), tokens // len(grouped), cost / len(grouped))
+
+    # Los costos de map/reduce son compartidos: se reparten por igual entre las preguntas
+    shared_tokens = totals["tokens"] // max(1, len(questions))
+    shared_cost = totals["costo"] / max(1, len(questions))
+    final = []
+    for q, (question, (answer, tokens, cost)) in enumerate(zip(questions, answers)):
+        if not question.strip():
+            final.append(("Pregunta vacía", {"tokens_usados": 0, "costo_estimado": 0.0}))
             continue
+        metricas = {
+            "modo": "jerarquico",
+            "tokens_usados": tokens + shared_tokens,
+            "costo_estimado": cost + shared_cost,
+            "fragmentos_procesados": chunk_count,
+            "respuestas_encontradas": 1 if answer else 0,
+            "seleccion": selector.report[q],
+            "niveles_reduce": level,
+            "llamadas_map": totals["llamadas_map"],
+            "llamadas_reduce": totals["llamadas_reduce"]
+        }
+        final.append((combine_chunk_answers([answer] if answer else []), metricas))
 
-    print(f"      📋 Completado: {len(all_answers)} respuestas válidas de {len(text_chunks)} fragmentos")
-    print(f"      💰 Total tokens usados: {total_tokens_usados} | Costo total: ${total_costo_estimado:.4f}")
+    print(f"✅ ANÁLISIS JERÁRQUICO COMPLETADO: {totals['llamadas_map']} map, {totals['llamadas_reduce']} reduce, "
+          f"{level} niveles, ${totals['costo']:.4f} compartidos")
+    return final
 
-    metricas = {
-        "tokens_usados": total_tokens_usados,
-        "costo_estimado": total_costo_estimado,
-        "fragmentos_procesados": len(text_chunks),
-        "respuestas_encontradas": len(all_answers)
-    }
+async def analyze_questions_retrieval(chunk_stream, questions, api_key):
+    """
+    Análisis por recuperación: los fragmentos se dividen en pasajes finos y se indexan
+    (BM25) una vez por documento; al completarse cada documento, cada pregunta se
+    consulta solo sobre sus top-k pasajes dentro de RETRIEVAL_MAX_TOKENS. Las preguntas
+    predefinidas comparten una consulta estructurada sobre la unión de sus pasajes.
+    Devuelve [(respuesta, métricas), ...] en el orden de las preguntas.
+    """
+    from modules.retrieval import PassageSplitter, DocumentRetriever
+
+    print(f"🚀 ANÁLISIS POR RECUPERACIÓN: {len(questions)} preguntas")
+
+    if not api_key or api_key == "tu_api_key_aqui":
+        return [(f"API Key no configurada", {"tokens_usados": 0, "costo_estimado": 0.0}) for _ in questions]
 
-    if all_answers:
-        if len(all_answers) == 1:
-            final_answer = all_answers[0]
+    client = get_openai_scheduler().async_client(api_key)
+    active = [q for q, question in enumerate(questions) if question.strip()]
+    grouped = [q for q in structured_question_indexes(questions) if q in active]
+    if len(grouped) <= 1:
+        grouped = []
+    selection = {q: {"documentos": 0, "pasajes_indexados": 0, "pasajes_enviados": 0,
+                     "omitidos_presupuesto": 0, "tokens_enviados": 0, "tokens_documento": 0}
+                 for q in range(len(questions))}
+    tasks = []  # (índices de preguntas, tarea)
+
+    def launch(retriever):
+        """Documento completo: consultas sobre los pasajes de cada pregunta"""
+        if not retriever.passages:
+            return
+        chosen = {}
+        for q in active:
+            chosen[q], report = retriever.retrieve(questions[q])
+            selection[q]["documentos"] += 1
+            for key in ("pasajes_indexados", "pasajes_enviados", "omitidos_presupuesto", "tokens_enviados", "tokens_documento"):
+                selection[q][key] += report[key]
+        union = sorted({index for q in grouped for index in chosen[q]})
+        if union:
+            task = asyncio.create_task(analyze_chunk_structured(client, retriever.context(union), questions, grouped))
+            tasks.append((grouped, task))
+        for q in active:
+            if q not in grouped and chosen[q]:
+                task = asyncio.create_task(analyze_chunk_for_question(client, retriever.context(chosen[q]), questions[q]))
+                tasks.append(([q], task))
+        print(f"   🔎 {retriever.document or 'Documento'}: {len(retriever.passages)} pasajes indexados, "
+              f"{len(union)} para las preguntas predefinidas")
+
+    splitter = PassageSplitter()
+    retriever = None
+    chunk_count = 0
+    async for chunk in chunk_stream:
+        chunk_count += 1
+        for passage in splitter.split(chunk):
+            if retriever is None or passage["documento"] != retriever.document:
+                if retriever is not None:
+                    launch(retriever)
+                retriever = DocumentRetriever(passage["documento"])
+            retriever.add(passage)
+    if retriever is not None:
+        launch(retriever)
+
+    results = await asyncio.gather(*(task for _, task in tasks))
+
+    answers = {q: [] for q in range(len(questions))}
+    metrics = {q: {"modo": "recuperacion", "tokens_usados": 0, "costo_estimado": 0.0,
+                   "fragmentos_procesados": chunk_count, "respuestas_encontradas": 0, "consultas": 0,
+                   "consultas_estructuradas": 0, "seleccion": selection[q]} for q in range(len(questions))}
+    for (indexes, _), (answer, tokens, cost) in zip(tasks, results):
+        by_question = answer if isinstance(answer, dict) else {indexes[0]: answer}
+        for q in indexes:
+            metrics[q]["tokens_usados"] += tokens // len(indexes)
+            metrics[q]["costo_estimado"] += cost / len(indexes)
+            metrics[q]["consultas"] += 1
+            metrics[q]["consultas_estructuradas"] += 1 if isinstance(answer, dict) else 0
+            if by_question.get(q):
+                answers[q].append(by_question[q])
+                metrics[q]["respuestas_encontradas"] += 1
+
+    final = []
+    for q, question in enumerate(questions):
+        if not question.strip():
+            final.append(("Pregunta vacía", {"tokens_usados": 0, "costo_estimado": 0.0}))
         else:
-            sorted_answers = sorted(all_answers, key=len, reverse=True)
-            final_answer = sorted_answers[0]
-
-            unique_answers = []
-            for ans in sorted_answers:
-                if not any(ans.lower() in existing.lower() or existing.lower() in ans.lower() 
-                          for existing in unique_answers):
-                    unique_answers.append(ans)
-
-            if len(unique_answers) > 1:
-                final_answer = " | ".join(unique_answers[:2])
-            else:
-                final_answer = unique_answers[0] if unique_answers else sorted_answers[0]
-
-        print(f"      ✅ Respuesta final validada: {final_answer[:100]}{'...' if len(final_answer) > 100 else ''}")
-        return final_answer, metricas
-    else:
-        print(f"      ❌ No se encontró información específica válida")
-        return "No se encontró información específica para esta pregunta", metricas
+            final.append((combine_chunk_answers(answers[q]), metrics[q]))
+
+    sent = sum(selection[q]["tokens_enviados"] for q in active)
+    available = sum(selection[q]["tokens_documento"] for q in active)
+    print(f"✅ ANÁLISIS POR RECUPERACIÓN COMPLETADO: {len(tasks)} consultas, "
+          f"{sent:,}/{available:,} tokens de documento enviados por pregunta")
+    return final
 
 def process_custom_questions(preguntas_personalizadas):
     """Procesa preguntas personalizadas del usuario"""
@@ -384,20 +616,6 @@ def process_custom_questions(preguntas_personalizadas):
 
     return preguntas_finales
 
-def smart_chunk_selection(text_chunks, question):
-    """Selección inteligente de fragmentos relevantes para la pregunta"""
-    # Palabras clave por tipo de pregunta
-    keywords_map = {
-        'entidad': ['entidad', 'institución', 'ministerio', 'alcaldía', 'gobernación', 'empresa', 'contratante'],
-        'nit': ['nit', 'identificación', 'tributaria', 'rut'],
-        'ciudad': ['ciudad', 'municipio', 'sede', 'ubicación'],
-        'direccion': ['dirección', 'dirección', 'calle', 'carrera', 'avenida'],
-        'valor': ['valor', 'presupuesto', 'precio', 'costo', '$', 'pesos', 'millones'],
-        'cronograma': ['fecha', 'plazo', 'término', 'cronograma', 'tiempo'],
-        'experiencia': ['experiencia', 'requisitos', 'años', 'similar'],
-        'salud': ['salud', 'pensión', 'seguridad social', 'afiliación'],
-        'anexos': ['anexos', 'formatos', 'documentos', 'certificado']
-    }
 def get_optimized_prompt_template(question: str) -> str:
     instrucciones = """
 Eres un asistente experto en contratos y documentos públicos colombianos.
@@ -413,34 +631,6 @@ RESPONDE SOLO con la información que se solicita.
 """
     return instrucciones + "\n\nDOCUMENTO:\n{chunk}\n\nPREGUNTA:\n{question}\n\nRESPUESTA:"
 
-    question_lower = question.lower()
-    relevant_keywords = []
-
-    # Identificar tipo de pregunta
-    for category, keywords in keywords_map.items():
-        if any(keyword in question_lower for keyword in keywords):
-            relevant_keywords.extend(keywords)
-            break
-
-    if not relevant_keywords:
-        # Si no se identifica el tipo, usar todos los fragmentos
-        return text_chunks[:3]  # Máximo 3 fragmentos
-
-    # Puntuar fragmentos por relevancia
-    scored_chunks = []
-    for chunk in text_chunks:
-        chunk_lower = chunk.lower()
-        score = sum(1 for keyword in relevant_keywords if keyword in chunk_lower)
-        if score > 0:
-            scored_chunks.append((chunk, score))
-
-    # Ordenar por relevancia y tomar los mejores
-    scored_chunks.sort(key=lambda x: x[1], reverse=True)
-
-    # Retornar máximo 2-3 fragmentos más relevantes
-    max_chunks = 2 if len(scored_chunks) > 5 else 3
-    return [chunk for chunk, score in scored_chunks[:max_chunks]]
-
 def estimate_tokens(text: str) -> int:
     """
     Estima la cantidad de tokens de un texto (aproximación)
@@ -590,14 +780,15 @@ Instrucciones:
 
 async def analyze_with_ai_parallel(text_fragments: List[str], custom_questions: List[str] = None) -> List[Dict[str, Any]]:
     """
-    Analiza fragmentos de texto usando IA de forma secuencial con delays para evitar rate limits
+    Analiza fragmentos de texto usando IA de forma secuencial; el ritmo de las llamadas
+    lo marca el limitador de tasa del planificador global
     """
     print(f"🤖 Iniciando análisis con IA - {len(text_fragments)} fragmentos")
 
     questions = custom_questions if custom_questions else DEFAULT_QUESTIONS
     print(f"📝 Analizando {len(questions)} preguntas")
 
-    # Procesar preguntas de forma secuencial para evitar rate limits
+    # Procesar preguntas de forma secuencial
     results = []
     start_time = time.time()
 
@@ -605,33 +796,9 @@ async def analyze_with_ai_parallel(text_fragments: List[str], custom_questions:
         print(f"📋 Procesando pregunta {i + 1}/{len(questions)}")
 
         try:
-            # 🚀 VERIFICACIÓN INTELIGENTE antes de cada pregunta
-            should_pause, limit_type = rate_limit_manager.should_pause()
-            if should_pause:
-                pause_time = rate_limit_manager.calculate_pause_time(limit_type)
-                print(f"🛑 PAUSA INTELIGENTE antes de pregunta {i + 1}")
-                print(f"⏱️ Límite de {limit_type} alcanzado, pausando {pause_time:.1f} segundos...")
-                await asyncio.sleep(pause_time)
-                print(f"✅ Pausa completada, procesando pregunta {i + 1}")
-
             result = await analyze_single_question(text_fragments, question, i + 1)
             results.append(result)
 
-            # Delay adaptativo basado en el estado del rate limit
-            if i < len(questions) - 1:  # No delay después de la última pregunta
-                # Delay más corto si estamos lejos de los límites, más largo si estamos cerca
-                current_requests = len(rate_limit_manager.request_times)
-                current_tokens = sum(rate_limit_manager.token_usage)
-
-                if current_requests > 300 or current_tokens > 100000:
-                    delay = random.uniform(3.0, 5.0)  # Delay más largo si estamos cerca de límites
-                    print(f"⏱️ Delay extendido: {delay:.1f}s (cerca de límites)")
-                else:
-                    delay = random.uniform(1.0, 2.5)  # Delay normal
-                    print(f"⏱️ Delay normal: {delay:.1f}s")
-
-                await asyncio.sleep(delay)
-
         except Exception as e:
             print(f"❌ Error inesperado en pregunta {i + 1}: {str(e)}")
             results.append({
@@ -650,21 +817,18 @@ async def analyze_with_ai_parallel(text_fragments: List[str], custom_questions:
 
     total_time = time.time() - start_time
 
-    # 📊 Información final del rate limiting
-    final_requests = len(rate_limit_manager.request_times)
-    final_tokens = sum(rate_limit_manager.token_usage)
+    # 📊 Margen del limitador de tasa al terminar
+    from modules.openai_scheduler import get_rate_limit_stats
+    rate_limits = get_rate_limit_stats()
 
     print(f"✅ Análisis completado en {total_time:.2f} segundos")
-    print(f"📊 Rate limiting final: {final_requests}/{rate_limit_manager.MAX_REQUESTS_PER_MINUTE} requests, {final_tokens}/{rate_limit_manager.MAX_TOKENS_PER_MINUTE} tokens")
+    for model, headroom in rate_limits.items():
+        print(f"📊 Rate limit {model}: {headroom['solicitudes']['disponibles']}/{headroom['solicitudes']['capacidad']} requests, "
+              f"{headroom['tokens']['disponibles']}/{headroom['tokens']['capacidad']} tokens disponibles")
 
     # Agregar información de rate limiting a los resultados
     for result in results:
         if 'metricas_openai' in result:
-            result['metricas_openai']['rate_limit_info'] = {
-                'requests_utilizados': final_requests,
-                'tokens_utilizados': final_tokens,
-                'limite_requests': rate_limit_manager.MAX_REQUESTS_PER_MINUTE,
-                'limite_tokens': rate_limit_manager.MAX_TOKENS_PER_MINUTE
-            }
+            result['metricas_openai']['rate_limit_info'] = rate_limits
 
     return results
\ No newline at end of file
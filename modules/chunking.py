@@ -0,0 +1,205 @@
+"""
+🔪 Fragmentación y selección de texto para el análisis con IA
+- TokenChunker: fragmentador incremental en tiempo lineal, medido en tokens estimados,
+  con solapamiento configurable y desplazamientos de página y de carácter por fragmento.
+  No descarta texto: todo el documento queda en algún fragmento.
+- ChunkSelector: etapa separada que decide qué fragmentos se envían al modelo para
+  cada pregunta, y reporta lo que deja fuera.
+"""
+
+import os
+import re
+
+from modules.text_merge import estimate_tokens, normalize_text
+
+CHUNK_MAX_TOKENS = int(os.getenv('CHUNK_MAX_TOKENS', '6000'))
+CHUNK_OVERLAP_TOKENS = int(os.getenv('CHUNK_OVERLAP_TOKENS', '200'))
+# 'relevancia' = solo fragmentos con términos de la pregunta; 'todos' = sin filtro
+CHUNK_SELECTION_MODE = os.getenv('CHUNK_SELECTION_MODE', 'relevancia')
+# Tokens de fragmentos por pregunta (0 = sin límite); lo que no cabe se reporta, no se oculta
+CHUNK_SELECTION_MAX_TOKENS = int(os.getenv('CHUNK_SELECTION_MAX_TOKENS', '0'))
+
+_PAGE_MARKER = re.compile(r'--- PÁGINA (\d+)')
+_DOCUMENT_MARKER = re.compile(r'=== DOCUMENTO: (.+?) ===')
+
+
+class TokenChunker:
+    """
+    Fragmentador incremental: recibe el texto por partes (p. ej. página a página) y
+    entrega cada fragmento apenas alcanza max_tokens. Cada párrafo se procesa una vez;
+    el solapamiento repite como máximo overlap_tokens del final del fragmento anterior.
+    """
+
+    def __init__(self, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+        self.max_tokens = max(1, max_tokens)
+        self.overlap_tokens = max(0, min(overlap_tokens, self.max_tokens // 2))
+        self.pending = ""      # Párrafo posiblemente incompleto de la última parte
+        self.offset = 0        # Carácter del texto completo donde empieza self.pending
+        self.page = None
+        self.document = None
+        self.paragraphs = []   # (texto, tokens, carácter_inicio, página) del fragmento en curso
+        self.tokens = 0
+        self.fresh = False     # Hay párrafos nuevos además del solapamiento arrastrado
+        self.emitted = 0
+
+    def _emit(self):
+        text = "\n\n".join(p[0] for p in self.paragraphs)
+        last_text, _, last_start, last_page = self.paragraphs[-1]
+        chunk = {
+            "indice": self.emitted,
+            "texto": text,
+            "tokens": estimate_tokens(text),
+            "caracter_inicio": self.paragraphs[0][2],
+            "caracter_fin": last_start + len(last_text),
+            "pagina_inicio": next((p[3] for p in self.paragraphs if p[3] is not None), None),
+            "pagina_fin": last_page,
+            "documento": self.document
+        }
+        self.emitted += 1
+
+        # Solapamiento: conservar los últimos párrafos que quepan en overlap_tokens
+        carried, carried_tokens = [], 0
+        for paragraph in reversed(self.paragraphs):
+            if carried_tokens + paragraph[1] > self.overlap_tokens:
+                break
+            carried.insert(0, paragraph)
+            carried_tokens += paragraph[1]
+        self.paragraphs, self.tokens = carried, carried_tokens
+        self.fresh = False
+        return chunk
+
+    def _split_long(self, paragraph, start, page):
+        """Párrafo mayor que max_tokens: ventanas por caracteres cortadas en espacios"""
+        window = self.max_tokens * 3
+        step = max(1, window - self.overlap_tokens * 3)
+        position = 0
+        while position < len(paragraph):
+            end = min(len(paragraph), position + window)
+            if end < len(paragraph):
+                space = paragraph.rfind(' ', position + step // 2, end)
+                end = space if space > position else end
+            window_text = paragraph[position:end]
+            stripped = window_text.lstrip()
+            # El desplazamiento apunta al primer carácter que queda tras quitar los espacios
+            yield stripped.rstrip(), start + position + len(window_text) - len(stripped), page
+            if end >= len(paragraph):
+                break
+            position = max(position + 1, end - (window - step))
+
+    def _add_paragraph(self, paragraph, start):
+        ready = []
+        for match in _DOCUMENT_MARKER.finditer(paragraph):
+            self.document, self.page = match.group(1), None
+        pages = _PAGE_MARKER.findall(paragraph)
+        page = int(pages[0]) if pages else self.page
+        if pages:
+            self.page = int(pages[-1])
+        if not paragraph.strip():
+            return ready
+
+        pieces = [(paragraph, start, page)]
+        if estimate_tokens(paragraph) > self.max_tokens:
+            pieces = list(self._split_long(paragraph, start, page))
+
+        for text, piece_start, piece_page in pieces:
+            tokens = estimate_tokens(text)
+            # Un encabezado de documento nunca sale solo: pasa al fragmento de su primer texto
+            headers_only = all(not _DOCUMENT_MARKER.sub('', p[0]).strip() for p in self.paragraphs)
+            if self.paragraphs and self.tokens + tokens > self.max_tokens and not headers_only:
+                ready.append(self._emit())
+                # Sin espacio aun con solapamiento: el párrafo empieza un fragmento limpio
+                if self.tokens + tokens > self.max_tokens:
+                    self.paragraphs, self.tokens = [], 0
+            self.paragraphs.append((text, tokens, piece_start, piece_page))
+            self.tokens += tokens
+            self.fresh = True
+        return ready
+
+    def add(self, text):
+        """Agrega texto y devuelve los fragmentos completos"""
+        parts = (self.pending + text).split('\n\n')
+        self.pending = parts.pop()
+        ready = []
+        for paragraph in parts:
+            ready.extend(self._add_paragraph(paragraph, self.offset))
+            self.offset += len(paragraph) + 2
+        return ready
+
+    def finish(self):
+        """Cierra el texto y devuelve los fragmentos restantes"""
+        ready = self._add_paragraph(self.pending, self.offset) if self.pending else []
+        self.offset += len(self.pending)
+        self.pending = ""
+        if self.paragraphs and self.fresh:
+            ready.append(self._emit())
+        self.paragraphs, self.tokens, self.fresh = [], 0, False
+        return ready
+
+
+def chunk_document(text, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """Fragmenta un texto completo; devuelve la lista de fragmentos con sus desplazamientos"""
+    chunker = TokenChunker(max_tokens, overlap_tokens)
+    return chunker.add(text) + chunker.finish()
+
+
+_STOPWORDS = {
+    'cual', 'cuales', 'como', 'donde', 'entre', 'sobre', 'para', 'desde', 'hasta', 'este', 'esta',
+    'estos', 'estas', 'dicho', 'segun', 'tiene', 'tienen', 'debe', 'deben', 'especifica', 'especifico',
+    'mencionan', 'menciona', 'requieren', 'requiere', 'ubicada', 'ubicado', 'completa', 'completo'
+}
+
+
+def question_terms(question):
+    """
+    Términos de búsqueda de una pregunta: solo el texto de la pregunta (hasta el '?',
+    sin las instrucciones de formato), palabras de 4+ letras y siglas (NIT, RUT) sin
+    acentos, truncadas a 6 caracteres para tolerar plurales y conjugaciones.
+    """
+    core = question.split('?')[0] if '?' in question else question
+    words = re.findall(r'[a-z0-9]+', normalize_text(core))
+    acronyms = {normalize_text(a) for a in re.findall(r'\b[A-ZÁÉÍÓÚÑ]{2,}\b', core)}
+    return {w[:6] for w in words if (len(w) >= 4 and w not in _STOPWORDS) or w in acronyms}
+
+
+def text_terms(text):
+    """Términos de un texto, con repeticiones: mismo recorte a 6 letras que question_terms"""
+    return [w[:6] for w in re.findall(r'[a-z0-9]+', normalize_text(text)) if len(w) >= 2]
+
+
+class ChunkSelector:
+    """
+    Etapa de selección, separada de la fragmentación: decide fragmento a fragmento
+    (apto para streaming) qué se envía al modelo para cada pregunta y lleva la cuenta
+    de lo omitido por irrelevante o por presupuesto de tokens.
+    """
+
+    def __init__(self, questions, mode=CHUNK_SELECTION_MODE, max_tokens=CHUNK_SELECTION_MAX_TOKENS):
+        self.mode = mode
+        self.max_tokens = max_tokens
+        self.terms = [question_terms(q) for q in questions]
+        self.report = [
+            {"enviados": 0, "omitidos_irrelevantes": 0, "omitidos_presupuesto": 0, "tokens_enviados": 0}
+            for _ in questions
+        ]
+
+    def select(self, chunk):
+        """Índices de las preguntas a las que se envía este fragmento"""
+        text = chunk["texto"] if isinstance(chunk, dict) else chunk
+        tokens = chunk.get("tokens", estimate_tokens(text)) if isinstance(chunk, dict) else estimate_tokens(text)
+        words = None
+        selected = []
+        for q, terms in enumerate(self.terms):
+            report = self.report[q]
+            if self.mode != 'todos' and terms:
+                if words is None:
+                    words = set(text_terms(text))
+                if not terms & words:
+                    report["omitidos_irrelevantes"] += 1
+                    continue
+            if self.max_tokens and report["tokens_enviados"] + tokens > self.max_tokens:
+                report["omitidos_presupuesto"] += 1
+                continue
+            report["enviados"] += 1
+            report["tokens_enviados"] += tokens
+            selected.append(q)
+        return selected
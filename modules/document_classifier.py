@@ -0,0 +1,97 @@
+"""
+🗂️ Clasificación de documentos y perfiles de extracción
+Clasificador liviano (primeras páginas con texto nativo + nombre del archivo) que asigna
+un tipo de documento y un perfil de extracción, a partir de las estrategias por tipo de
+optimize_vision_processing.create_processing_strategy:
+- solo_nativo: solo la capa de texto del PDF, sin OCR ni Vision AI
+- ocr: OCR (y extracción de tablas) en las páginas sin texto nativo, sin Vision AI
+- ocr_vision_selectiva: OCR + Vision AI en las páginas que lo necesitan (ruta histórica)
+- vision_completa: OCR + Vision AI en todas las páginas escaneadas
+"""
+
+import os
+import re
+from functools import lru_cache
+
+from modules.text_merge import normalize_text
+
+EXTRACTION_PROFILES = ("solo_nativo", "ocr", "ocr_vision_selectiva", "vision_completa")
+# 'auto' = clasificar cada documento; o un perfil fijo para todos
+EXTRACTION_PROFILE = os.getenv('EXTRACTION_PROFILE', 'auto')
+CLASSIFIER_PAGES = int(os.getenv('CLASSIFIER_PAGES', '3'))  # Páginas iniciales leídas para el tipo
+# Fracción de páginas con texto nativo desde la cual un documento se trata como digital
+PROFILE_NATIVE_MIN_RATIO = float(os.getenv('PROFILE_NATIVE_MIN_RATIO', '0.8'))
+# Documentos escaneados cortos de tipo crítico: Vision AI en todas las páginas
+PROFILE_FULL_VISION_MAX_PAGES = int(os.getenv('PROFILE_FULL_VISION_MAX_PAGES', '4'))
+
+# Palabras clave por tipo (sin acentos, en minúsculas); gana el tipo con más coincidencias
+DOCUMENT_TYPE_KEYWORDS = {
+    "contratos": ["contrato", "clausula", "contratista", "contratante", "objeto del contrato",
+                  "supervisor", "poliza", "perfeccionamiento", "minuta"],
+    "cotizaciones": ["cotizacion", "precio unitario", "valor unitario", "subtotal", "iva",
+                     "cantidad", "oferta economica", "propuesta economica", "validez de la oferta"],
+    "estudios_previos": ["estudios previos", "estudio previo", "necesidad", "justificacion",
+                         "analisis del sector", "modalidad de seleccion", "presupuesto oficial",
+                         "certificado de disponibilidad presupuestal"]
+}
+CLASSIFIER_MIN_MATCHES = 2
+
+
+@lru_cache(maxsize=1)
+def processing_strategies():
+    """Estrategias por tipo de documento (definidas en optimize_vision_processing)"""
+    from optimize_vision_processing import VisionProcessingOptimizer
+    return VisionProcessingOptimizer().create_processing_strategy()
+
+
+def classify_document_type(text, filename=""):
+    """Tipo de documento según las palabras clave del texto inicial y del nombre del archivo"""
+    text = normalize_text(text)
+    name = normalize_text(re.sub(r'[_\-.]+', ' ', filename or ''))
+    scores = {}
+    for doc_type, keywords in DOCUMENT_TYPE_KEYWORDS.items():
+        score = sum(len(re.findall(r'\b' + re.escape(keyword) + r'\b', text)) for keyword in keywords)
+        # El nombre del archivo pesa como varias coincidencias (cubre documentos escaneados)
+        score += sum(CLASSIFIER_MIN_MATCHES for keyword in keywords if keyword in name)
+        scores[doc_type] = score
+    best = max(scores, key=scores.get)
+    return (best if scores[best] >= CLASSIFIER_MIN_MATCHES else "general"), scores
+
+
+def choose_extraction_profile(text_layer, filename="", vision_available=True, forced_profile=None):
+    """
+    Clasifica un PDF a partir de la evaluación de su capa de texto (analyze_text_layer)
+    y devuelve {"tipo", "perfil", "motivo", ...} sin renderizar ninguna página.
+    """
+    total_pages = len(text_layer)
+    native_pages = sum(1 for page in text_layer if page["aprobada"])
+    native_ratio = native_pages / total_pages if total_pages else 0.0
+    first_pages_text = "\n".join(page["texto"] for page in text_layer[:CLASSIFIER_PAGES])
+    doc_type, scores = classify_document_type(first_pages_text, filename)
+    strategy = processing_strategies().get(doc_type, processing_strategies()["general"])
+    vision_mandatory = strategy.get("vision_ai") == "mandatory"
+
+    if forced_profile in EXTRACTION_PROFILES:
+        profile, reason = forced_profile, "Perfil fijado por configuración"
+    elif total_pages and native_pages == total_pages:
+        profile, reason = "solo_nativo", "Todas las páginas con texto nativo válido"
+    elif not vision_available:
+        profile, reason = "ocr", "Vision AI no disponible"
+    elif not vision_mandatory and native_ratio >= PROFILE_NATIVE_MIN_RATIO:
+        profile, reason = "ocr", f"Documento general mayormente digital ({native_ratio:.0%} nativo)"
+    elif vision_mandatory and native_ratio < PROFILE_NATIVE_MIN_RATIO and 0 < total_pages <= PROFILE_FULL_VISION_MAX_PAGES:
+        profile, reason = "vision_completa", f"{doc_type} escaneado corto (Vision AI {strategy['vision_ai']})"
+    else:
+        profile, reason = "ocr_vision_selectiva", f"{doc_type}: Vision AI {strategy.get('vision_ai')} en páginas escaneadas"
+
+    return {
+        "tipo": doc_type,
+        "perfil": profile,
+        "motivo": reason,
+        "paginas": total_pages,
+        "paginas_nativas": native_pages,
+        "proporcion_nativa": round(native_ratio, 3),
+        "puntajes_tipo": scores,
+        "prioridad": strategy.get("priority"),
+        "areas_clave": strategy.get("focus_areas", [])
+    }
@@ -1,5 +1,11 @@
+import asyncio
+import collections
 import concurrent.futures
+import heapq
+import multiprocessing
 import threading
+import weakref
+from abc import ABC, abstractmethod
 from functools import lru_cache
 
 
@@ -11,23 +17,106 @@ Maneja la extracción de texto de PDFs, Word, imágenes, etc.
 import PyPDF2
 import io
 import os
-from PIL import Image
+from PIL import Image, ImageOps
 from docx import Document
 import tempfile
+import zipfile
+from xml.etree import ElementTree
 import re
+import shlex
+import math
+import hashlib
 import base64
 import cv2
 import numpy as np
 from pdf2image import convert_from_bytes
 import pytesseract
+import pdfplumber
 import openai
 import fitz  # PyMuPDF
 from pdf2image import convert_from_path
 import logging
+import time
 from pathlib import Path
-
-def preprocess_image_for_ocr(image):
-    """Preprocesa imagen para OCR - VERSIÓN OPTIMIZADA"""
+from modules.text_merge import merge_page_texts, split_batch_response
+from modules.text_layer import (
+    TEXT_LAYER_MAX_GARBAGE,
+    TEXT_LAYER_MIN_CHARS,
+    TEXT_LAYER_MIN_DENSITY,
+    is_garbage_char,
+    score_text_layer
+)
+from modules.chunking import chunk_document, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS
+from modules.document_classifier import choose_extraction_profile, EXTRACTION_PROFILE
+from modules.openai_scheduler import get_openai_scheduler
+
+# Versión del extractor: forma parte de la clave de la caché de extracción.
+# Incrementar cuando un cambio en el pipeline altere el texto producido.
+EXTRACTOR_VERSION = "2.6.0"
+
+# Precios de gpt-4o-mini por 1M tokens (mismos valores que modules/ai_analyzer.py)
+PRECIO_INPUT_POR_1M_TOKENS = 5.0
+PRECIO_OUTPUT_POR_1M_TOKENS = 15.0
+
+# Vision AI concurrente con presupuesto por documento (0 = sin límite); la concurrencia
+# la fija el planificador global de OpenAI (OPENAI_MAX_IN_FLIGHT)
+VISION_MAX_PAGES = int(os.getenv('VISION_MAX_PAGES', '0'))
+VISION_MAX_USD = float(os.getenv('VISION_MAX_USD', '0'))
+# Costo estimado de una llamada antes de tener costos reales (~1100 tokens de entrada, ~1000 de salida)
+VISION_ESTIMATED_CALL_USD = float(os.getenv('VISION_ESTIMATED_CALL_USD', '0.0205'))
+# Con presupuesto, las páginas con prioridad >= este valor se despachan sin esperar al final del OCR
+VISION_EAGER_PRIORITY = 4
+# Páginas consecutivas por llamada de Vision AI (1 = una página por llamada, máximo 4)
+VISION_BATCH_SIZE = max(1, min(4, int(os.getenv('VISION_BATCH_SIZE', '1'))))
+
+# Fusionar por página OCR + Vision AI en un solo texto (false = anexar Vision AI al final, como antes)
+OCR_VISION_MERGE = os.getenv('OCR_VISION_MERGE', 'true').lower() not in ('0', 'false', 'no')
+
+# Preparación de imágenes para Vision AI (recorte de márgenes, escala de grises, rejilla de tiles)
+VISION_OPTIMIZE_IMAGES = os.getenv('VISION_OPTIMIZE_IMAGES', 'true').lower() not in ('0', 'false', 'no')
+VISION_MIN_SCALE = float(os.getenv('VISION_MIN_SCALE', '0.8'))  # Reducción máxima para ahorrar tiles
+# Detalle 'low' (512 px) solo para páginas con poco contenido: poca tinta en un área pequeña
+VISION_LOW_DETAIL_MAX_INK = float(os.getenv('VISION_LOW_DETAIL_MAX_INK', '0.04'))
+VISION_LOW_DETAIL_MAX_AREA = float(os.getenv('VISION_LOW_DETAIL_MAX_AREA', '0.3'))  # Fracción de la página
+# Menos caracteres de OCR = "OCR insuficiente": la página se envía a Vision AI siempre en detalle alto
+VISION_OCR_MIN_CHARS = 50
+VISION_TILE_SIZE = 512
+VISION_BASE_TOKENS = 85
+VISION_TOKENS_PER_TILE = 170
+
+# Configuración del pool de OCR (ajustable por variables de entorno)
+# Cada worker carga Tesseract y una página rasterizada: por defecto como máximo 4, aun en hosts grandes
+OCR_WORKERS = int(os.getenv('OCR_WORKERS', str(min(4, os.cpu_count() or 1))))
+OCR_PAGE_TIMEOUT = float(os.getenv('OCR_PAGE_TIMEOUT', '120'))  # Segundos por página
+OCR_MAX_PAGES_PER_WORKER = int(os.getenv('OCR_MAX_PAGES_PER_WORKER', '25'))  # Reciclar worker tras N páginas
+OCR_WORKER_MEMORY_MB = int(os.getenv('OCR_WORKER_MEMORY_MB', '0'))  # 0 = sin límite
+# Método de arranque de los workers. El reciclaje (max_tasks_per_child) no admite 'fork':
+# con 'spawn' (o 'forkserver') cada worker importa este módulo al iniciar (~1-2 s) y las
+# páginas viajan serializadas con pickle (imágenes PIL), así que todo lo enviado debe ser picklable
+OCR_START_METHOD = os.getenv('OCR_START_METHOD', 'spawn')
+
+# Rasterización en streaming: páginas en memoria como máximo = PAGE_WINDOW
+PAGE_RENDER_DPI = int(os.getenv('PAGE_RENDER_DPI', '150'))
+PAGE_WINDOW = int(os.getenv('PAGE_WINDOW', str(max(2, OCR_WORKERS * 2))))
+
+# Modo de OCR: 'confianza' (una pasada con image_to_data + reproceso de regiones
+# con baja confianza) o 'cascada' (hasta tres pasadas completas de Tesseract)
+OCR_MODE = os.getenv('OCR_MODE', 'confianza')
+OCR_MIN_CONFIDENCE = float(os.getenv('OCR_MIN_CONFIDENCE', '60'))
+OCR_LAYOUT_PSM = 3   # Análisis de diseño automático
+OCR_REGION_PSM = 6   # Bloque uniforme de texto (reproceso de regiones)
+OCR_CASCADE_PSMS = [6, 3, 1]
+OCR_LANG = 'spa+eng'
+# Imágenes subidas: bloque uniforme de texto y solo caracteres habituales en español
+IMAGE_OCR_PSM = 6
+IMAGE_OCR_CHAR_WHITELIST = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz.,;:!?()[]{}"\'-+=/\\ áéíóúñüÁÉÍÓÚÑÜ'
+IMAGE_OCR_VARIABLES = {"tessedit_char_whitelist": IMAGE_OCR_CHAR_WHITELIST}
+
+# Backend de OCR: 'auto' (tesserocr si está instalado), 'tesserocr' o 'pytesseract'
+OCR_BACKEND = os.getenv('OCR_BACKEND', 'auto')
+
+def preprocess_image_for_ocr(image, as_array=False):
+    """Preprocesa imagen para OCR - VERSIÓN OPTIMIZADA (as_array=True devuelve el array numpy)"""
     try:
         # OPTIMIZACIÓN: Preprocesamiento más rápido
         img_array = np.array(image)
@@ -48,42 +137,617 @@ def preprocess_image_for_ocr(image):
             binary = clahe.apply(gray)
             _, binary = cv2.threshold(binary, 127, 255, cv2.THRESH_BINARY)
 
-        return Image.fromarray(binary)
+        return binary if as_array else Image.fromarray(binary)
 
     except Exception as e:
         print(f"   ⚠️ Error en preprocesamiento: {str(e)}")
         # Fallback: devolver imagen original
-        return image
+        return np.asarray(image) if as_array else image
 
-def extract_text_with_vision_api(image, api_key):
-    """Extrae texto usando OpenAI Vision API - OPTIMIZADO"""
-    if not api_key:
-        return ""
+class OCRBackend(ABC):
+    """
+    Interfaz de motor de OCR. Acepta imágenes PIL o arrays numpy
+    (escala de grises o RGB) tal como salen de preprocess_image_for_ocr.
+    """
+
+    @property
+    @abstractmethod
+    def name(self):
+        """Nombre del motor (aparece en las estadísticas de extracción)"""
+
+    @abstractmethod
+    def image_to_string(self, image, psm, timeout=0, variables=None):
+        """Texto reconocido en la imagen"""
+
+    @abstractmethod
+    def image_to_data(self, image, psm, timeout=0):
+        """Palabras reconocidas en el formato de pytesseract.Output.DICT"""
+
+class PytesseractBackend(OCRBackend):
+    """Motor de respaldo: un proceso tesseract + archivo temporal por llamada"""
+
+    name = "pytesseract"
+
+    @staticmethod
+    def _config(psm, variables=None):
+        config = f'--oem 3 --psm {psm}'
+        for key, value in (variables or {}).items():
+            config += ' -c ' + shlex.quote(f'{key}={value}')  # pytesseract separa con shlex
+        return config
+
+    def image_to_string(self, image, psm, timeout=0, variables=None):
+        return pytesseract.image_to_string(image, lang=OCR_LANG, config=self._config(psm, variables), timeout=timeout)
+
+    def image_to_data(self, image, psm, timeout=0):
+        return pytesseract.image_to_data(
+            image,
+            lang=OCR_LANG,
+            config=self._config(psm),
+            timeout=timeout,
+            output_type=pytesseract.Output.DICT
+        )
 
+class TesserocrBackend(OCRBackend):
+    """
+    Motor persistente en proceso (tesserocr): los modelos de idioma se cargan una
+    sola vez por worker y las imágenes se pasan en memoria, sin subproceso ni archivo temporal.
+    """
+
+    name = "tesserocr"
+
+    def __init__(self):
+        import tesserocr
+        self._tesserocr = tesserocr
+        self._api = tesserocr.PyTessBaseAPI(lang=OCR_LANG, oem=tesserocr.OEM.DEFAULT)
+        self._lock = threading.Lock()
+
+    def _set_image(self, image, psm):
+        self._api.SetPageSegMode(psm)
+        if isinstance(image, np.ndarray):
+            array = np.ascontiguousarray(image)
+            bytes_per_pixel = 1 if array.ndim == 2 else array.shape[2]
+            height, width = array.shape[:2]
+            self._api.SetImageBytes(array.tobytes(), width, height, bytes_per_pixel, width * bytes_per_pixel)
+        else:
+            self._api.SetImage(image)
+
+    def _recognize(self, timeout):
+        if not self._api.Recognize(int(timeout * 1000) if timeout else 0):
+            raise RuntimeError("Tesseract: reconocimiento cancelado o tiempo agotado")
+
+    def image_to_string(self, image, psm, timeout=0, variables=None):
+        with self._lock:
+            variables = variables or {}
+            try:
+                for key, value in variables.items():
+                    self._api.SetVariable(key, str(value))
+                self._set_image(image, psm)
+                self._recognize(timeout)
+                return self._api.GetUTF8Text()
+            finally:
+                for key in variables:
+                    self._api.SetVariable(key, "")
+                self._api.Clear()
+
+    def image_to_data(self, image, psm, timeout=0):
+        RIL = self._tesserocr.RIL
+        data = {key: [] for key in ('block_num', 'par_num', 'line_num', 'left', 'top', 'width', 'height', 'conf', 'text')}
+        with self._lock:
+            try:
+                self._set_image(image, psm)
+                self._recognize(timeout)
+                iterator = self._api.GetIterator()
+                block_num = par_num = line_num = 0
+                if iterator is None:
+                    return data
+                while True:
+                    if iterator.IsAtBeginningOf(RIL.BLOCK):
+                        block_num, par_num, line_num = block_num + 1, 0, 0
+                    if iterator.IsAtBeginningOf(RIL.PARA):
+                        par_num, line_num = par_num + 1, 0
+                    if iterator.IsAtBeginningOf(RIL.TEXTLINE):
+                        line_num += 1
+                    word = iterator.GetUTF8Text(RIL.WORD)
+                    box = iterator.BoundingBox(RIL.WORD)
+                    if word and box:
+                        left, top, right, bottom = box
+                        data['block_num'].append(block_num)
+                        data['par_num'].append(par_num)
+                        data['line_num'].append(line_num)
+                        data['left'].append(left)
+                        data['top'].append(top)
+                        data['width'].append(right - left)
+                        data['height'].append(bottom - top)
+                        data['conf'].append(iterator.Confidence(RIL.WORD))
+                        data['text'].append(word)
+                    if not iterator.Next(RIL.WORD):
+                        break
+                return data
+            finally:
+                self._api.Clear()
+
+_ocr_backend = None
+_ocr_backend_lock = threading.Lock()
+
+def create_ocr_backend(name=None):
+    """Crea el motor de OCR indicado (o el configurado), con pytesseract como respaldo"""
+    name = name or OCR_BACKEND
+    if name in ('auto', 'tesserocr'):
+        try:
+            return TesserocrBackend()
+        except Exception as e:
+            if name == 'tesserocr':
+                print(f"   ⚠️ tesserocr no disponible ({str(e)}) - usando pytesseract")
+    return PytesseractBackend()
+
+def get_ocr_backend():
+    """Motor de OCR del proceso actual (uno por worker, inicializado una vez)"""
+    global _ocr_backend
+    with _ocr_backend_lock:
+        if _ocr_backend is None:
+            _ocr_backend = create_ocr_backend()
+        return _ocr_backend
+
+VISION_EXTRACTION_PROMPT = "Extrae TODO el texto visible en este documento. Incluye: datos de tablas, números, fechas, nombres, direcciones, valores monetarios, y cualquier información manuscrita o impresa. Mantén el formato y estructura original."
+
+def new_vision_stats():
+    """Contadores de Vision AI por documento"""
+    return {
+        "llamadas": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "tokens_imagen_estimados": 0,
+        "paginas_detalle_bajo": 0,
+        "paginas_api": 0,
+        "lotes": 0,
+        "llamadas_ahorradas_lote": 0,
+        "lotes_fallidos": 0,
+        "fallos_api": 0,
+        "costo_usd": 0.0,
+        "cache_aciertos_exactos": 0,
+        "cache_aciertos_perceptuales": 0,
+        "cache_fallos": 0,
+        "usd_ahorrados_cache": 0.0
+    }
+
+_vision_stats_lock = threading.Lock()
+
+def _record_vision_usage(usage, response):
+    """Acumula tokens y costo de una respuesta de Vision AI"""
+    if usage is None or not getattr(response, 'usage', None):
+        return 0.0
+    prompt_tokens = response.usage.prompt_tokens or 0
+    completion_tokens = response.usage.completion_tokens or 0
+    cost = (prompt_tokens / 1_000_000) * PRECIO_INPUT_POR_1M_TOKENS + (completion_tokens / 1_000_000) * PRECIO_OUTPUT_POR_1M_TOKENS
+    with _vision_stats_lock:
+        usage["llamadas"] += 1
+        usage["prompt_tokens"] += prompt_tokens
+        usage["completion_tokens"] += completion_tokens
+        usage["costo_usd"] += cost
+    return cost
+
+def page_image_hashes(image, hash_size=16):
+    """
+    Hashes de una página renderizada: SHA-256 exacto de los píxeles y
+    dHash perceptual de hash_size² bits (tolerante a ruido de escaneo).
+    """
+    exact = hashlib.sha256(
+        f"{image.mode}{image.size}".encode() + image.tobytes()
+    ).hexdigest()
+    return exact, page_dhash(image, hash_size)
+
+def page_dhash(image, hash_size=16):
+    """dHash perceptual de hash_size² bits: diferencias entre píxeles vecinos de la miniatura"""
+    small = np.asarray(image.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS), dtype=np.int16)
+    bits = np.packbits(small[:, 1:] > small[:, :-1])
+    return int.from_bytes(bits.tobytes(), 'big')
+
+_VISION_CALL_KEYS = (
+    "llamadas", "prompt_tokens", "completion_tokens", "tokens_imagen_estimados",
+    "paginas_detalle_bajo", "paginas_api", "fallos_api", "costo_usd"
+)
+
+def _vision_cache_lookup(image, ocr_text, vision_stats):
+    """Busca una página en la caché de Vision AI. Devuelve (texto o None, hashes o None)"""
+    from modules.extraction_cache import vision_page_cache, VISION_CACHE_ENABLED
+
+    if not VISION_CACHE_ENABLED:
+        return None, None
     try:
-        print("   🤖 Optimizando imagen para Vision API...")
+        hashes = page_image_hashes(image)
+        cached_text, hit_type, original_cost = vision_page_cache.lookup(hashes[0], hashes[1], ocr_text)
+        if cached_text is not None:
+            with _vision_stats_lock:
+                vision_stats[f"cache_aciertos_{'exactos' if hit_type == 'exacto' else 'perceptuales'}"] += 1
+                vision_stats["usd_ahorrados_cache"] += original_cost
+            print(f"   ♻️ Vision AI desde caché ({hit_type}): {len(cached_text)} caracteres")
+            return cached_text, hashes
+        with _vision_stats_lock:
+            vision_stats["cache_fallos"] += 1
+        return None, hashes
+    except Exception as e:
+        print(f"   ⚠️ Caché de Vision AI no disponible: {str(e)}")
+        return None, None
+
+def _vision_cache_store(hashes, text, ocr_text, cost_usd):
+    from modules.extraction_cache import vision_page_cache
+
+    if hashes and text and len(text.strip()) > 15:
+        vision_page_cache.store(hashes[0], hashes[1], text, ocr_text, cost_usd)
 
-        # OPTIMIZACIÓN 1: Redimensionar imagen para reducir tiempo de procesamiento
-        max_size = 2048  # Máximo 2048px en cualquier dimensión
+def _merge_vision_usage(vision_stats, call_usage):
+    with _vision_stats_lock:
+        for key in _VISION_CALL_KEYS:
+            vision_stats[key] += call_usage[key]
+
+def vision_text_for_page(image, api_key, ocr_text="", vision_stats=None):
+    """
+    Transcribe una página con Vision AI reutilizando la caché de páginas
+    (exacta o perceptual) cuando el mismo formato ya se transcribió antes.
+    """
+    vision_stats = vision_stats if vision_stats is not None else new_vision_stats()
+    cached_text, hashes = _vision_cache_lookup(image, ocr_text, vision_stats)
+    if cached_text is not None:
+        return cached_text
+
+    call_usage = new_vision_stats()
+    text = extract_text_with_vision_api(image, api_key, call_usage, ocr_text)
+    _merge_vision_usage(vision_stats, call_usage)
+    _vision_cache_store(hashes, text, ocr_text, call_usage["costo_usd"])
+    return text
+
+def vision_text_for_pages(pages, api_key, vision_stats=None):
+    """
+    Transcribe varias páginas consecutivas [(índice, imagen, texto_ocr), ...] en una sola
+    llamada de Vision AI. Las páginas en caché no se envían; si la respuesta no se puede
+    separar por página, se repite con una llamada por página. Devuelve {índice: texto}.
+    """
+    vision_stats = vision_stats if vision_stats is not None else new_vision_stats()
+    texts = {}
+    misses = []
+    for page_index, image, ocr_text in pages:
+        cached_text, hashes = _vision_cache_lookup(image, ocr_text, vision_stats)
+        if cached_text is not None:
+            texts[page_index] = cached_text
+        else:
+            misses.append((page_index, image, ocr_text, hashes))
+
+    if len(misses) > 1:
+        call_usage = new_vision_stats()
+        batch_texts = extract_text_with_vision_api_batch(
+            [image for _, image, _, _ in misses], api_key, call_usage, [ocr_text for _, _, ocr_text, _ in misses]
+        )
+        _merge_vision_usage(vision_stats, call_usage)
+        if batch_texts is not None:
+            with _vision_stats_lock:
+                vision_stats["lotes"] += 1
+                vision_stats["llamadas_ahorradas_lote"] += len(misses) - 1
+            page_cost = call_usage["costo_usd"] / len(misses)
+            for (page_index, _, ocr_text, hashes), text in zip(misses, batch_texts):
+                texts[page_index] = text
+                _vision_cache_store(hashes, text, ocr_text, page_cost)
+            return texts
+        with _vision_stats_lock:
+            vision_stats["lotes_fallidos"] += 1
+        print(f"   ↩️ Lote de {len(misses)} páginas no separable: reintento página a página")
+
+    for page_index, image, ocr_text, hashes in misses:
+        call_usage = new_vision_stats()
+        text = extract_text_with_vision_api(image, api_key, call_usage, ocr_text)
+        _merge_vision_usage(vision_stats, call_usage)
+        _vision_cache_store(hashes, text, ocr_text, call_usage["costo_usd"])
+        texts[page_index] = text
+    return texts
+
+def should_use_vision_ai(page_num, ocr_result, total_pages):
+    """
+    Determina inteligentemente cuándo usar Vision AI.
+    Devuelve (usar, motivo, prioridad); a mayor prioridad, antes se gasta el presupuesto.
+    """
+    # SIEMPRE usar Vision AI si:
+
+    # 1. OCR extrajo poco o nada
+    if not ocr_result or len(ocr_result.strip()) < VISION_OCR_MIN_CHARS:
+        return True, "OCR insuficiente", 5
+
+    # 2. Detectar contenido complejo (tablas, formularios, números)
+    complex_indicators = ['│', '┌', '┐', '└', '┘', '├', '┤', '┬', '┴', '┼']
+    numeric_density = sum(1 for char in ocr_result if char.isdigit()) / len(ocr_result)
+
+    if any(indicator in ocr_result for indicator in complex_indicators):
+        return True, "Tablas detectadas", 4
+
+    if numeric_density > 0.1:  # Más del 10% números
+        return True, "Alto contenido numérico", 3
+
+    # 3. Contenido legal/contractual crítico
+    legal_keywords = ['contrato', 'valor', 'presupuesto', 'nit', 'entidad', 
+                    'cronograma', 'plazo', 'anexo', 'requisitos', 'firma']
+    if any(keyword in ocr_result.lower() for keyword in legal_keywords):
+        return True, "Contenido legal crítico", 2
+
+    # 4. Primera y última página siempre (información clave)
+    if page_num == 1 or page_num == total_pages:
+        return True, "Página crítica (primera/última)", 2
+
+    # 5. Páginas cada 3 para documentos largos (sampling inteligente)
+    if total_pages > 10 and page_num % 3 == 0:
+        return True, "Muestreo en documento largo", 1
+
+    return False, "No requerido", 0
+
+class VisionDispatcher:
+    """
+    Despacha las llamadas de Vision AI de un documento en paralelo mientras el OCR
+    continúa con las páginas siguientes, respetando un presupuesto por documento
+    (máximo de páginas y/o de USD) y priorizando las páginas mejor puntuadas.
+    """
+
+    def __init__(self, api_key, file_content, vision_stats, max_pages=VISION_MAX_PAGES, max_usd=VISION_MAX_USD,
+                 batch_size=VISION_BATCH_SIZE):
+        self.api_key = api_key
+        self.file_content = file_content
+        self.vision_stats = vision_stats
+        self.max_pages = max_pages
+        self.max_usd = max_usd
+        self.batch_size = batch_size
+        # La admisión (llamadas en vuelo y límites de tasa) es del planificador: el pool
+        # solo necesita tantos hilos como llamadas puede tener en vuelo
+        self.concurrency = get_openai_scheduler().max_in_flight
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency)
+        self.futures = {}
+        self.reasons = {}
+        self.deferred = []
+        self.deferred_pages = set()
+        self.batch = []
+        self.skipped = 0
+
+    @property
+    def limited(self):
+        return self.max_pages > 0 or self.max_usd > 0
+
+    def _estimated_page_cost(self):
+        with _vision_stats_lock:
+            pages = self.vision_stats["paginas_api"]
+            spent = self.vision_stats["costo_usd"]
+        return spent / pages if pages else VISION_ESTIMATED_CALL_USD
+
+    def _budget_allows(self):
+        if self.max_pages > 0 and len(self.reasons) >= self.max_pages:
+            return False
+        if self.max_usd > 0:
+            # Páginas reservadas aún sin enviar + páginas con llamada en curso
+            reserved = len(self.reasons) - len(self.futures)
+            in_flight = reserved + sum(1 for f in self.futures.values() if not f.done())
+            with _vision_stats_lock:
+                spent = self.vision_stats["costo_usd"]
+            committed = spent + (in_flight + 1) * self._estimated_page_cost()
+            if committed > self.max_usd:
+                return False
+        return True
+
+    def _call(self, pages):
+        rendered = []
+        for page_index, image, ocr_text in pages:
+            if image is None:
+                image = render_pdf_page(self.file_content, page_index)
+                if image is None:
+                    continue
+            rendered.append((page_index, image, ocr_text))
+        if len(rendered) == 1:
+            page_index, image, ocr_text = rendered[0]
+            return {page_index: vision_text_for_page(image, self.api_key, ocr_text, self.vision_stats)}
+        return vision_text_for_pages(rendered, self.api_key, self.vision_stats)
+
+    def flush(self):
+        """Envía el lote en construcción (p. ej. cuando la página siguiente no necesita Vision AI)"""
+        if not self.batch:
+            return
+        pages, self.batch = self.batch, []
+        future = self.executor.submit(self._call, pages)
+        for page_index, _, _ in pages:
+            self.futures[page_index] = future
+
+        # Contrapresión: no acumular imágenes si Vision va más lento que el OCR
+        pending = {f for f in self.futures.values() if not f.done()}
+        if len(pending) > self.concurrency * 2:
+            concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+
+    def _enqueue(self, page_index, image, ocr_text):
+        # Solo se agrupan páginas consecutivas, hasta batch_size por llamada
+        if self.batch and self.batch[-1][0] + 1 != page_index:
+            self.flush()
+        self.batch.append((page_index, image, ocr_text))
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def _submit(self, page_index, image, ocr_text, reason):
+        if not self._budget_allows():
+            self.skipped += 1
+            print(f"   💰 Vision AI omitido en página {page_index + 1}: presupuesto del documento agotado")
+            return False
+        self.reasons[page_index] = reason
+        if image is not None:
+            self._enqueue(page_index, image, ocr_text)
+        return True
+
+    def offer(self, page_index, image, ocr_text, priority, reason):
+        """Propone una página; se despacha ya o se difiere hasta conocer todas las prioridades"""
+        if not self.limited or priority >= VISION_EAGER_PRIORITY:
+            self._submit(page_index, image, ocr_text, reason)
+        else:
+            # Sin imagen en memoria: se vuelve a renderizar si resulta seleccionada
+            heapq.heappush(self.deferred, (-priority, page_index, ocr_text, reason))
+            self.deferred_pages.add(page_index)
+
+    def poll(self, page_index):
+        """
+        Texto de Vision AI de una página ya terminada, sin bloquear.
+        None si sigue en curso o diferida; "" si el presupuesto la descartó.
+        """
+        future = self.futures.get(page_index)
+        if future is None:
+            return None if page_index in self.reasons or page_index in self.deferred_pages else ""
+        if not future.done():
+            return None
+        try:
+            return future.result().get(page_index, "")
+        except Exception as e:
+            print(f"   ❌ Vision API falló en página {page_index + 1}: {str(e)}")
+            with _vision_stats_lock:
+                self.vision_stats["fallos_api"] += 1
+            return ""
+
+    def results(self):
+        """Gasta el presupuesto restante por prioridad y devuelve {página: texto} en orden"""
+        self.flush()
+        selected = []
+        while self.deferred:
+            _, page_index, ocr_text, reason = heapq.heappop(self.deferred)
+            self.deferred_pages.discard(page_index)
+            if self._submit(page_index, None, ocr_text, reason):
+                selected.append((page_index, ocr_text))
+
+        # Las páginas diferidas elegidas se envían en orden para poder agruparlas
+        for page_index, ocr_text in sorted(selected):
+            self._enqueue(page_index, None, ocr_text)
+        self.flush()
+
+        texts = {}
+        for page_index in sorted(self.futures):
+            try:
+                texts[page_index] = self.futures[page_index].result().get(page_index, "")
+            except Exception as e:
+                print(f"   ❌ Vision API falló en página {page_index + 1}: {str(e)}")
+                with _vision_stats_lock:
+                    self.vision_stats["fallos_api"] += 1
+                texts[page_index] = ""
+        self.executor.shutdown(wait=True)
+        with _vision_stats_lock:
+            self.vision_stats["paginas_enviadas"] = len(self.futures)
+            self.vision_stats["omitidas_por_presupuesto"] = self.skipped
+        return texts
+
+def estimate_vision_image_tokens(width, height, detail="high"):
+    """
+    Tokens de imagen que cobra la API: con detalle alto la imagen se ajusta a 2048x2048,
+    el lado corto se lleva a 768 px y se cobran 170 tokens por tile de 512 px + 85 base.
+    """
+    if detail == "low":
+        return VISION_BASE_TOKENS
+    width, height = _vision_server_size(width, height)
+    tiles = math.ceil(width / VISION_TILE_SIZE) * math.ceil(height / VISION_TILE_SIZE)
+    return VISION_BASE_TOKENS + VISION_TOKENS_PER_TILE * tiles
+
+def _vision_server_size(width, height):
+    """Tamaño al que la API reescala una imagen en detalle alto"""
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+def _tile_optimal_size(width, height):
+    """
+    Tamaño que minimiza el número de tiles sin reducir la imagen por debajo de
+    VISION_MIN_SCALE respecto a lo que la API usaría de todos modos.
+    """
+    base_w, base_h = _vision_server_size(width, height)
+    candidates = {1.0}
+    for side in (base_w, base_h):
+        for k in range(1, math.ceil(side / VISION_TILE_SIZE) + 1):
+            scale = k * VISION_TILE_SIZE / side
+            if VISION_MIN_SCALE <= scale < 1.0:
+                candidates.add(scale)
+
+    def tiles(scale):
+        return math.ceil(int(base_w * scale) / VISION_TILE_SIZE) * math.ceil(int(base_h * scale) / VISION_TILE_SIZE)
+
+    best = min(candidates, key=lambda scale: (tiles(scale), -scale))
+    return max(1, int(base_w * best)), max(1, int(base_h * best))
+
+def prepare_image_for_vision(image, ocr_text=None):
+    """
+    Prepara una página para Vision AI con el mínimo de tokens legible:
+    recorta márgenes en blanco, pasa a escala de grises, ajusta a la rejilla de tiles
+    y elige detalle 'low' para páginas con poco contenido (poca tinta en un área pequeña).
+    Las páginas que el OCR no pudo leer (manuscritas, fotografiadas, formularios) van
+    siempre en detalle alto: justamente por eso se envían a Vision AI.
+    Devuelve (imagen, detalle, tokens_estimados).
+    """
+    gray = image.convert('L')
+    pixels = np.asarray(gray)
+    ink = pixels < 200
+
+    # Recortar márgenes en blanco (con un pequeño margen de seguridad)
+    rows = np.flatnonzero(ink.any(axis=1))
+    cols = np.flatnonzero(ink.any(axis=0))
+    if rows.size and cols.size:
+        pad = 12
+        box = (
+            max(int(cols[0]) - pad, 0), max(int(rows[0]) - pad, 0),
+            min(int(cols[-1]) + pad + 1, gray.width), min(int(rows[-1]) + pad + 1, gray.height)
+        )
+        content_area = (box[2] - box[0]) * (box[3] - box[1]) / float(gray.width * gray.height)
+        gray = gray.crop(box)
+        ink_ratio = float(ink[box[1]:box[3], box[0]:box[2]].mean())
+    else:
+        ink_ratio, content_area = 0.0, 0.0
+
+    detail = "high"
+    ocr_read_page = ocr_text is not None and len(ocr_text.strip()) >= VISION_OCR_MIN_CHARS
+    if ocr_read_page and ink_ratio < VISION_LOW_DETAIL_MAX_INK and content_area < VISION_LOW_DETAIL_MAX_AREA:
+        detail = "low"
+
+    if detail == "low":
+        scale = min(1.0, 512 / max(gray.width, gray.height))
+    else:
+        target_w, target_h = _tile_optimal_size(gray.width, gray.height)
+        scale = min(1.0, target_w / gray.width)
+    if scale < 1.0:
+        gray = gray.resize((max(1, int(gray.width * scale)), max(1, int(gray.height * scale))), Image.LANCZOS)
+
+    return gray, detail, estimate_vision_image_tokens(gray.width, gray.height, detail)
+
+def encode_image_for_vision(image, ocr_text=None, optimize=VISION_OPTIMIZE_IMAGES):
+    """Codifica una página como data URL JPEG. Devuelve (url, detalle, tokens_estimados)"""
+    if optimize:
+        image, detail, tokens = prepare_image_for_vision(image, ocr_text)
+    else:
+        # Preparación original: máximo 2048px, color, siempre detalle alto
+        max_size = 2048
         if image.width > max_size or image.height > max_size:
             ratio = min(max_size / image.width, max_size / image.height)
-            new_size = (int(image.width * ratio), int(image.height * ratio))
-            image = image.resize(new_size, Image.LANCZOS)
-            print(f"   📏 Imagen redimensionada a {new_size}")
-
-        # OPTIMIZACIÓN 2: Comprimir imagen para reducir tamaño del payload
-        buffered = io.BytesIO()
-        # Usar JPEG con calidad 85 en lugar de PNG para reducir tamaño
+            image = image.resize((int(image.width * ratio), int(image.height * ratio)), Image.LANCZOS)
         if image.mode in ('RGBA', 'LA', 'P'):
             image = image.convert('RGB')
-        image.save(buffered, format="JPEG", quality=85, optimize=True)
-        img_base64 = base64.b64encode(buffered.getvalue()).decode()
+        detail = "high"
+        tokens = estimate_vision_image_tokens(image.width, image.height, detail)
+
+    # Comprimir imagen para reducir tamaño del payload
+    buffered = io.BytesIO()
+    image.save(buffered, format="JPEG", quality=85, optimize=True)
+    img_base64 = base64.b64encode(buffered.getvalue()).decode()
+    print(f"   📦 Imagen {image.width}x{image.height} ({detail}): {len(img_base64)/1024:.1f} KB, ~{tokens} tokens de imagen")
+    return f"data:image/jpeg;base64,{img_base64}", detail, tokens
+
+def extract_text_with_vision_api(image, api_key, usage=None, ocr_text=None, optimize=VISION_OPTIMIZE_IMAGES):
+    """Extrae texto usando OpenAI Vision API - OPTIMIZADO"""
+    if not api_key:
+        return ""
 
-        print(f"   📦 Imagen comprimida: {len(img_base64)/1024:.1f} KB")
+    try:
+        print("   🤖 Optimizando imagen para Vision API...")
+        image_url, detail, image_tokens = encode_image_for_vision(image, ocr_text, optimize)
+        if usage is not None:
+            with _vision_stats_lock:
+                usage["tokens_imagen_estimados"] = usage.get("tokens_imagen_estimados", 0) + image_tokens
+                usage["paginas_api"] = usage.get("paginas_api", 0) + 1
+                if detail == "low":
+                    usage["paginas_detalle_bajo"] = usage.get("paginas_detalle_bajo", 0) + 1
 
-        client = openai.OpenAI(api_key=api_key)
+        client = get_openai_scheduler().sync_client(api_key, "vision")
 
-        # OPTIMIZACIÓN 3: Prompt específico para extraer TODA la información
+        # Prompt específico para extraer TODA la información
         response = client.chat.completions.create(
             model="gpt-4o-mini",  # Usar gpt-4o-mini (más rápido y económico)
             messages=[
@@ -92,13 +756,13 @@ def extract_text_with_vision_api(image, api_key):
                     "content": [
                         {
                             "type": "text",
-                            "text": "Extrae TODO el texto visible en este documento. Incluye: datos de tablas, números, fechas, nombres, direcciones, valores monetarios, y cualquier información manuscrita o impresa. Mantén el formato y estructura original."
+                            "text": VISION_EXTRACTION_PROMPT
                         },
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/jpeg;base64,{img_base64}",
-                                "detail": "high"  # CAMBIO: Usar detalle alto para máxima precisión
+                                "url": image_url,
+                                "detail": detail
                             }
                         }
                     ]
@@ -109,444 +773,1391 @@ def extract_text_with_vision_api(image, api_key):
             timeout=45  # AUMENTAR timeout para documentos complejos
         )
 
+        _record_vision_usage(usage, response)
         result = response.choices[0].message.content.strip()
         print(f"   ✅ Vision API completado: {len(result)} caracteres")
         return result
 
     except Exception as e:
         print(f"   ❌ Vision API falló: {str(e)}")
+        if usage is not None:
+            with _vision_stats_lock:
+                usage["fallos_api"] = usage.get("fallos_api", 0) + 1
         return ""
 
-def extract_text_from_pdf(file_content, api_key=None):
-    """Extrae texto de PDF usando OCR + Vision AI - PRIORIDAD MÁXIMA A VISION AI"""
-    print("   🔧 INICIANDO EXTRACCIÓN AVANZADA DE PDF...")
-    print(f"   📊 Tamaño archivo: {len(file_content)/1024:.1f} KB")
-    print(f"   🤖 Vision AI: {'HABILITADO' if api_key else 'DESHABILITADO'}")
+def extract_text_with_vision_api_batch(images, api_key, usage=None, ocr_texts=None, optimize=VISION_OPTIMIZE_IMAGES):
+    """
+    Extrae el texto de 2-4 páginas consecutivas en una sola llamada de Vision API
+    (un solo prompt de instrucciones). Devuelve una lista de textos por página,
+    o None si la llamada falla o la respuesta no se puede separar por página.
+    """
+    if not api_key or not images:
+        return None
 
+    ocr_texts = ocr_texts or [None] * len(images)
     try:
-        # Método 1: Extraer texto nativo con PyPDF2
-        print("   📖 Método 1: Extracción de texto nativo...")
-        native_text = ""
-        try:
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content))
-
-            if pdf_reader.is_encrypted:
-                print("   🔒 PDF está encriptado - intentando sin contraseña...")
-                try:
-                    pdf_reader.decrypt("")
-                except:
-                    print("   ❌ No se pudo desencriptar el PDF")
-
-            for page_num, page in enumerate(pdf_reader.pages):
-                try:
-                    page_text = page.extract_text()
-                    if page_text.strip():
-                        native_text += page_text + "\n"
-                        print(f"   ✅ Página {page_num + 1}: {len(page_text)} caracteres extraídos")
-                    else:
-                        print(f"   ⚠️ Página {page_num + 1}: Sin texto extraíble")
-                except Exception as e:
-                    print(f"   ❌ Error en página {page_num + 1}: {str(e)}")
-                    continue
+        print(f"   🤖 Vision API por lotes: {len(images)} páginas en una llamada...")
+        content = [{
+            "type": "text",
+            "text": (
+                f"{VISION_EXTRACTION_PROMPT}\n\nRecibirás {len(images)} imágenes, una por página. "
+                f"Para cada imagen, en orden, escribe primero una línea exacta '=== PÁGINA k ===' "
+                f"(k de 1 a {len(images)}) y luego el texto de esa página. No omitas ninguna página."
+            )
+        }]
+        for k, (image, ocr_text) in enumerate(zip(images, ocr_texts), 1):
+            image_url, detail, image_tokens = encode_image_for_vision(image, ocr_text, optimize)
+            if usage is not None:
+                with _vision_stats_lock:
+                    usage["tokens_imagen_estimados"] = usage.get("tokens_imagen_estimados", 0) + image_tokens
+                    usage["paginas_api"] = usage.get("paginas_api", 0) + 1
+                    if detail == "low":
+                        usage["paginas_detalle_bajo"] = usage.get("paginas_detalle_bajo", 0) + 1
+            content.append({"type": "text", "text": f"PÁGINA {k}:"})
+            content.append({"type": "image_url", "image_url": {"url": image_url, "detail": detail}})
+
+        client = get_openai_scheduler().sync_client(api_key, "vision")
+        response = client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[{"role": "user", "content": content}],
+            max_tokens=min(3000 * len(images), 16000),
+            temperature=0.0,
+            timeout=45 + 30 * (len(images) - 1)
+        )
 
-            if native_text.strip() and len(native_text.strip()) > 100:
-                print(f"   ✅ Método 1 exitoso: {len(native_text)} caracteres")
-                # SIEMPRE probar Vision AI también para documentos complejos
-                if api_key:
-                    print("   🤖 Complementando con Vision AI para mayor precisión...")
-                else:
-                    return native_text
-            else:
-                print("   ⚠️ Método 1: Texto insuficiente, REQUIERE OCR+Vision AI...")
+        _record_vision_usage(usage, response)
+        texts = split_batch_response(response.choices[0].message.content, len(images))
+        if texts is None:
+            print(f"   ⚠️ Vision API por lotes: delimitadores de página no reconocidos")
+            return None
+        print(f"   ✅ Vision API por lotes completado: {', '.join(str(len(t)) for t in texts)} caracteres")
+        return texts
 
+    except Exception as e:
+        print(f"   ❌ Vision API por lotes falló: {str(e)}")
+        return None
+
+def _remaining_time(deadline):
+    """Segundos restantes hasta deadline (0 = sin límite para pytesseract)"""
+    if deadline is None:
+        return 0
+    return deadline - time.monotonic()
+
+def ocr_page_cascade(processed_image, timeout=OCR_PAGE_TIMEOUT, backend=None):
+    """OCR en cascada: prueba OCR_CASCADE_PSMS hasta obtener más de 20 caracteres"""
+    backend = backend or get_ocr_backend()
+    deadline = time.monotonic() + timeout if timeout else None
+    page_text = ""
+
+    for psm in OCR_CASCADE_PSMS:
+        remaining = _remaining_time(deadline)
+        if deadline and remaining <= 0:
+            print(f"   ⏰ OCR: tiempo por página agotado ({timeout:.0f}s)")
+            break
+        try:
+            page_text = backend.image_to_string(processed_image, psm, remaining)
+            if page_text.strip() and len(page_text.strip()) > 20:
+                break
         except Exception as e:
-            print(f"   ❌ Método 1 falló: {str(e)}")
-            native_text = ""
+            print(f"   ⚠️ OCR psm {psm} falló: {str(e)}")
+            continue
+
+    return page_text
+
+def _join_block_lines(lines):
+    """Reconstruye el texto de un bloque a partir de {(párrafo, línea): [palabras]}"""
+    text_lines = []
+    previous_par = None
+    for par_num, line_num in sorted(lines):
+        if previous_par is not None and par_num != previous_par:
+            text_lines.append("")
+        text_lines.append(" ".join(lines[(par_num, line_num)]))
+        previous_par = par_num
+    return "\n".join(text_lines)
+
+def ocr_blocks(image, psm, timeout=0, backend=None):
+    """
+    Una pasada de Tesseract con image_to_data (TSV).
+    Devuelve los bloques de texto en orden de lectura con su confianza media y caja.
+    """
+    data = (backend or get_ocr_backend()).image_to_data(image, psm, timeout)
+    blocks = {}
+    for i, word in enumerate(data['text']):
+        word = (word or "").strip()
+        confidence = float(data['conf'][i])
+        if not word or confidence < 0:
+            continue
+        block = blocks.setdefault(data['block_num'][i], {"lines": {}, "confs": [], "box": [None, None, 0, 0]})
+        block["lines"].setdefault((data['par_num'][i], data['line_num'][i]), []).append(word)
+        block["confs"].append(confidence)
+        left, top = data['left'][i], data['top'][i]
+        box = block["box"]
+        box[0] = left if box[0] is None else min(box[0], left)
+        box[1] = top if box[1] is None else min(box[1], top)
+        box[2] = max(box[2], left + data['width'][i])
+        box[3] = max(box[3], top + data['height'][i])
+
+    return [
+        {
+            "texto": _join_block_lines(blocks[block_num]["lines"]),
+            "confianza": sum(blocks[block_num]["confs"]) / len(blocks[block_num]["confs"]),
+            "palabras": len(blocks[block_num]["confs"]),
+            "caja": tuple(blocks[block_num]["box"])
+        }
+        for block_num in sorted(blocks)
+    ]
+
+def ocr_page_confidence(processed_image, timeout=OCR_PAGE_TIMEOUT, details=None, backend=None):
+    """
+    OCR guiado por confianza: una pasada de análisis de diseño y solo las regiones
+    con confianza media baja se reprocesan con otra segmentación de página.
+    """
+    backend = backend or get_ocr_backend()
+    if not isinstance(processed_image, np.ndarray):
+        processed_image = np.asarray(processed_image)
+    height, width = processed_image.shape[:2]
+    deadline = time.monotonic() + timeout if timeout else None
+    reprocessed = 0
 
-        # Método 2: OCR optimizado para PDFs escaneados
-        print("   🔍 Método 2: OCR optimizado...")
+    try:
+        blocks = ocr_blocks(processed_image, OCR_LAYOUT_PSM, _remaining_time(deadline), backend)
+    except Exception as e:
+        print(f"   ⚠️ OCR por confianza falló ({str(e)}) - usando cascada")
+        return ocr_page_cascade(processed_image, max(_remaining_time(deadline), 1) if deadline else 0, backend)
+
+    if not blocks:
+        # El análisis de diseño no encontró texto: toda la página es la región dudosa
+        blocks = [{"texto": "", "confianza": 0.0, "palabras": 0, "caja": (0, 0, width, height)}]
+
+    for block in blocks:
+        if block["confianza"] >= OCR_MIN_CONFIDENCE:
+            continue
+        remaining = _remaining_time(deadline)
+        if deadline and remaining <= 0:
+            print(f"   ⏰ OCR: tiempo por página agotado ({timeout:.0f}s)")
+            break
+        left, top, right, bottom = block["caja"]
+        pad = 10
+        region = processed_image[max(top - pad, 0):min(bottom + pad, height), max(left - pad, 0):min(right + pad, width)]
         try:
-            images = None
-            # OPTIMIZACIÓN: Usar configuración más eficiente
-            dpi_configs = [150, 200]  # Reducir opciones DPI para mayor velocidad
-
-            for dpi in dpi_configs:
-                try:
-                    print(f"   📸 Convirtiendo con DPI {dpi} optimizado...")
-                    # OPTIMIZACIÓN: Usar JPEG en lugar de PNG (más rápido)
-                    images = convert_from_bytes(
-                        file_content, 
-                        dpi=dpi, 
-                        fmt='jpeg',
-                        jpegopt={"quality": 85, "progressive": True}
-                    )
-                    print(f"   ✅ Conversión exitosa: {len(images)} páginas")
-                    break
-                except Exception as e:
-                    print(f"   ⚠️ DPI {dpi} falló: {str(e)}")
-                    continue
-
-            if not images:
-                print("   ❌ No se pudo convertir PDF a imágenes")
-                return ""
-
-            ocr_text = ""
-            vision_text = ""
-
-            # 🚀 PROCESAMIENTO HÍBRIDO INTELIGENTE: OCR + Vision AI sin límites
-            print(f"   🔄 Iniciando procesamiento híbrido inteligente...")
-            print(f"   📄 Total páginas a procesar: {len(images)} (SIN LÍMITES)")
-
-            def should_use_vision_ai(page_num, ocr_result, total_pages):
-                """Determina inteligentemente cuándo usar Vision AI"""
-                # SIEMPRE usar Vision AI si:
-
-                # 1. OCR extrajo poco o nada
-                if not ocr_result or len(ocr_result.strip()) < 50:
-                    return True, "OCR insuficiente"
-
-                # 2. Detectar contenido complejo (tablas, formularios, números)
-                complex_indicators = ['│', '┌', '┐', '└', '┘', '├', '┤', '┬', '┴', '┼']
-                numeric_density = sum(1 for char in ocr_result if char.isdigit()) / len(ocr_result)
-
-                if any(indicator in ocr_result for indicator in complex_indicators):
-                    return True, "Tablas detectadas"
-
-                if numeric_density > 0.1:  # Más del 10% números
-                    return True, "Alto contenido numérico"
-
-                # 3. Contenido legal/contractual crítico
-                legal_keywords = ['contrato', 'valor', 'presupuesto', 'nit', 'entidad', 
-                                'cronograma', 'plazo', 'anexo', 'requisitos', 'firma']
-                if any(keyword in ocr_result.lower() for keyword in legal_keywords):
-                    return True, "Contenido legal crítico"
-
-                # 4. Primera y última página siempre (información clave)
-                if page_num == 1 or page_num == total_pages:
-                    return True, "Página crítica (primera/última)"
-
-                # 5. Páginas cada 3 para documentos largos (sampling inteligente)
-                if total_pages > 10 and page_num % 3 == 0:
-                    return True, "Muestreo en documento largo"
-
-                return False, "No requerido"
-
-            for i, image in enumerate(images):
-                print(f"   📄 Procesando página {i+1}/{len(images)}...")
-
-                # PASO 1: OCR Tradicional (siempre primero)
-                try:
-                    processed_image = preprocess_image_for_ocr(image)
-                except Exception as e:
-                    print(f"   ⚠️ Error preprocesando imagen: {str(e)}")
-                    processed_image = image
-
-                page_text = ""
-                ocr_configs = [
-                    r'--oem 3 --psm 6',
-                    r'--oem 3 --psm 3', 
-                    r'--oem 3 --psm 1',
-                ]
-
-                for config in ocr_configs:
-                    try:
-                        page_text = pytesseract.image_to_string(
-                            processed_image, 
-                            lang='spa+eng', 
-                            config=config
-                        )
-                        if page_text.strip() and len(page_text.strip()) > 20:
-                            print(f"   ✅ OCR exitoso: {len(page_text)} caracteres")
-                            break
-                    except Exception as e:
-                        print(f"   ⚠️ OCR config {config} falló: {str(e)}")
-                        continue
-
-                if page_text.strip():
-                    ocr_text += f"\n--- PÁGINA {i+1} (OCR) ---\n{page_text}\n"
-                    print(f"   📝 OCR completado: {len(page_text)} caracteres")
-
-                # PASO 2: Vision AI INTELIGENTE - cuando sea necesario
-                if api_key:
-                    use_vision, reason = should_use_vision_ai(i+1, page_text, len(images))
-
-                    if use_vision:
-                        print(f"   🤖 Vision AI NECESARIO para página {i+1}: {reason}")
-                        try:
-                            vision_page_text = extract_text_with_vision_api(image, api_key)
-                            if vision_page_text and len(vision_page_text.strip()) > 15:
-                                vision_text += f"\n--- PÁGINA {i+1} (Vision AI) ---\n{vision_page_text}\n"
-                                print(f"   ✅ Vision AI exitoso: {len(vision_page_text)} caracteres")
-
-                                # Comparar calidad
-                                if len(vision_page_text.strip()) > len(page_text.strip()) * 1.2:
-                                    print(f"   📈 Vision AI SUPERIOR: +{len(vision_page_text) - len(page_text)} chars")
-                                else:
-                                    print(f"   ⚖️ Vision AI complementario")
-
-                            else:
-                                print(f"   ⚠️ Vision AI: resultado mínimo")
-                        except Exception as e:
-                            print(f"   ❌ Vision API falló: {str(e)}")
-                    else:
-                        print(f"   ⚡ Vision AI omitido: OCR suficiente para esta página")
-                else:
-                    print(f"   ⚠️ Vision AI no disponible (configurar OPENAI_API_KEY)")
-
-            print(f"   📊 Procesamiento híbrido completado:")
-            print(f"      📝 OCR extrajo: {len(ocr_text)} caracteres")
-            print(f"      🤖 Vision AI extrajo: {len(vision_text)} caracteres")
-
-            final_text = ""
-            if ocr_text.strip():
-                final_text += ocr_text
-                print(f"   ✅ OCR total: {len(ocr_text)} caracteres")
-
-            if vision_text.strip():
-                final_text += "\n\n=== TEXTO ADICIONAL (Vision API) ===\n" + vision_text
-                print(f"   ✅ Vision API total: {len(vision_text)} caracteres")
-
-            if final_text.strip():
-                print(f"   🎉 Extracción completada: {len(final_text)} caracteres totales")
-                return final_text
-            else:
-                print("   ❌ Ningún método logró extraer texto")
-                return ""
-
+            retry = ocr_blocks(region, OCR_REGION_PSM, remaining, backend)
         except Exception as e:
-            print(f"   ❌ Método 2 (OCR) falló completamente: {str(e)}")
-            return ""
-
+            print(f"   ⚠️ Reproceso de región falló: {str(e)}")
+            continue
+        reprocessed += 1
+        words = sum(b["palabras"] for b in retry)
+        if not words:
+            continue
+        retry_confidence = sum(b["confianza"] * b["palabras"] for b in retry) / words
+        if retry_confidence > block["confianza"]:
+            block["texto"] = "\n".join(b["texto"] for b in retry)
+            block["confianza"] = retry_confidence
+            block["palabras"] = words
+
+    total_words = sum(b["palabras"] for b in blocks)
+    mean_confidence = sum(b["confianza"] * b["palabras"] for b in blocks) / total_words if total_words else 0.0
+    if details is not None:
+        details["confianza_media"] = round(mean_confidence, 1)
+        details["regiones"] = len(blocks)
+        details["regiones_reprocesadas"] = reprocessed
+
+    return "\n\n".join(b["texto"] for b in blocks if b["texto"].strip())
+
+def ocr_page_image(image, timeout=OCR_PAGE_TIMEOUT, mode=None, backend=None):
+    """OCR de una página: preprocesamiento + modo configurado (confianza o cascada)"""
+    try:
+        processed_image = preprocess_image_for_ocr(image, as_array=True)
     except Exception as e:
-        print(f"   💥 Error crítico en extracción de PDF: {str(e)}")
-        return ""
+        print(f"   ⚠️ Error preprocesando imagen: {str(e)}")
+        processed_image = np.asarray(image)
 
-def extract_text_from_docx(file_content):
-    """Extrae texto de archivos Word"""
+    if (mode or OCR_MODE) == 'cascada':
+        return ocr_page_cascade(processed_image, timeout, backend)
+    return ocr_page_confidence(processed_image, timeout, backend=backend)
+
+def _init_ocr_worker(memory_mb):
+    """Inicializa un worker de OCR: límite de memoria y motor con los idiomas ya cargados"""
+    if memory_mb and memory_mb > 0:
+        try:
+            import resource
+            limit = memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except Exception as e:
+            print(f"   ⚠️ No se pudo aplicar límite de memoria al worker OCR: {str(e)}")
+    get_ocr_backend()
+
+def _ocr_page_worker(page_index, image, timeout):
+    """Tarea ejecutada en el pool de procesos: devuelve (índice, texto)"""
+    return page_index, ocr_page_image(image, timeout)
+
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+_ocr_pool_futures = {}  # pool -> páginas en vuelo de todas las solicitudes
+_retired_ocr_pools = weakref.WeakSet()
+# Margen sobre el timeout de Tesseract: cubre cola de espera + arranque del worker
+OCR_GUARD_TIMEOUT = OCR_PAGE_TIMEOUT * 2 + 30
+
+_ocr_metrics = {
+    "documentos": 0,
+    "paginas": 0,
+    "segundos": 0.0,
+    "timeouts": 0,
+    "errores": 0
+}
+_ocr_metrics_lock = threading.Lock()
+
+def get_ocr_pool():
+    """Obtiene (o crea) el pool de procesos compartido para OCR"""
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            _ocr_pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=OCR_WORKERS,
+                mp_context=multiprocessing.get_context(OCR_START_METHOD),
+                max_tasks_per_child=OCR_MAX_PAGES_PER_WORKER or None,
+                initializer=_init_ocr_worker,
+                initargs=(OCR_WORKER_MEMORY_MB,)
+            )
+            print(f"   👥 Pool OCR iniciado: {OCR_WORKERS} workers ({OCR_START_METHOD}), "
+                  f"reciclaje cada {OCR_MAX_PAGES_PER_WORKER} páginas")
+        return _ocr_pool
+
+def submit_ocr_page(page_index, image):
+    """Encola una página en el pool compartido; devuelve (pool, future)"""
+    pool = get_ocr_pool()
     try:
-        doc = Document(io.BytesIO(file_content))
-        text = ""
-        for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
-        return text
+        future = pool.submit(_ocr_page_worker, page_index, image, OCR_PAGE_TIMEOUT)
     except Exception:
-        return ""
-
-def convert_and_clean_image(image_path: str) -> str:
+        if not is_retired_ocr_pool(pool):
+            retire_ocr_pool(pool)
+            raise
+        # Otra solicitud lo reemplazó entre get_ocr_pool y submit: se usa el nuevo
+        pool = get_ocr_pool()
+        future = pool.submit(_ocr_page_worker, page_index, image, OCR_PAGE_TIMEOUT)
+    with _ocr_pool_lock:
+        futures = _ocr_pool_futures.setdefault(pool, set())
+        futures.add(future)
+    future.add_done_callback(lambda done: _forget_ocr_future(futures, done))
+    return pool, future
+
+def _forget_ocr_future(futures, future):
+    with _ocr_pool_lock:
+        futures.discard(future)
+
+def is_retired_ocr_pool(pool):
+    """True si el pool ya fue reemplazado (por esta u otra solicitud)"""
+    with _ocr_pool_lock:
+        return pool in _retired_ocr_pools
+
+def retire_ocr_pool(pool, hung_future=None):
     """
-    Convierte la imagen a un formato compatible y retorna la ruta temporal
+    Reemplaza un pool (worker colgado o pool roto) sin cortar las páginas de otras solicitudes:
+    las páginas nuevas van a un pool nuevo y el viejo se termina en un hilo aparte cuando
+    sus demás páginas terminan (o vence su tiempo de guarda). Devuelve False si ya estaba retirado.
     """
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if pool in _retired_ocr_pools:
+            return False
+        _retired_ocr_pools.add(pool)
+        if _ocr_pool is pool:
+            _ocr_pool = None
+        others = [f for f in _ocr_pool_futures.pop(pool, ()) if f is not hung_future]
+
+    def reap():
+        concurrent.futures.wait(others, timeout=OCR_GUARD_TIMEOUT)
+        _terminate_ocr_pool(pool)
+
+    threading.Thread(target=reap, name="ocr-pool-reaper", daemon=True).start()
+    return True
+
+def shutdown_ocr_pool(terminate=False):
+    """Cierra el pool de OCR; con terminate=True mata los workers colgados"""
+    global _ocr_pool
+    with _ocr_pool_lock:
+        pool, _ocr_pool = _ocr_pool, None
+        _ocr_pool_futures.pop(pool, None)
+    if pool is None:
+        return
+    if terminate:
+        _terminate_ocr_pool(pool)
+    else:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def _terminate_ocr_pool(pool):
+    """Mata los workers del pool (aunque estén colgados) y lo cierra sin esperar"""
+    for process in list((getattr(pool, '_processes', None) or {}).values()):
+        try:
+            process.terminate()
+        except Exception:
+            pass
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _record_ocr_metrics(pages, seconds, timeouts, errors):
+    with _ocr_metrics_lock:
+        _ocr_metrics["documentos"] += 1
+        _ocr_metrics["paginas"] += pages
+        _ocr_metrics["segundos"] += seconds
+        _ocr_metrics["timeouts"] += timeouts
+        _ocr_metrics["errores"] += errors
+
+def get_ocr_metrics():
+    """Métricas acumuladas del pool de OCR (para dimensionar instancias)"""
+    with _ocr_metrics_lock:
+        metrics = dict(_ocr_metrics)
+    metrics["paginas_por_segundo"] = round(metrics["paginas"] / metrics["segundos"], 3) if metrics["segundos"] > 0 else 0.0
+    metrics["segundos"] = round(metrics["segundos"], 2)
+    metrics["workers"] = OCR_WORKERS
+    metrics["modo"] = OCR_MODE
+    metrics["backend"] = OCR_BACKEND
+    metrics["paginas_por_worker_antes_de_reciclar"] = OCR_MAX_PAGES_PER_WORKER
+    metrics["timeout_por_pagina"] = OCR_PAGE_TIMEOUT
+    metrics["limite_memoria_worker_mb"] = OCR_WORKER_MEMORY_MB
+    return metrics
+
+# Origen de un archivo: bytes en memoria o ruta en disco (pathlib.Path, p. ej. una
+# subida ya copiada a disco). Con una ruta, cada librería lee el archivo directamente.
+def is_file_path(file_content):
+    return isinstance(file_content, os.PathLike)
+
+def source_size(file_content):
+    return os.path.getsize(file_content) if is_file_path(file_content) else len(file_content)
+
+def path_or_stream(file_content):
+    """Ruta (la librería abre y cierra el archivo) o flujo en memoria, según el origen"""
+    return os.fspath(file_content) if is_file_path(file_content) else io.BytesIO(file_content)
+
+def read_source(file_content):
+    """Bytes completos del origen (solo para rutas que no admiten otra cosa)"""
+    return Path(file_content).read_bytes() if is_file_path(file_content) else file_content
+
+def open_pdf_document(file_content):
+    if is_file_path(file_content):
+        return fitz.open(os.fspath(file_content), filetype="pdf")
+    return fitz.open(stream=file_content, filetype="pdf")
+
+def open_pypdf_reader(file_content):
+    return PyPDF2.PdfReader(path_or_stream(file_content))
+
+def count_pdf_pages(file_content):
+    """Cuenta las páginas de un PDF sin renderizarlas"""
     try:
-        # Abrir imagen con PIL (más robusto que ImageMagick)
-        with Image.open(image_path) as img:
-            # Convertir a RGB si es necesario (elimina transparencias, etc.)
-            if img.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                img = background
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
-
-            # Crear archivo temporal con formato PNG (más compatible)
-            temp_dir = tempfile.gettempdir()
-            temp_path = os.path.join(temp_dir, f"cleaned_image_{os.getpid()}.png")
-
-            # Guardar con alta calidad
-            img.save(temp_path, 'PNG', optimize=True, quality=95)
+        with open_pdf_document(file_content) as doc:
+            return doc.page_count
+    except Exception:
+        try:
+            return len(open_pypdf_reader(file_content).pages)
+        except Exception:
+            return 0
 
-            return temp_path
+def render_pdf_page(file_content, page_index, dpi=PAGE_RENDER_DPI, doc=None):
+    """Renderiza una sola página a imagen PIL (PyMuPDF, con pdf2image como respaldo)"""
+    try:
+        if doc is None:
+            with open_pdf_document(file_content) as own_doc:
+                return render_pdf_page(file_content, page_index, dpi, own_doc)
+        else:
+            pix = doc.load_page(page_index).get_pixmap(dpi=dpi)
+            image = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+            del pix
+            return image
+    except Exception as e:
+        print(f"   ⚠️ PyMuPDF no pudo renderizar página {page_index + 1}: {str(e)}")
 
+    try:
+        # OPTIMIZACIÓN: Usar JPEG en lugar de PNG (más rápido)
+        convert = convert_from_path if is_file_path(file_content) else convert_from_bytes
+        pages = convert(
+            file_content,
+            dpi=dpi,
+            fmt='jpeg',
+            jpegopt={"quality": 85, "progressive": True},
+            first_page=page_index + 1,
+            last_page=page_index + 1
+        )
+        return pages[0] if pages else None
     except Exception as e:
-        logging.error(f"Error convirtiendo imagen {image_path}: {str(e)}")
-        return image_path  # Retornar original si falla la conversión
+        print(f"   ❌ pdf2image no pudo renderizar página {page_index + 1}: {str(e)}")
+        return None
 
-def extract_text_from_image(image_path: str) -> str:
+def iter_pdf_page_images(file_content, dpi=PAGE_RENDER_DPI, page_indexes=None):
     """
-    Extrae texto de una imagen usando OCR con manejo robusto de errores
+    Generador perezoso de páginas: renderiza una página a la vez con PyMuPDF.
+    La imagen se libera en cuanto el consumidor deja de referenciarla.
     """
-    cleaned_image_path = None
     try:
-        # Verificar que el archivo existe
-        if not os.path.exists(image_path):
-            logging.error(f"Archivo de imagen no encontrado: {image_path}")
-            return ""
-
-        # Convertir y limpiar imagen primero
-        cleaned_image_path = convert_and_clean_image(image_path)
+        doc = open_pdf_document(file_content)
+    except Exception as e:
+        print(f"   ⚠️ PyMuPDF no pudo abrir el PDF ({str(e)}) - usando pdf2image página a página")
+        doc = None
 
-        # Configuración de Tesseract para mejor reconocimiento
-        custom_config = r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz.,;:!?()[]{}"\'-+=/\\ áéíóúñüÁÉÍÓÚÑÜ'
+    try:
+        total_pages = doc.page_count if doc is not None else count_pdf_pages(file_content)
+        indexes = range(total_pages) if page_indexes is None else page_indexes
+        for page_index in indexes:
+            image = render_pdf_page(file_content, page_index, dpi, doc)
+            if image is not None:
+                yield page_index, image
+    finally:
+        if doc is not None:
+            doc.close()
+
+# Prefiltro de páginas antes del OCR: separadores en blanco y páginas repetidas
+PAGE_FILTER = os.getenv('PAGE_FILTER', 'true').lower() not in ('0', 'false', 'no')
+PAGE_BLANK_MAX_INK = float(os.getenv('PAGE_BLANK_MAX_INK', '0.0015'))  # Fracción de píxeles oscuros
+PAGE_BLANK_MARGIN = 0.04  # Bordes ignorados (sombras del escáner)
+PAGE_DUPLICATE_MAX_DISTANCE = int(os.getenv('PAGE_DUPLICATE_MAX_DISTANCE', '6'))  # Bits distintos del dHash (de 256)
+PAGE_DUPLICATE_MAX_BLOCK_DIFF = float(os.getenv('PAGE_DUPLICATE_MAX_BLOCK_DIFF', '6.0'))  # Diferencia media por bloque (0-255)
+PAGE_THUMBNAIL_WIDTH = 128
+PAGE_THUMBNAIL_BLOCKS = 8
+
+class PageFilter:
+    """
+    Detecta, sobre las páginas ya renderizadas, las que no vale la pena procesar:
+    - en blanco: cobertura de tinta bajo PAGE_BLANK_MAX_INK (sin contar los bordes);
+    - duplicadas: dHash cercano a una página anterior del documento, confirmado con
+      la diferencia por bloques de una miniatura (un campo distinto en un formulario
+      repetido basta para conservar la página).
+    """
 
-        # Extraer texto de la imagen limpia
-        with Image.open(cleaned_image_path) as img:
-            text = pytesseract.image_to_string(img, config=custom_config, lang='spa+eng')
+    def __init__(self):
+        self.seen = []  # (dhash, miniatura, índice de página)
+        self.report = {
+            "paginas_en_blanco": 0,
+            "paginas_duplicadas": 0,
+            "paginas_omitidas": [],
+            "segundos_filtro": 0.0,
+            "segundos_ahorrados_estimados": 0.0
+        }
+
+    @staticmethod
+    def ink_coverage(gray):
+        pixels = np.asarray(gray)
+        margin_y = int(pixels.shape[0] * PAGE_BLANK_MARGIN)
+        margin_x = int(pixels.shape[1] * PAGE_BLANK_MARGIN)
+        inner = pixels[margin_y:pixels.shape[0] - margin_y, margin_x:pixels.shape[1] - margin_x]
+        return float((inner < 128).mean()) if inner.size else 0.0
+
+    @staticmethod
+    def _thumbnail(gray):
+        height = max(PAGE_THUMBNAIL_BLOCKS, round(gray.height * PAGE_THUMBNAIL_WIDTH / gray.width))
+        return np.asarray(gray.resize((PAGE_THUMBNAIL_WIDTH, height), Image.BOX), dtype=np.int16)
+
+    @staticmethod
+    def _max_block_diff(a, b):
+        if a.shape != b.shape:
+            return float('inf')
+        diff = np.abs(a - b)
+        return max(
+            float(block.mean())
+            for rows in np.array_split(diff, PAGE_THUMBNAIL_BLOCKS, axis=0)
+            for block in np.array_split(rows, PAGE_THUMBNAIL_BLOCKS, axis=1)
+        )
 
-        # Limpiar texto
-        text = text.strip()
-        text = '\n'.join(line.strip() for line in text.split('\n') if line.strip())
+    def classify(self, page_index, image):
+        """None si la página debe procesarse; si no, el motivo para omitirla"""
+        gray = image.convert('L')
+        if self.ink_coverage(gray) < PAGE_BLANK_MAX_INK:
+            return "en blanco"
+
+        dhash = page_dhash(gray)
+        thumbnail = self._thumbnail(gray)
+        for seen_hash, seen_thumbnail, seen_index in self.seen:
+            if (bin(dhash ^ seen_hash).count('1') <= PAGE_DUPLICATE_MAX_DISTANCE
+                    and self._max_block_diff(thumbnail, seen_thumbnail) <= PAGE_DUPLICATE_MAX_BLOCK_DIFF):
+                return f"duplicado de la página {seen_index + 1}"
+        self.seen.append((dhash, thumbnail, page_index))
+        return None
+
+    def filter(self, page_images, on_skip=None):
+        """Deja pasar solo las páginas a procesar; on_skip(índice, motivo) para las omitidas"""
+        for page_index, image in page_images:
+            start = time.perf_counter()
+            try:
+                reason = self.classify(page_index, image)
+            except Exception as e:
+                print(f"   ⚠️ Prefiltro página {page_index + 1} falló: {str(e)}")
+                reason = None
+            self.report["segundos_filtro"] = round(self.report["segundos_filtro"] + time.perf_counter() - start, 3)
+            if reason is None:
+                yield page_index, image
+                continue
+            self.report["paginas_en_blanco" if reason == "en blanco" else "paginas_duplicadas"] += 1
+            self.report["paginas_omitidas"].append({"pagina": page_index + 1, "motivo": reason})
+            print(f"   ⏭️ Página {page_index + 1} omitida: {reason}")
+            if on_skip:
+                on_skip(page_index, reason)
+
+def iter_ocr_pages(page_images, stats=None, window=PAGE_WINDOW):
+    """
+    Ejecuta OCR sobre un iterable de (índice, imagen) usando el pool de procesos.
+    Mantiene como máximo `window` páginas en vuelo y produce (índice, imagen, texto)
+    en el orden de las páginas.
+    """
+    start = time.monotonic()
+    pending = collections.deque()
+    counters = {"paginas": 0, "timeouts": 0, "errores": 0}
+    parallel = OCR_WORKERS > 1
+
+    if parallel:
+        print(f"   👥 OCR paralelo: {OCR_WORKERS} workers, ventana de {window} páginas")
+
+    def pool_failed(pool, e):
+        """Un pool reemplazado por otra solicitud no está roto: solo esta página va en serie"""
+        nonlocal parallel
+        if pool is not None and not is_retired_ocr_pool(pool) and parallel:
+            print(f"   ⚠️ Pool OCR roto ({str(e)}) - continuando en serie")
+            retire_ocr_pool(pool)
+            parallel = False
+
+    def resolve(page_index, image, pool, future):
+        if future is None:
+            return ocr_page_image(image)
+        try:
+            _, text = future.result(timeout=OCR_GUARD_TIMEOUT)
+            return text
+        except concurrent.futures.TimeoutError:
+            counters["timeouts"] += 1
+            print(f"   ⏰ OCR página {page_index + 1}: timeout del worker")
+            # Un worker colgado bloquearía las siguientes páginas: las nuevas van a otro pool
+            retire_ocr_pool(pool, future)
+            return ""
+        except (concurrent.futures.BrokenExecutor, concurrent.futures.CancelledError) as e:
+            pool_failed(pool, e)
+            return ocr_page_image(image)
+        except Exception as e:
+            counters["errores"] += 1
+            print(f"   ❌ OCR página {page_index + 1} falló en el worker: {str(e)}")
+            return ""
 
-        logging.info(f"✅ Texto extraído exitosamente de {image_path} ({len(text)} caracteres)")
-        return text
+    def drain_one():
+        page_index, image, pool, future = pending.popleft()
+        text = resolve(page_index, image, pool, future)
+        counters["paginas"] += 1
+        print(f"   ✅ OCR página {page_index + 1}: {len(text)} caracteres")
+        return page_index, image, text
 
+    for page_index, image in page_images:
+        pool, future = None, None
+        if parallel:
+            try:
+                pool, future = submit_ocr_page(page_index, image)
+            except Exception as e:
+                print(f"   ⚠️ No se pudo usar el pool OCR ({str(e)}) - continuando en serie")
+                parallel = False
+        pending.append((page_index, image, pool, future))
+        if len(pending) >= max(1, window):
+            yield drain_one()
+
+    while pending:
+        yield drain_one()
+
+    elapsed = time.monotonic() - start
+    pages = counters["paginas"]
+    pages_per_second = pages / elapsed if elapsed > 0 else 0.0
+    _record_ocr_metrics(pages, elapsed, counters["timeouts"], counters["errores"])
+    print(f"   ⚡ OCR: {pages} páginas en {elapsed:.1f}s ({pages_per_second:.2f} páginas/s)")
+
+    if stats is not None:
+        stats["ocr_paginas"] = pages
+        stats["ocr_segundos"] = round(elapsed, 2)
+        stats["ocr_paginas_por_segundo"] = round(pages_per_second, 3)
+        stats["ocr_timeouts"] = counters["timeouts"]
+        stats["ocr_errores"] = counters["errores"]
+        stats["ventana_paginas"] = window
+
+def analyze_text_layer(file_content):
+    """
+    Extrae el texto nativo de cada página y puntúa su calidad.
+    Devuelve una lista (una entrada por página) con el texto y la evaluación.
+    """
+    pages = []
+    try:
+        with open_pdf_document(file_content) as doc:
+            if doc.needs_pass:
+                print("   🔒 PDF está encriptado - intentando sin contraseña...")
+                if not doc.authenticate(""):
+                    print("   ❌ No se pudo desencriptar el PDF")
+                    return []
+            for page in doc:
+                text = page.get_text("text") or ""
+                evaluation = score_text_layer(text, abs(page.rect), len(page.get_fonts()))
+                evaluation["texto"] = text
+                pages.append(evaluation)
+        return pages
     except Exception as e:
-        logging.error(f"❌ Error extrayendo texto de imagen {image_path}: {str(e)}")
+        print(f"   ⚠️ PyMuPDF no pudo leer la capa de texto ({str(e)}) - usando PyPDF2")
 
-        # Intentar método alternativo con configuración básica
+    pdf_reader = open_pypdf_reader(file_content)
+    if pdf_reader.is_encrypted:
+        print("   🔒 PDF está encriptado - intentando sin contraseña...")
         try:
-            if cleaned_image_path and os.path.exists(cleaned_image_path):
-                with Image.open(cleaned_image_path) as img:
-                    text = pytesseract.image_to_string(img, lang='spa+eng')
-                    return text.strip()
+            pdf_reader.decrypt("")
         except:
-            pass
+            print("   ❌ No se pudo desencriptar el PDF")
 
+    for page in pdf_reader.pages:
+        try:
+            text = page.extract_text() or ""
+            resources = page["/Resources"] if "/Resources" in page else {}
+            font_count = len(resources["/Font"]) if "/Font" in resources else 0
+            page_area = float(page.mediabox.width) * float(page.mediabox.height)
+        except Exception:
+            text, font_count, page_area = "", 0, 0.0
+        evaluation = score_text_layer(text, page_area, font_count)
+        evaluation["texto"] = text
+        pages.append(evaluation)
+    return pages
+
+# Etapa de tablas: páginas con capa de texto cuyas tablas se extraen de forma estructurada
+# (pdfplumber, con camelot como respaldo) antes de recurrir a Vision AI
+TABLE_EXTRACTION = os.getenv('TABLE_EXTRACTION', 'true').lower() not in ('0', 'false', 'no')
+TABLE_CAMELOT_FALLBACK = os.getenv('TABLE_CAMELOT_FALLBACK', 'true').lower() not in ('0', 'false', 'no')
+TABLE_MIN_FILL = float(os.getenv('TABLE_MIN_FILL', '0.5'))  # Fracción mínima de celdas con contenido
+TABLE_MIN_ROWS = 2
+TABLE_MIN_COLS = 2
+# Motivos de Vision AI que la etapa de tablas puede resolver
+TABLE_STAGE_REASONS = ("OCR insuficiente", "Tablas detectadas", "Alto contenido numérico")
+
+def _clean_cell(cell):
+    return ' '.join(str(cell or '').replace('|', '/').split())
+
+def format_table_rows(rows):
+    """
+    Tabla como texto compacto delimitado por '|': una fila por línea, sin filas
+    ni columnas completamente vacías.
+    """
+    rows = [[_clean_cell(cell) for cell in row] for row in rows if row]
+    rows = [row for row in rows if any(row)]
+    if not rows:
         return ""
+    width = max(len(row) for row in rows)
+    rows = [row + [''] * (width - len(row)) for row in rows]
+    columns = [c for c in range(width) if any(row[c] for row in rows)]
+    return '\n'.join(' | '.join(row[c] for c in columns) for row in rows)
+
+def table_is_usable(rows):
+    """Tabla con forma y contenido suficientes para confiar en ella sin Vision AI"""
+    rows = [[_clean_cell(cell) for cell in row] for row in rows if row and any(_clean_cell(cell) for cell in row)]
+    if len(rows) < TABLE_MIN_ROWS or max(len(row) for row in rows) < TABLE_MIN_COLS:
+        return False
+    cells = [cell for row in rows for cell in row]
+    filled = [cell for cell in cells if cell]
+    if len(filled) / len(cells) < TABLE_MIN_FILL:
+        return False
+    chars = [char for cell in filled for char in cell if not char.isspace()]
+    garbage = sum(1 for char in chars if is_garbage_char(char))
+    return not chars or garbage / len(chars) <= TEXT_LAYER_MAX_GARBAGE
+
+class PdfTableExtractor:
+    """
+    Extrae las tablas de una página desde la capa de texto del PDF: pdfplumber primero
+    y camelot (lattice) si pdfplumber no encuentra tablas utilizables. Devuelve el texto
+    fuera de las tablas más cada tabla en formato '|', o None si la extracción no sirve
+    y la página debe ir a Vision AI.
+    """
 
-    finally:
-        # Limpiar archivo temporal si se creó uno nuevo
-        if cleaned_image_path and cleaned_image_path != image_path:
+    def __init__(self, file_content, camelot_fallback=TABLE_CAMELOT_FALLBACK):
+        self.file_content = file_content
+        self.camelot_fallback = camelot_fallback
+        self._pdf = None
+        self._camelot_path = None
+        self.report = {
+            "paginas_evaluadas": 0,
+            "paginas_con_tablas": 0,
+            "tablas_extraidas": 0,
+            "llamadas_vision_evitadas": 0,
+            "paginas_a_vision": 0,
+            "segundos_totales": 0.0,
+            "segundos_por_pagina": {}
+        }
+
+    def _page(self, page_index):
+        if self._pdf is None:
+            self._pdf = pdfplumber.open(path_or_stream(self.file_content))
+        return self._pdf.pages[page_index]
+
+    @staticmethod
+    def _outside(bboxes):
+        """Filtro de pdfplumber: objetos cuyo centro no cae dentro de ninguna tabla"""
+        def keep(obj):
+            if 'x0' not in obj or 'top' not in obj:
+                return True
+            x = (obj['x0'] + obj['x1']) / 2
+            y = (obj['top'] + obj['bottom']) / 2
+            return not any(x0 <= x <= x1 and top <= y <= bottom for x0, top, x1, bottom in bboxes)
+        return keep
+
+    def _pdfplumber_tables(self, page_index):
+        page = self._page(page_index)
+        found = [table for table in page.find_tables() if table_is_usable(table.extract())]
+        if not found:
+            return [], None
+        bboxes = [table.bbox for table in found]
+        outside_text = page.filter(self._outside(bboxes)).extract_text() or ""
+        return [table.extract() for table in found], outside_text
+
+    def _camelot_tables(self, page_index):
+        import camelot
+        if self._camelot_path is None and is_file_path(self.file_content):
+            self._camelot_path = os.fspath(self.file_content)
+        elif self._camelot_path is None:
+            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_pdf:
+                temp_pdf.write(self.file_content)
+                self._camelot_path = temp_pdf.name
+        tables = [table for table in camelot.read_pdf(self._camelot_path, pages=str(page_index + 1), flavor='lattice')
+                  if table_is_usable(table.df.values.tolist())]
+        if not tables:
+            return [], None
+        # camelot usa coordenadas PDF (origen abajo a la izquierda)
+        page = self._page(page_index)
+        bboxes = []
+        for table in tables:
+            x1, y1, x2, y2 = getattr(table, '_bbox', (0, 0, 0, 0))
+            bboxes.append((x1, page.height - y2, x2, page.height - y1))
+        outside_text = page.filter(self._outside(bboxes)).extract_text() or ""
+        return [table.df.values.tolist() for table in tables], outside_text
+
+    def extract(self, page_index):
+        """Texto estructurado de la página, o None si debe recurrir a Vision AI"""
+        start = time.time()
+        self.report["paginas_evaluadas"] += 1
+        tables, outside_text = [], None
+        try:
+            tables, outside_text = self._pdfplumber_tables(page_index)
+            if not tables and self.camelot_fallback:
+                tables, outside_text = self._camelot_tables(page_index)
+        except Exception as e:
+            print(f"   ⚠️ Extracción de tablas página {page_index+1} falló: {str(e)}")
+            tables = []
+        seconds = time.time() - start
+        self.report["segundos_totales"] = round(self.report["segundos_totales"] + seconds, 3)
+        self.report["segundos_por_pagina"][str(page_index + 1)] = round(seconds, 3)
+
+        if not tables:
+            self.report["paginas_a_vision"] += 1
+            return None
+        self.report["paginas_con_tablas"] += 1
+        self.report["tablas_extraidas"] += len(tables)
+        parts = [outside_text.strip()] if outside_text and outside_text.strip() else []
+        for number, rows in enumerate(tables, 1):
+            parts.append(f"[TABLA {number}]\n{format_table_rows(rows)}")
+        return '\n\n'.join(parts)
+
+    def close(self):
+        if self._pdf is not None:
+            self._pdf.close()
+            self._pdf = None
+        if self._camelot_path and not is_file_path(self.file_content):
             try:
-                if os.path.exists(cleaned_image_path):
-                    os.remove(cleaned_image_path)
-            except:
+                os.unlink(self._camelot_path)
+            except OSError:
                 pass
+            self._camelot_path = None
+
+def table_stage_applies(evaluation, reason):
+    """Página con capa de texto fiable y motivo de Vision AI relacionado con tablas"""
+    return (TABLE_EXTRACTION and reason in TABLE_STAGE_REASONS and evaluation is not None
+            and evaluation["fuentes"] > 0 and evaluation["caracteres"] > 0
+            and evaluation["proporcion_basura"] <= TEXT_LAYER_MAX_GARBAGE)
 
-def verify_and_repair_image(file_path: str) -> str:
+def record_extraction_failure(stats, reason):
+    """Anota en las estadísticas un método de extracción que se interrumpió"""
+    if stats is not None:
+        stats.setdefault("fallos_extraccion", []).append(reason)
+
+def extraction_failures(stats):
+    """
+    Fallos registrados durante una extracción (timeouts/errores de OCR, llamadas de
+    Vision AI fallidas, métodos interrumpidos). Un texto con fallos no se guarda en caché.
     """
-    Verifica si una imagen es válida y la repara si es necesario
+    failures = list(stats.get("fallos_extraccion", []))
+    if stats.get("ocr_timeouts"):
+        failures.append(f"{stats['ocr_timeouts']} páginas OCR con timeout")
+    if stats.get("ocr_errores"):
+        failures.append(f"{stats['ocr_errores']} páginas OCR con error")
+    if stats.get("vision_ai", {}).get("fallos_api"):
+        failures.append(f"{stats['vision_ai']['fallos_api']} llamadas Vision AI fallidas")
+    return failures
+
+def iter_pdf_sections(file_content, api_key=None, stats=None, filename="", profile=None):
     """
+    Extrae texto de PDF usando OCR + Vision AI - PRIORIDAD MÁXIMA A VISION AI.
+    Genera las secciones '--- PÁGINA N ---' en orden a medida que cada página queda
+    lista (texto nativo, OCR o fusión con Vision AI), sin esperar al resto del documento.
+    El clasificador de documentos elige el perfil de extracción (solo nativo, OCR,
+    OCR + Vision AI selectiva o Vision AI completa); `profile` lo fija explícitamente.
+    """
+    print("   🔧 INICIANDO EXTRACCIÓN AVANZADA DE PDF...")
+    print(f"   📊 Tamaño archivo: {source_size(file_content)/1024:.1f} KB")
+    print(f"   🤖 Vision AI: {'HABILITADO' if api_key else 'DESHABILITADO'}")
+
     try:
-        # Verificar extensión
-        file_ext = Path(file_path).suffix.lower()
+        # Método 1: Capa de texto nativa, evaluada página por página
+        print("   📖 Método 1: Extracción de texto nativo por página...")
+        text_layer = []
+        try:
+            text_layer = analyze_text_layer(file_content)
+        except Exception as e:
+            print(f"   ❌ Método 1 falló: {str(e)}")
 
-        # Extensiones soportadas
-        supported_formats = {'.png', '.jpg', '.jpeg', '.tiff', '.tif', '.bmp', '.gif', '.webp'}
+        page_sections = {}
+        pending_pages = []
+        for page_num, evaluation in enumerate(text_layer):
+            if evaluation["aprobada"]:
+                page_sections[page_num] = f"\n--- PÁGINA {page_num+1} (Texto nativo) ---\n{evaluation['texto']}\n"
+                print(f"   ✅ Página {page_num + 1}: texto nativo ({evaluation['caracteres']} caracteres, puntaje {evaluation['puntaje']})")
+            else:
+                pending_pages.append(page_num)
+                print(f"   ⚠️ Página {page_num + 1}: {evaluation['motivo']} - requiere OCR")
+
+        native_pages = len(page_sections)
+        route_report = {"texto_nativo": native_pages, "ocr": 0, "ocr_tablas": 0, "ocr_vision": 0}
+        vision_stats = new_vision_stats()
+        forced_profile = profile or (EXTRACTION_PROFILE if EXTRACTION_PROFILE != 'auto' else None)
+        classification = choose_extraction_profile(text_layer, filename, bool(api_key), forced_profile)
+        profile = classification["perfil"]
+        print(f"   🗂️ Tipo: {classification['tipo']} → perfil {profile} ({classification['motivo']})")
+        if stats is not None:
+            stats["rutas_paginas"] = route_report
+            stats["vision_ai"] = vision_stats
+            stats["clasificacion"] = classification
+
+        if profile == "solo_nativo" and text_layer:
+            # Capa de texto de todas las páginas, incluso las de baja calidad: sin OCR ni Vision AI
+            for page_num in pending_pages:
+                if text_layer[page_num]["texto"].strip():
+                    page_sections[page_num] = f"\n--- PÁGINA {page_num+1} (Texto nativo) ---\n{text_layer[page_num]['texto']}\n"
+            route_report["texto_nativo"] = len(page_sections)
+            pending_pages = []
+
+        if text_layer and not pending_pages:
+            native_chars = sum(len(section) for section in page_sections.values())
+            print(f"   ✅ Método 1 exitoso: {native_chars} caracteres ({native_pages} páginas nativas, OCR/Vision omitidos)")
+            for i in sorted(page_sections):
+                yield page_sections[i]
+            return
+    except Exception as e:
+        print(f"   💥 Error crítico en extracción de PDF: {str(e)}")
+        record_extraction_failure(stats, f"pdf: {str(e)}")
+        return
 
-        if file_ext not in supported_formats:
-            logging.warning(f"Formato de imagen no soportado: {file_ext}")
-            return file_path
+    # Método 2: OCR optimizado para PDFs escaneados (solo páginas sin capa de texto válida)
+    print("   🔍 Método 2: OCR optimizado...")
+    try:
+        total_pages = len(text_layer) or count_pdf_pages(file_content)
+        if not total_pages:
+            print("   ❌ No se pudo convertir PDF a imágenes")
+            return
+        if not text_layer:
+            pending_pages = list(range(total_pages))
+
+        vision_text = ""
+        merge_report = {"paginas_fusionadas": 0, "tokens_antes": 0, "tokens_despues": 0, "tokens_eliminados": 0,
+                        "lineas_ocr_preferidas": 0, "lineas_solo_ocr": 0}
+        if OCR_VISION_MERGE and stats is not None:
+            stats["fusion_ocr_vision"] = merge_report
+
+        # 🚀 PROCESAMIENTO HÍBRIDO INTELIGENTE: OCR + Vision AI sin límites
+        print(f"   🔄 Iniciando procesamiento híbrido inteligente...")
+        print(f"   📄 Páginas a procesar con OCR: {len(pending_pages)}/{total_pages} ({native_pages} con texto nativo)")
+        print(f"   📸 Rasterización en streaming a {PAGE_RENDER_DPI} DPI (ventana de {PAGE_WINDOW} páginas)")
+
+        # PASO 1: OCR Tradicional (siempre primero) - páginas renderizadas y
+        # procesadas en paralelo, como máximo PAGE_WINDOW imágenes en memoria
+        page_images = iter_pdf_page_images(file_content, page_indexes=pending_pages)
+        page_filter = PageFilter() if PAGE_FILTER else None
+        if page_filter and stats is not None:
+            stats["filtro_paginas"] = page_filter.report
+        # PASO 2: Vision AI INTELIGENTE - en paralelo mientras el OCR avanza
+        use_vision_ai = api_key and profile in ("ocr_vision_selectiva", "vision_completa")
+        dispatcher = VisionDispatcher(api_key, file_content, vision_stats) if use_vision_ai else None
+        if dispatcher and dispatcher.limited:
+            print(f"   💰 Presupuesto Vision AI: {VISION_MAX_PAGES or '∞'} páginas, ${VISION_MAX_USD or '∞'} USD")
+        if not dispatcher and api_key:
+            print(f"   ⚡ Vision AI omitido por el perfil {profile}")
+        elif not dispatcher:
+            print(f"   ⚠️ Vision AI no disponible (configurar OPENAI_API_KEY)")
+        table_extractor = PdfTableExtractor(file_content) if TABLE_EXTRACTION and text_layer else None
+        if table_extractor and stats is not None:
+            stats["tablas"] = table_extractor.report
+        ocr_pages_text = {}
+        finished_pages = set(page_sections)  # Páginas con texto definitivo
+        awaiting_vision = set()              # Páginas con OCR listo esperando a Vision AI
+        next_page = 0
+        emitted_chars = 0
+
+        def skip_page(i, reason):
+            """Página omitida por el prefiltro: sin OCR ni Vision AI"""
+            if reason.startswith("duplicado"):
+                page_sections[i] = f"\n--- PÁGINA {i+1} ({reason}, omitida) ---\n"
+            finished_pages.add(i)
+
+        if page_filter:
+            page_images = page_filter.filter(page_images, on_skip=skip_page)
+        ocr_start = time.perf_counter()
+
+        def apply_vision(i, vision_page_text):
+            """Incorpora el resultado de Vision AI de una página a su sección"""
+            nonlocal vision_text
+            awaiting_vision.discard(i)
+            finished_pages.add(i)
+            if i not in dispatcher.reasons:
+                return  # Descartada por el presupuesto del documento
+            route_report["ocr_vision"] += 1
+            route_report["ocr"] -= 1
+            page_text = ocr_pages_text.get(i, "")
+            if not vision_page_text or len(vision_page_text.strip()) <= 15:
+                print(f"   ⚠️ Vision AI página {i+1}: resultado mínimo")
+                return
+            print(f"   ✅ Vision AI página {i+1}: {len(vision_page_text)} caracteres ({dispatcher.reasons.get(i, '')})")
+
+            # Comparar calidad
+            if len(vision_page_text.strip()) > len(page_text.strip()) * 1.2:
+                print(f"   📈 Vision AI SUPERIOR: +{len(vision_page_text) - len(page_text)} chars")
+            else:
+                print(f"   ⚖️ Vision AI complementario")
+
+            if OCR_VISION_MERGE:
+                # Un solo texto por página: sin contenido duplicado para el análisis
+                merged_text, page_report = merge_page_texts(page_text, vision_page_text)
+                page_sections[i] = f"\n--- PÁGINA {i+1} (OCR + Vision AI) ---\n{merged_text}\n"
+                merge_report["paginas_fusionadas"] += 1
+                for key in page_report:
+                    merge_report[key] += page_report[key]
+            else:
+                vision_text += f"\n--- PÁGINA {i+1} (Vision AI) ---\n{vision_page_text}\n"
+
+        def ready_sections():
+            """Secciones listas para emitir en orden de página (sin bloquear)"""
+            nonlocal next_page
+            ready = []
+            while next_page < total_pages:
+                if next_page in awaiting_vision:
+                    vision_page_text = dispatcher.poll(next_page)
+                    if vision_page_text is None:
+                        break
+                    apply_vision(next_page, vision_page_text)
+                if next_page not in finished_pages:
+                    break
+                if next_page in page_sections:
+                    ready.append(page_sections[next_page])
+                next_page += 1
+            return ready
+
+        for i, image, page_text in iter_ocr_pages(page_images, stats):
+            print(f"   📄 Procesando página {i+1}/{total_pages}...")
+            route_report["ocr"] += 1
+
+            if not page_text.strip() and i < len(text_layer):
+                # OCR vacío: conservar la capa nativa aunque sea de baja calidad
+                page_text = text_layer[i]["texto"]
+
+            if page_text.strip():
+                page_sections[i] = f"\n--- PÁGINA {i+1} (OCR) ---\n{page_text}\n"
+                ocr_pages_text[i] = page_text
+                print(f"   📝 OCR completado: {len(page_text)} caracteres")
+
+            if profile == "vision_completa":
+                use_vision, reason, priority = True, "Perfil Vision AI completa", VISION_EAGER_PRIORITY
+            else:
+                use_vision, reason, priority = should_use_vision_ai(i+1, page_text, total_pages)
+            if use_vision and table_extractor and table_stage_applies(text_layer[i] if i < len(text_layer) else None, reason):
+                # Tablas estructuradas desde la capa de texto: Vision AI solo si la extracción falla
+                table_text = table_extractor.extract(i)
+                if table_text:
+                    merged_text, _ = merge_page_texts(page_text, table_text)
+                    page_sections[i] = f"\n--- PÁGINA {i+1} (OCR + tablas) ---\n{merged_text}\n"
+                    route_report["ocr"] -= 1
+                    route_report["ocr_tablas"] += 1
+                    use_vision = False
+                    if dispatcher:
+                        table_extractor.report["llamadas_vision_evitadas"] += 1
+                    print(f"   📊 Tablas extraídas de la capa de texto: Vision AI evitado ({reason})")
+                    reason = "Tablas extraídas"
+            if not dispatcher:
+                use_vision = False
+            elif use_vision:
+                print(f"   🤖 Vision AI NECESARIO para página {i+1}: {reason}")
+                dispatcher.offer(i, image, page_text, priority, reason)
+            else:
+                if reason != "Tablas extraídas":
+                    print(f"   ⚡ Vision AI omitido: OCR suficiente para esta página")
+                dispatcher.flush()
+            if use_vision:
+                awaiting_vision.add(i)
+            else:
+                finished_pages.add(i)
+
+            for section in ready_sections():
+                emitted_chars += len(section)
+                yield section
+
+        if page_filter:
+            skipped = len(page_filter.report["paginas_omitidas"])
+            processed = len(pending_pages) - skipped
+            if skipped and processed:
+                # Tiempo medio por página procesada (render + OCR + Vision AI) × páginas omitidas
+                per_page = (time.perf_counter() - ocr_start) / processed
+                page_filter.report["segundos_ahorrados_estimados"] = round(per_page * skipped, 2)
+                print(f"   ⏭️ Prefiltro: {page_filter.report['paginas_en_blanco']} en blanco, "
+                      f"{page_filter.report['paginas_duplicadas']} duplicadas, "
+                      f"~{page_filter.report['segundos_ahorrados_estimados']:.1f}s ahorrados")
+
+        if dispatcher:
+            # Páginas diferidas por presupuesto y llamadas aún en curso
+            vision_results = dispatcher.results()
+            for i in sorted(awaiting_vision):
+                if i in vision_results:
+                    apply_vision(i, vision_results[i])
+                else:
+                    awaiting_vision.discard(i)
+                    finished_pages.add(i)
+        finished_pages.update(range(total_pages))
+        for section in ready_sections():
+            emitted_chars += len(section)
+            yield section
+
+        print(f"   📊 Procesamiento híbrido completado:")
+        print(f"      📝 Texto nativo + OCR: {emitted_chars} caracteres")
+        if vision_text:
+            print(f"      🤖 Vision AI extrajo: {len(vision_text)} caracteres")
+        print(f"      🧭 Rutas: {route_report['texto_nativo']} nativas, {route_report['ocr']} OCR, "
+              f"{route_report['ocr_tablas']} OCR+tablas, {route_report['ocr_vision']} OCR+Vision")
+        if table_extractor:
+            table_report = table_extractor.report
+            table_extractor.close()
+            if table_report["paginas_evaluadas"]:
+                print(f"      📊 Tablas: {table_report['tablas_extraidas']} tablas en {table_report['paginas_con_tablas']} páginas, "
+                      f"{table_report['llamadas_vision_evitadas']} llamadas Vision evitadas, "
+                      f"{table_report['segundos_totales'] / table_report['paginas_evaluadas']:.2f}s por página")
+        print(f"      ♻️ Caché Vision AI: {vision_stats['cache_aciertos_exactos'] + vision_stats['cache_aciertos_perceptuales']} aciertos, ${vision_stats['usd_ahorrados_cache']:.4f} ahorrados")
+        if merge_report["paginas_fusionadas"]:
+            print(f"   🧩 Fusión OCR + Vision AI: {merge_report['paginas_fusionadas']} páginas, "
+                  f"{merge_report['tokens_eliminados']} tokens duplicados eliminados "
+                  f"({merge_report['tokens_antes']} → {merge_report['tokens_despues']})")
+
+        if vision_text.strip():
+            yield "\n\n=== TEXTO ADICIONAL (Vision API) ===\n" + vision_text
+            print(f"   ✅ Vision API total: {len(vision_text)} caracteres")
+
+        if emitted_chars or vision_text.strip():
+            print(f"   🎉 Extracción completada: {emitted_chars + len(vision_text)} caracteres totales")
+        else:
+            print("   ❌ Ningún método logró extraer texto")
 
-        # Intentar abrir y validar
-        with Image.open(file_path) as img:
-            img.verify()  # Verificar integridad
+    except Exception as e:
+        print(f"   ❌ Método 2 (OCR) falló completamente: {str(e)}")
+        record_extraction_failure(stats, f"ocr: {str(e)}")
 
-        # Si llegamos aquí, la imagen es válida
-        return file_path
+def extract_text_from_pdf(file_content, api_key=None, stats=None, filename="", profile=None):
+    """Extrae texto de PDF usando OCR + Vision AI - PRIORIDAD MÁXIMA A VISION AI"""
+    return "".join(iter_pdf_sections(file_content, api_key, stats, filename, profile))
 
-    except Exception as e:
-        logging.warning(f"Imagen dañada o formato incompatible {file_path}: {str(e)}")
+_W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_DOCX_PART_ORDER = re.compile(r'(\d+)')
 
-        # Intentar reparar convirtiendo a PNG
-        try:
-            with Image.open(file_path) as img:
-                # Crear nueva imagen limpia
-                temp_path = file_path.replace(Path(file_path).suffix, '_repaired.png')
+def _docx_part_names(archive, kind):
+    """Partes de encabezado/pie de página ('header' o 'footer') en orden numérico"""
+    names = [n for n in archive.namelist() if re.fullmatch(rf'word/{kind}\d*\.xml', n)]
+    return sorted(names, key=lambda n: int((_DOCX_PART_ORDER.findall(n) or ['0'])[-1]))
 
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
+def _iter_docx_part_lines(stream):
+    """
+    Recorre una parte XML de Word con un parser incremental y genera líneas de texto
+    en orden de lectura: cada párrafo es una línea y cada fila de tabla una línea
+    con sus celdas separadas por ' | '. Los elementos ya procesados se liberan.
+    """
+    paragraphs = []  # Pila de párrafos abiertos (los cuadros de texto anidan párrafos)
+    rows = []        # Pila de filas abiertas (tablas anidadas)
+    cells = []       # Pila de celdas abiertas: líneas acumuladas en cada celda
+    container = None
+    container_depth = 0
+    depth = 0
+
+    for event, elem in ElementTree.iterparse(stream, events=("start", "end")):
+        tag = elem.tag
+        if event == "start":
+            depth += 1
+            if tag in (f"{_W_NS}body", f"{_W_NS}hdr", f"{_W_NS}ftr"):
+                container, container_depth = elem, depth
+            elif tag == f"{_W_NS}p":
+                paragraphs.append([])
+            elif tag == f"{_W_NS}tr":
+                rows.append([])
+            elif tag == f"{_W_NS}tc":
+                cells.append([])
+            continue
+
+        depth -= 1
+        if tag == f"{_W_NS}t":
+            if paragraphs and elem.text:
+                paragraphs[-1].append(elem.text)
+        elif tag == f"{_W_NS}tab":
+            if paragraphs:
+                paragraphs[-1].append("\t")
+        elif tag in (f"{_W_NS}br", f"{_W_NS}cr"):
+            if paragraphs:
+                paragraphs[-1].append("\n")
+        elif tag == f"{_W_NS}p":
+            line = "".join(paragraphs.pop())
+            if cells:
+                if line.strip():
+                    cells[-1].append(line.strip())
+            elif paragraphs:
+                # Párrafo de un cuadro de texto: se añade al párrafo que lo contiene
+                paragraphs[-1].append(f"\n{line}")
+            else:
+                yield line
+        elif tag == f"{_W_NS}tc":
+            cell = " ".join(cells.pop())
+            if rows:
+                rows[-1].append(cell)
+        elif tag == f"{_W_NS}tr":
+            row = rows.pop()
+            if any(c.strip() for c in row):
+                line = " | ".join(row)
+                if cells:
+                    cells[-1].append(line)  # Tabla anidada dentro de una celda
+                else:
+                    yield line
 
-                img.save(temp_path, 'PNG')
-                logging.info(f"✅ Imagen reparada guardada en: {temp_path}")
-                return temp_path
+        # Memoria acotada: vaciar el contenedor después de cada bloque de primer nivel
+        if container is not None and depth == container_depth:
+            container.clear()
 
-        except Exception as repair_error:
-            logging.error(f"❌ No se pudo reparar la imagen: {repair_error}")
-            return file_path
+def iter_docx_lines(file_content):
+    """
+    Genera las líneas de un DOCX sin construir el modelo de objetos de python-docx:
+    encabezados, cuerpo (párrafos y tablas en orden de lectura) y pies de página.
+    Los encabezados y pies repetidos entre secciones se emiten una sola vez.
+    """
+    with zipfile.ZipFile(path_or_stream(file_content)) as archive:
+        seen = set()
+        for name in _docx_part_names(archive, "header"):
+            with archive.open(name) as stream:
+                for line in _iter_docx_part_lines(stream):
+                    if line.strip() and line not in seen:
+                        seen.add(line)
+                        yield line
+
+        with archive.open("word/document.xml") as stream:
+            yield from _iter_docx_part_lines(stream)
+
+        for name in _docx_part_names(archive, "footer"):
+            with archive.open(name) as stream:
+                for line in _iter_docx_part_lines(stream):
+                    if line.strip() and line not in seen:
+                        seen.add(line)
+                        yield line
 
-def process_file(file_content, content_type, filename, api_key=None):
-    """Procesa cualquier tipo de archivo y extrae texto"""
+def extract_text_from_docx(file_content):
+    """Extrae texto de archivos Word (párrafos, tablas, encabezados y pies) en streaming"""
     try:
-        if content_type == "application/pdf":
-            return extract_text_from_pdf(file_content, api_key)
-        elif content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-            return extract_text_from_docx(file_content)
-        elif content_type.startswith("image/"):
-            # Save the image to a temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp_file:
-                temp_file.write(file_content)
-                temp_file_path = temp_file.name
-            
-            # Verify and repair the image
-            verified_path = verify_and_repair_image(temp_file_path)
-            
-            # Extract text from the image
-            text = extract_text_from_image(verified_path)
-            
-            # Clean up the temporary file
-            os.remove(temp_file_path)
-            if verified_path != temp_file_path and os.path.exists(verified_path):
-                os.remove(verified_path)
-            
-            return text
-        else:
-            try:
-                if isinstance(file_content, bytes):
-                    text = file_content.decode('utf-8', errors='ignore')
-                else:
-                    text = str(file_content)
-                return text
-            except Exception:
-                return ""
+        return "".join(f"{line}\n" for line in iter_docx_lines(file_content))
+    except Exception as e:
+        print(f"   ⚠️ Extracción DOCX en streaming falló ({str(e)}), usando python-docx")
+        return extract_text_from_docx_object_model(file_content)
+
+def extract_text_from_docx_object_model(file_content):
+    """Extracción original con python-docx (solo párrafos del cuerpo); referencia del benchmark"""
+    try:
+        doc = Document(path_or_stream(file_content))
+        text = ""
+        for paragraph in doc.paragraphs:
+            text += paragraph.text + "\n"
+        return text
     except Exception:
         return ""
 
-def chunk_text(text, max_words=3500):
-    """Divide el texto en fragmentos optimizados para velocidad y calidad"""
-    words = text.split()
-    MAX_CHUNKS = 4  # Reducido para mayor velocidad
+def decode_image(file_content):
+    """
+    Decodifica una imagen una sola vez, en memoria: corrige la orientación EXIF
+    (fotos de celular) y normaliza a RGB sobre fondo blanco. Si PIL no puede
+    decodificarla (archivo truncado o dañado), se intenta reparar con OpenCV.
+    Devuelve (imagen PIL RGB, reparada).
+    """
+    try:
+        with Image.open(path_or_stream(file_content)) as img:
+            img.load()
+            img = ImageOps.exif_transpose(img)
+            if img.mode in ('RGBA', 'LA', 'P'):
+                img = img.convert('RGBA')
+                background = Image.new('RGB', img.size, (255, 255, 255))
+                background.paste(img, mask=img.split()[-1])
+                return background, False
+            return (img if img.mode == 'RGB' else img.convert('RGB')), False
+    except Exception as e:
+        logging.warning(f"Imagen dañada o formato incompatible: {str(e)}")
+
+    # Reparación: OpenCV tolera JPEG truncados y algunos formatos que PIL rechaza
+    raw = np.fromfile(file_content, dtype=np.uint8) if is_file_path(file_content) else np.frombuffer(file_content, dtype=np.uint8)
+    array = cv2.imdecode(raw, cv2.IMREAD_COLOR)
+    if array is None:
+        raise ValueError("No se pudo decodificar la imagen")
+    logging.info("✅ Imagen reparada en memoria con OpenCV")
+    return Image.fromarray(cv2.cvtColor(array, cv2.COLOR_BGR2RGB)), True
+
+def extract_text_from_image_bytes(file_content, stats=None):
+    """
+    Extrae texto de una imagen sin archivos temporales: una sola decodificación y OCR
+    con el motor configurado (solo el motor pytesseract usa un archivo temporal
+    internamente), con la misma configuración de Tesseract de siempre para imágenes:
+    psm 6 y lista de caracteres permitidos.
+    """
+    stats = stats if stats is not None else {}
+    try:
+        start = time.perf_counter()
+        image, repaired = decode_image(file_content)
+        decode_seconds = time.perf_counter() - start
 
-    # Optimización: fragmentos más grandes pero menos cantidad
-    if len(words) > MAX_CHUNKS * max_words:
-        max_words = len(words) // MAX_CHUNKS + 1000
-        print(f"   ⚡ Optimización: fragmentos de {max_words} palabras para {MAX_CHUNKS} chunks máximo")
+        start = time.perf_counter()
+        backend = get_ocr_backend()
+        try:
+            text = backend.image_to_string(np.asarray(image), IMAGE_OCR_PSM, OCR_PAGE_TIMEOUT, IMAGE_OCR_VARIABLES)
+        except Exception as e:
+            # Método alternativo con configuración básica
+            logging.warning(f"OCR de imagen con lista de caracteres falló ({str(e)}) - usando configuración básica")
+            text = backend.image_to_string(np.asarray(image), OCR_LAYOUT_PSM, OCR_PAGE_TIMEOUT)
+        stats["imagen"] = {
+            "ancho": image.width,
+            "alto": image.height,
+            "reparada": repaired,
+            "segundos_decodificacion": round(decode_seconds, 3),
+            "segundos_ocr": round(time.perf_counter() - start, 3),
+            "motor_ocr": backend.name
+        }
 
-    chunks = []
-    overlap = 200
+        # Limpiar texto
+        text = '\n'.join(line.strip() for line in text.strip().split('\n') if line.strip())
+        logging.info(f"✅ Texto extraído exitosamente de imagen en memoria ({len(text)} caracteres)")
+        return text
 
-    text_paragraphs = text.split('\n\n')
-    current_chunk = ""
-    current_words = 0
+    except Exception as e:
+        logging.error(f"❌ Error extrayendo texto de imagen: {str(e)}")
+        return ""
 
-    for paragraph in text_paragraphs:
-        paragraph_words = len(paragraph.split())
+def extraction_settings(content_type, api_key=None, profile=None):
+    """Configuración que afecta al texto extraído (parte de la clave de caché)"""
+    return {
+        "perfil": profile or EXTRACTION_PROFILE,
+        "version": EXTRACTOR_VERSION,
+        "tipo": content_type,
+        "vision_ai": bool(api_key),
+        "vision_presupuesto": [VISION_MAX_PAGES, VISION_MAX_USD],
+        "vision_lote": VISION_BATCH_SIZE,
+        "fusion_ocr_vision": OCR_VISION_MERGE,
+        "tablas": [TABLE_EXTRACTION, TABLE_CAMELOT_FALLBACK, TABLE_MIN_FILL],
+        "filtro_paginas": [PAGE_FILTER, PAGE_BLANK_MAX_INK, PAGE_DUPLICATE_MAX_DISTANCE, PAGE_DUPLICATE_MAX_BLOCK_DIFF],
+        "vision_imagen": [VISION_OPTIMIZE_IMAGES, VISION_MIN_SCALE, VISION_LOW_DETAIL_MAX_INK, VISION_LOW_DETAIL_MAX_AREA],
+        "dpi": PAGE_RENDER_DPI,
+        "ocr_modo": OCR_MODE,
+        "ocr_imagen": [IMAGE_OCR_PSM, IMAGE_OCR_CHAR_WHITELIST],
+        "ocr_psm": OCR_CASCADE_PSMS if OCR_MODE == 'cascada' else [OCR_LAYOUT_PSM, OCR_REGION_PSM, OCR_MIN_CONFIDENCE],
+        "capa_texto": [TEXT_LAYER_MIN_CHARS, TEXT_LAYER_MIN_DENSITY, TEXT_LAYER_MAX_GARBAGE]
+    }
+
+def process_file(file_content, content_type, filename, api_key=None, stats=None, profile=None):
+    """
+    Procesa cualquier tipo de archivo y extrae texto (con caché por hash de contenido).
+    Los PDF se clasifican y se extraen con el perfil asignado; `profile` lo fija
+    ('solo_nativo', 'ocr', 'ocr_vision_selectiva' o 'vision_completa').
+    """
+    return "".join(iter_process_file(file_content, content_type, filename, api_key, stats, profile))
 
-        if current_words + paragraph_words <= max_words:
-            current_chunk += paragraph + "\n\n"
-            current_words += paragraph_words
+def iter_process_file(file_content, content_type, filename, api_key=None, stats=None, profile=None):
+    """
+    Versión en streaming de process_file: genera el texto por partes (una sección por
+    página en los PDF) a medida que se extrae, para que el análisis pueda empezar antes.
+    """
+    from modules.extraction_cache import extraction_cache, EXTRACTION_CACHE_ENABLED
+
+    if not EXTRACTION_CACHE_ENABLED or not isinstance(file_content, (bytes, os.PathLike)):
+        yield from _iter_process_file_uncached(file_content, content_type, filename, api_key, stats, profile)
+        return
+
+    cache_key = extraction_cache.make_key(file_content, extraction_settings(content_type, api_key, profile))
+    entry = extraction_cache.get(cache_key)
+    if entry is not None:
+        print(f"   ⚡ Caché de extracción: ACIERTO para {filename} ({len(entry['texto']):,} caracteres)")
+        if stats is not None:
+            stats.update(entry.get('estadisticas', {}))
+            stats["cache_extraccion"] = "acierto"
+        yield entry['texto']
+        return
+
+    start = time.monotonic()
+    file_stats = stats if stats is not None else {}
+    parts = []
+    for part in _iter_process_file_uncached(file_content, content_type, filename, api_key, file_stats, profile):
+        parts.append(part)
+        yield part
+    elapsed = time.monotonic() - start
+
+    text = "".join(parts)
+    failures = extraction_failures(file_stats)
+    if failures:
+        # Texto degradado: no se sirve desde la caché a las próximas solicitudes
+        print(f"   ⚠️ Extracción con fallos, no se guarda en caché: {'; '.join(failures)}")
+    elif text.strip():
+        extraction_cache.put(cache_key, text, dict(file_stats), elapsed)
+    file_stats["cache_extraccion"] = "fallo"
+    file_stats["segundos_extraccion"] = round(elapsed, 2)
+
+async def aiter_process_file(file_content, content_type, filename, api_key=None, stats=None, profile=None):
+    """
+    Iterador asíncrono sobre iter_process_file: la extracción corre en un hilo y
+    cada parte se entrega al event loop apenas está lista.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    done = object()
+
+    def produce():
+        try:
+            for part in iter_process_file(file_content, content_type, filename, api_key, stats, profile):
+                loop.call_soon_threadsafe(queue.put_nowait, part)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+
+    producer = loop.run_in_executor(None, produce)
+    while True:
+        part = await queue.get()
+        if part is done:
+            break
+        if isinstance(part, Exception):
+            raise part
+        yield part
+    await producer
+
+def _iter_process_file_uncached(file_content, content_type, filename, api_key=None, stats=None, profile=None):
+    """Extrae texto según el tipo de archivo, sin consultar la caché"""
+    try:
+        if content_type == "application/pdf":
+            yield from iter_pdf_sections(file_content, api_key, stats, filename, profile)
+        elif content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
+            yield extract_text_from_docx(file_content)
+        elif content_type.startswith("image/"):
+            yield extract_text_from_image_bytes(file_content, stats)
+        elif isinstance(file_content, (bytes, os.PathLike)):
+            yield read_source(file_content).decode('utf-8', errors='ignore')
         else:
-            if current_chunk.strip():
-                chunks.append(current_chunk.strip())
-
-            current_chunk = paragraph + "\n\n"
-            current_words = paragraph_words
-
-            if paragraph_words > max_words:
-                para_words = paragraph.split()
-                for i in range(0, len(para_words), max_words - overlap):
-                    chunk_part = ' '.join(para_words[i:i + max_words])
-                    chunks.append(chunk_part)
-                current_chunk = ""
-                current_words = 0
-
-    if current_chunk.strip():
-        chunks.append(current_chunk.strip())
-
-    if len(chunks) < 2 and len(words) > max_words:
-        print("   🔄 Usando fragmentación tradicional como respaldo...")
-        chunks = []
-        for i in range(0, len(words), max_words - overlap):
-            chunk = ' '.join(words[i:i + max_words])
-            chunks.append(chunk)
-
-    if len(chunks) > MAX_CHUNKS:
-        print(f"   ⚡ LÍMITE DE FRAGMENTOS: usando solo los primeros {MAX_CHUNKS} fragmentos para eficiencia")
-        chunks = chunks[:MAX_CHUNKS]
-
-    print(f"   📊 Texto dividido en {len(chunks)} fragmentos inteligentes")
-    for i, chunk in enumerate(chunks, 1):
-        palabras = len(chunk.split())
-        print(f"      📄 Fragmento {i}: {palabras:,} palabras")
-
-    return chunks
\ No newline at end of file
+            yield str(file_content)
+    except Exception as e:
+        print(f"   ❌ Error extrayendo {filename}: {str(e)}")
+        record_extraction_failure(stats, str(e))
+
+def chunk_text(text, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    Divide el texto en fragmentos de hasta max_tokens tokens estimados, con solapamiento
+    y páginas/caracteres de origen. No descarta texto: qué fragmentos se envían al modelo
+    lo decide la etapa de selección (modules.chunking.ChunkSelector).
+    """
+    chunks = chunk_document(text, max_tokens, overlap_tokens)
+    print(f"   📊 Texto dividido en {len(chunks)} fragmentos de hasta {max_tokens} tokens")
+    for chunk in chunks:
+        print(f"      📄 Fragmento {chunk['indice'] + 1}: {chunk['tokens']:,} tokens, "
+              f"páginas {chunk['pagina_inicio']}-{chunk['pagina_fin']}")
+    return chunks
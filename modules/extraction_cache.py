@@ -0,0 +1,387 @@
+"""
+🗄️ Módulo de Caché de Extracción
+Guarda en disco el texto extraído de cada archivo, direccionado por el SHA-256
+de su contenido + versión del extractor + configuración, con expulsión LRU.
+Incluye una caché de páginas de Vision AI por hash perceptual, compartida entre documentos.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+
+EXTRACTION_CACHE_DIR = os.getenv('EXTRACTION_CACHE_DIR', os.path.join('.cache', 'extraccion'))
+EXTRACTION_CACHE_MAX_MB = float(os.getenv('EXTRACTION_CACHE_MAX_MB', '512'))
+EXTRACTION_CACHE_ENABLED = os.getenv('EXTRACTION_CACHE_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+
+VISION_CACHE_ENABLED = os.getenv('VISION_CACHE_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+VISION_CACHE_MAX_ENTRIES = int(os.getenv('VISION_CACHE_MAX_ENTRIES', '20000'))
+VISION_CACHE_MAX_DISTANCE = int(os.getenv('VISION_CACHE_MAX_DISTANCE', '6'))  # Bits distintos (de 256)
+VISION_CACHE_MIN_OCR_SIMILARITY = float(os.getenv('VISION_CACHE_MIN_OCR_SIMILARITY', '0.9'))
+# Shingles OCR mínimos (en ambas páginas) para aceptar una coincidencia perceptual; con menos
+# (manuscritos, fotos, formularios sin OCR útil) solo vale la coincidencia exacta de píxeles
+VISION_CACHE_MIN_OCR_SHINGLES = int(os.getenv('VISION_CACHE_MIN_OCR_SHINGLES', '20'))
+
+
+class ExtractionCache:
+    """Caché persistente en disco, una entrada JSON por archivo, LRU por tamaño total"""
+
+    def __init__(self, directory=EXTRACTION_CACHE_DIR, max_bytes=int(EXTRACTION_CACHE_MAX_MB * 1024 * 1024)):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.seconds_saved = 0.0
+
+    @staticmethod
+    def make_key(file_content, settings):
+        """
+        Clave = SHA-256 de los bytes del archivo + huella de versión/configuración.
+        file_content puede ser bytes o la ruta del archivo (se lee por bloques).
+        """
+        if isinstance(file_content, os.PathLike):
+            sha = hashlib.sha256()
+            with open(file_content, 'rb') as stream:
+                for block in iter(lambda: stream.read(1024 * 1024), b''):
+                    sha.update(block)
+            digest = sha.hexdigest()
+        else:
+            digest = hashlib.sha256(file_content).hexdigest()
+        fingerprint = hashlib.sha256(
+            json.dumps(settings, sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()[:16]
+        return f"{digest}_{fingerprint}"
+
+    def _path(self, key):
+        return self.directory / key[:2] / f"{key}.json"
+
+    def _entries(self):
+        if not self.directory.exists():
+            return []
+        return [p for p in self.directory.glob('*/*.json') if p.is_file()]
+
+    def _ensure_size_loaded(self):
+        if self._total_bytes is None:
+            self._total_bytes = sum(p.stat().st_size for p in self._entries())
+
+    def get(self, key):
+        """Devuelve la entrada guardada ({'texto', 'estadisticas', ...}) o None"""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            # Marcar como usado recientemente (orden LRU por mtime)
+            os.utime(path, None)
+            with self._lock:
+                self.hits += 1
+                self.seconds_saved += entry.get('segundos_extraccion', 0.0)
+            return entry
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"   ⚠️ Entrada de caché corrupta {path.name}: {str(e)}")
+            try:
+                path.unlink()
+            except OSError:
+                pass
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, text, stats=None, extraction_seconds=0.0):
+        """Guarda el texto extraído y expulsa las entradas menos usadas si se supera el límite"""
+        path = self._path(key)
+        entry = {
+            'texto': text,
+            'estadisticas': stats or {},
+            'segundos_extraccion': round(extraction_seconds, 3),
+            'creado': datetime.now().isoformat()
+        }
+        data = json.dumps(entry, ensure_ascii=False).encode('utf-8')
+        if self.max_bytes and len(data) > self.max_bytes:
+            return False
+
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            previous_size = path.stat().st_size if path.exists() else 0
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"   ⚠️ No se pudo escribir en la caché de extracción: {str(e)}")
+            return False
+
+        with self._lock:
+            self._ensure_size_loaded()
+            self._total_bytes += len(data) - previous_size
+            self.writes += 1
+            if self.max_bytes and self._total_bytes > self.max_bytes:
+                self._evict()
+        return True
+
+    def _evict(self):
+        """Elimina entradas por antigüedad de uso hasta quedar en el 90% del límite"""
+        target = self.max_bytes * 0.9
+        entries = []
+        for p in self._entries():
+            try:
+                st = p.stat()
+                entries.append((st.st_mtime, st.st_size, p))
+            except OSError:
+                continue
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, p in entries:
+            if total <= target:
+                break
+            try:
+                p.unlink()
+                total -= size
+                self.evictions += 1
+            except OSError:
+                continue
+        self._total_bytes = total
+
+    def purge(self):
+        """Vacía la caché completa"""
+        removed = 0
+        with self._lock:
+            for p in self._entries():
+                try:
+                    p.unlink()
+                    removed += 1
+                except OSError:
+                    continue
+            self._total_bytes = 0
+        print(f"🗑️ Caché de extracción purgada: {removed} entradas eliminadas")
+        return removed
+
+    def get_stats(self):
+        """Contadores de aciertos/fallos y ocupación"""
+        with self._lock:
+            self._ensure_size_loaded()
+            lookups = self.hits + self.misses
+            return {
+                'habilitada': EXTRACTION_CACHE_ENABLED,
+                'directorio': str(self.directory),
+                'aciertos': self.hits,
+                'fallos': self.misses,
+                'tasa_aciertos': round(self.hits / lookups, 3) if lookups else 0.0,
+                'escrituras': self.writes,
+                'expulsiones': self.evictions,
+                'entradas': len(self._entries()),
+                'tamaño_mb': round(self._total_bytes / (1024 * 1024), 2),
+                'limite_mb': round(self.max_bytes / (1024 * 1024), 2),
+                'segundos_ahorrados': round(self.seconds_saved, 1)
+            }
+
+
+def _shingles(text, size=3):
+    words = re.findall(r'\w+', (text or '').lower())
+    if len(words) < size:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def text_similarity(text_a, text_b):
+    """Similitud Jaccard de shingles de 3 palabras (0.0 - 1.0)"""
+    shingles_a, shingles_b = _shingles(text_a), _shingles(text_b)
+    if not shingles_a and not shingles_b:
+        return 1.0
+    if not shingles_a or not shingles_b:
+        return 0.0
+    return len(shingles_a & shingles_b) / len(shingles_a | shingles_b)
+
+
+class VisionPageCache:
+    """
+    Caché de transcripciones de Vision AI por página, compartida entre documentos.
+    Búsqueda exacta por SHA-256 de la imagen y aproximada por hash perceptual de 256 bits
+    (índice por bandas de 32 bits). Una coincidencia aproximada solo se acepta si el
+    texto OCR de la página es casi idéntico al de la página original, para no reutilizar
+    la transcripción de un formato con datos distintos; páginas con muy poco texto OCR
+    (menos de VISION_CACHE_MIN_OCR_SHINGLES) no tienen con qué comprobarlo y solo
+    admiten la búsqueda exacta.
+    """
+
+    BANDS = 8
+    BAND_BITS = 32
+
+    def __init__(self, path=os.path.join(EXTRACTION_CACHE_DIR, 'vision_paginas.sqlite3'), max_entries=VISION_CACHE_MAX_ENTRIES):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._index = None  # {(banda, valor): set(ids)}
+        self._phashes = {}  # id -> int
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.rejected = 0
+        self.usd_saved = 0.0
+
+    def _connect(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=30)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS paginas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                exacto TEXT UNIQUE,
+                phash TEXT,
+                texto TEXT,
+                texto_ocr TEXT,
+                costo_usd REAL,
+                usos INTEGER DEFAULT 0,
+                ultimo_uso REAL
+            )
+        """)
+        return conn
+
+    def _bands(self, phash):
+        mask = (1 << self.BAND_BITS) - 1
+        return [(band, (phash >> (band * self.BAND_BITS)) & mask) for band in range(self.BANDS)]
+
+    def _add_to_index(self, entry_id, phash):
+        self._phashes[entry_id] = phash
+        for key in self._bands(phash):
+            self._index.setdefault(key, set()).add(entry_id)
+
+    def _ensure_index(self, conn):
+        if self._index is not None:
+            return
+        self._index = {}
+        self._phashes = {}
+        for entry_id, phash_hex in conn.execute("SELECT id, phash FROM paginas"):
+            self._add_to_index(entry_id, int(phash_hex, 16))
+
+    def _touch(self, conn, entry_id):
+        conn.execute("UPDATE paginas SET usos = usos + 1, ultimo_uso = ? WHERE id = ?", (time.time(), entry_id))
+        conn.commit()
+
+    def lookup(self, exact_hash, phash, ocr_text=""):
+        """Devuelve (texto, tipo_acierto, costo_usd_original) o (None, None, 0.0)"""
+        try:
+            with self._lock, closing(self._connect()) as conn:
+                row = conn.execute(
+                    "SELECT id, texto, costo_usd FROM paginas WHERE exacto = ?", (exact_hash,)
+                ).fetchone()
+                if row:
+                    self._touch(conn, row[0])
+                    self.exact_hits += 1
+                    self.usd_saved += row[2] or 0.0
+                    return row[1], "exacto", row[2] or 0.0
+
+                if len(_shingles(ocr_text)) < VISION_CACHE_MIN_OCR_SHINGLES:
+                    # Sin OCR suficiente, dos copias llenas del mismo formulario serían indistinguibles
+                    self.misses += 1
+                    return None, None, 0.0
+
+                self._ensure_index(conn)
+                candidates = set()
+                for key in self._bands(phash):
+                    candidates |= self._index.get(key, set())
+                best = None
+                for entry_id in candidates:
+                    distance = bin(self._phashes[entry_id] ^ phash).count('1')
+                    if distance <= VISION_CACHE_MAX_DISTANCE and (best is None or distance < best[0]):
+                        best = (distance, entry_id)
+
+                if best:
+                    row = conn.execute(
+                        "SELECT texto, texto_ocr, costo_usd FROM paginas WHERE id = ?", (best[1],)
+                    ).fetchone()
+                    if (row and len(_shingles(row[1])) >= VISION_CACHE_MIN_OCR_SHINGLES
+                            and text_similarity(ocr_text, row[1]) >= VISION_CACHE_MIN_OCR_SIMILARITY):
+                        self._touch(conn, best[1])
+                        self.near_hits += 1
+                        self.usd_saved += row[2] or 0.0
+                        return row[0], "perceptual", row[2] or 0.0
+                    self.rejected += 1
+
+                self.misses += 1
+                return None, None, 0.0
+        except Exception as e:
+            print(f"   ⚠️ Error consultando caché de Vision AI: {str(e)}")
+            return None, None, 0.0
+
+    def store(self, exact_hash, phash, text, ocr_text="", cost_usd=0.0):
+        """Guarda la transcripción de Vision AI de una página"""
+        try:
+            with self._lock, closing(self._connect()) as conn:
+                self._ensure_index(conn)
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO paginas (exacto, phash, texto, texto_ocr, costo_usd, ultimo_uso) VALUES (?, ?, ?, ?, ?, ?)",
+                    (exact_hash, format(phash, 'x'), text, ocr_text, cost_usd, time.time())
+                )
+                if cursor.rowcount:
+                    self._add_to_index(cursor.lastrowid, phash)
+                self._evict(conn)
+                conn.commit()
+        except Exception as e:
+            print(f"   ⚠️ Error guardando en caché de Vision AI: {str(e)}")
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COUNT(*) FROM paginas").fetchone()[0]
+        excess = total - self.max_entries
+        if excess <= 0:
+            return
+        old_ids = [row[0] for row in conn.execute(
+            "SELECT id FROM paginas ORDER BY ultimo_uso ASC LIMIT ?", (excess,)
+        )]
+        conn.executemany("DELETE FROM paginas WHERE id = ?", [(i,) for i in old_ids])
+        self._index = None  # Se reconstruye en la siguiente consulta
+
+    def purge(self):
+        with self._lock:
+            try:
+                with closing(self._connect()) as conn:
+                    removed = conn.execute("DELETE FROM paginas").rowcount
+                    conn.commit()
+            except Exception as e:
+                print(f"   ⚠️ Error purgando caché de Vision AI: {str(e)}")
+                removed = 0
+            self._index = None
+        return removed
+
+    def get_stats(self):
+        with self._lock:
+            hits = self.exact_hits + self.near_hits
+            lookups = hits + self.misses
+            return {
+                'habilitada': VISION_CACHE_ENABLED,
+                'aciertos_exactos': self.exact_hits,
+                'aciertos_perceptuales': self.near_hits,
+                'fallos': self.misses,
+                'candidatos_rechazados_por_ocr': self.rejected,
+                'tasa_aciertos': round(hits / lookups, 3) if lookups else 0.0,
+                'usd_ahorrados': round(self.usd_saved, 4)
+            }
+
+
+# Instancia global de la caché de extracción
+extraction_cache = ExtractionCache()
+
+# Instancia global de la caché de páginas de Vision AI
+vision_page_cache = VisionPageCache()
+
+
+def get_extraction_cache_stats():
+    """Función helper para las métricas de la caché"""
+    stats = extraction_cache.get_stats()
+    stats['vision_paginas'] = vision_page_cache.get_stats()
+    return stats
+
+
+def purge_extraction_cache():
+    """Función helper para purgar la caché (archivos y páginas de Vision AI)"""
+    return extraction_cache.purge() + vision_page_cache.purge()
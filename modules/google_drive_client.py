@@ -23,6 +23,9 @@ SCOPES = [
     'https://www.googleapis.com/auth/drive.file'
 ]
 
+# Tamaño de bloque de las subidas reanudables (múltiplo de 256 KB)
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
 class GoogleDriveClient:
     def __init__(self, service=None, credentials=None):
         self.service = service
@@ -85,8 +88,8 @@ class GoogleDriveClient:
             print(f"❌ Error creando carpeta {folder_name} en parent {target_parent}: {str(e)}")
             return None
 
-    def upload_file(self, file_path, drive_filename, folder_id=None, metadata=None):
-        """Sube un archivo a Google Drive"""
+    def upload_file(self, file_path, drive_filename, folder_id=None, metadata=None, mime_type=None):
+        """Sube un archivo a Google Drive leyéndolo desde disco por bloques (subida reanudable)"""
         try:
             if not os.path.exists(file_path):
                 print(f"❌ Archivo no encontrado: {file_path}")
@@ -110,7 +113,7 @@ class GoogleDriveClient:
                 '.txt': 'text/plain'
             }
 
-            mime_type = content_types.get(file_extension, 'application/octet-stream')
+            mime_type = mime_type or content_types.get(file_extension, 'application/octet-stream')
 
             # Metadatos del archivo
             file_metadata = {
@@ -123,7 +126,7 @@ class GoogleDriveClient:
                 file_metadata['description'] += f" | {json.dumps(metadata)}"
 
             # Subir archivo
-            media = MediaFileUpload(file_path, mimetype=mime_type)
+            media = MediaFileUpload(file_path, mimetype=mime_type, chunksize=UPLOAD_CHUNK_SIZE, resumable=True)
             file = self.service.files().create(
                 body=file_metadata,
                 media_body=media,
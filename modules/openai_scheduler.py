@@ -0,0 +1,229 @@
+"""
+🚦 Cliente OpenAI compartido y planificador global de llamadas
+Un único AsyncOpenAI por API key (pool de conexiones keep-alive) y un límite de llamadas
+en vuelo compartido por todas las solicitudes /procesar, tanto de chat como de Vision AI.
+Las llamadas se ejecutan en un event loop propio (hilo de fondo), así que sirven igual
+desde código async (análisis en FastAPI) y desde los hilos de extracción (Vision AI).
+Antes de ocupar un lugar, cada llamada pasa por el limitador de tasa de su modelo; los
+reintentos (429, timeouts, errores 5xx) también, porque se hacen aquí y no en el SDK.
+"""
+
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import openai
+
+from modules.rate_limit_store import create_rate_limit_store
+from modules.rate_limiter import RateLimiter, estimate_request_tokens
+
+OPENAI_MAX_IN_FLIGHT = int(os.getenv('OPENAI_MAX_IN_FLIGHT', '16'))
+OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', str(max(20, OPENAI_MAX_IN_FLIGHT))))
+OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', '3'))
+OPENAI_RETRY_BASE_DELAY = 1.0
+OPENAI_RETRY_MAX_DELAY = 60.0
+# Errores transitorios que se reintentan (APITimeoutError es un APIConnectionError)
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+_TRY_AGAIN = re.compile(r'try again in ([\d.]+)(ms|s)')
+
+
+def retry_delay(error, attempt):
+    """Espera antes de reintentar: retry-after de la respuesta, 'try again in Xs' o backoff exponencial"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return min(float(headers["retry-after-ms"]) / 1000, OPENAI_RETRY_MAX_DELAY)
+        if headers.get("retry-after"):
+            return min(float(headers["retry-after"]), OPENAI_RETRY_MAX_DELAY)
+    except ValueError:
+        pass
+    match = _TRY_AGAIN.search(str(error))
+    if match:
+        seconds = float(match.group(1)) / (1000 if match.group(2) == "ms" else 1)
+        return min(seconds + random.uniform(0.1, 1.0), OPENAI_RETRY_MAX_DELAY)
+    return min(OPENAI_RETRY_BASE_DELAY * (2 ** attempt) + random.uniform(0.1, 1.0), OPENAI_RETRY_MAX_DELAY)
+
+
+class OpenAIScheduler:
+    """
+    Planificador de llamadas a OpenAI: como máximo max_in_flight peticiones a la vez en
+    todo el proceso. Las que exceden el límite esperan su turno en orden de llegada.
+    """
+
+    def __init__(self, max_in_flight=OPENAI_MAX_IN_FLIGHT):
+        self.max_in_flight = max(1, max_in_flight)
+        self._loop = None
+        self._slots = None
+        self._clients = {}
+        self._limiters = {}
+        self._rate_limit_store = None
+        self._lock = threading.Lock()
+        self.stats = {
+            "en_vuelo": 0,
+            "max_en_vuelo": 0,
+            "en_espera": 0,
+            "llamadas": {"chat": 0, "vision": 0},
+            "errores": 0,
+            "reintentos": 0,
+            "segundos_espera_total": 0.0
+        }
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="openai-scheduler", daemon=True).start()
+
+                async def create_slots():
+                    return asyncio.Semaphore(self.max_in_flight)
+
+                self._slots = asyncio.run_coroutine_threadsafe(create_slots(), loop).result()
+                self._loop = loop
+        return self._loop
+
+    def _client(self, api_key):
+        """
+        AsyncOpenAI compartido (se crea dentro del loop del planificador). Sin reintentos
+        propios: los del SDK no pasarían por el limitador de tasa (ver _call).
+        """
+        client = self._clients.get(api_key)
+        if client is None:
+            client = openai.AsyncOpenAI(
+                api_key=api_key,
+                max_retries=0,
+                http_client=openai.DefaultAsyncHttpxClient(
+                    limits=httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS,
+                                        max_keepalive_connections=OPENAI_MAX_CONNECTIONS)
+                )
+            )
+            self._clients[api_key] = client
+        return client
+
+    def _limiter(self, model):
+        limiter = self._limiters.get(model)
+        if limiter is None:
+            if self._rate_limit_store is None:
+                # Compartido entre workers/hosts según RATE_LIMIT_STORE
+                self._rate_limit_store = create_rate_limit_store()
+            limiter = self._limiters[model] = RateLimiter(model, store=self._rate_limit_store)
+        return limiter
+
+    async def _call(self, api_key, kind, kwargs):
+        """
+        Una llamada con sus reintentos. Cada intento vuelve a pasar por el limitador; ante
+        un 429 la espera sugerida pausa el modelo entero, no solo esta llamada.
+        """
+        limiter = self._limiter(kwargs.get("model", ""))
+        estimated = estimate_request_tokens(kwargs)
+        self.stats["llamadas"][kind] = self.stats["llamadas"].get(kind, 0) + 1
+        for attempt in range(OPENAI_MAX_RETRIES + 1):
+            try:
+                return await self._attempt(api_key, limiter, estimated, kwargs)
+            except RETRYABLE_ERRORS as e:
+                if attempt >= OPENAI_MAX_RETRIES:
+                    e.intentos = attempt + 1
+                    raise
+                delay = retry_delay(e, attempt)
+                self.stats["reintentos"] += 1
+                print(f"   ⏳ OpenAI: {type(e).__name__}, reintento {attempt + 1}/{OPENAI_MAX_RETRIES} en {delay:.1f}s...")
+                if isinstance(e, openai.RateLimitError):
+                    await limiter.pause(delay)
+                else:
+                    await asyncio.sleep(delay)
+
+    async def _attempt(self, api_key, limiter, estimated, kwargs):
+        """Un intento: admisión en el limitador, lugar en vuelo y la petición HTTP"""
+        queued = time.monotonic()
+        self.stats["en_espera"] += 1
+        try:
+            reservation = await limiter.acquire(estimated)
+        except BaseException:
+            self.stats["en_espera"] -= 1
+            raise
+        headers, used = None, None
+        try:
+            async with self._slots:
+                self.stats["en_espera"] -= 1
+                self.stats["segundos_espera_total"] += time.monotonic() - queued
+                self.stats["en_vuelo"] += 1
+                self.stats["max_en_vuelo"] = max(self.stats["max_en_vuelo"], self.stats["en_vuelo"])
+                try:
+                    # with_raw_response: mismas llamadas, pero con acceso a las cabeceras x-ratelimit-*
+                    raw = await self._client(api_key).chat.completions.with_raw_response.create(**kwargs)
+                    headers = raw.headers
+                    response = raw.parse()
+                    usage = getattr(response, "usage", None)
+                    used = usage.total_tokens if usage else None
+                    return response
+                except openai.APIStatusError as e:
+                    self.stats["errores"] += 1
+                    headers = e.response.headers
+                    raise
+                except Exception:
+                    self.stats["errores"] += 1
+                    raise
+                finally:
+                    self.stats["en_vuelo"] -= 1
+        finally:
+            # Fuera del lugar en vuelo: la transacción del almacén no retiene a las demás llamadas
+            await limiter.release(reservation, estimated, headers, used)
+
+    def submit(self, api_key, kind="chat", **kwargs):
+        """Encola una llamada chat.completions.create; devuelve un concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(self._call(api_key, kind, kwargs), self._ensure_loop())
+
+    def create(self, api_key, kind="chat", **kwargs):
+        """Llamada bloqueante (para hilos de trabajo)"""
+        return self.submit(api_key, kind, **kwargs).result()
+
+    async def acreate(self, api_key, kind="chat", **kwargs):
+        """Llamada desde cualquier event loop"""
+        return await asyncio.wrap_future(self.submit(api_key, kind, **kwargs))
+
+    def sync_client(self, api_key, kind="chat"):
+        """Objeto con la interfaz client.chat.completions.create de openai.OpenAI"""
+        create = lambda **kwargs: self.create(api_key, kind, **kwargs)
+        return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    def async_client(self, api_key, kind="chat"):
+        """Igual que sync_client, pero create es una corrutina (interfaz de openai.AsyncOpenAI)"""
+        create = lambda **kwargs: self.acreate(api_key, kind, **kwargs)
+        return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    def get_stats(self):
+        stats = dict(self.stats, llamadas=dict(self.stats["llamadas"]))
+        stats["limite_en_vuelo"] = self.max_in_flight
+        stats["segundos_espera_total"] = round(stats["segundos_espera_total"], 2)
+        return stats
+
+    def get_rate_limits(self):
+        """Margen actual de solicitudes y tokens por modelo"""
+        return {model or "sin_modelo": limiter.headroom() for model, limiter in list(self._limiters.items())}
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_openai_scheduler():
+    """Planificador único del proceso"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = OpenAIScheduler()
+        return _scheduler
+
+
+def get_scheduler_stats():
+    return get_openai_scheduler().get_stats()
+
+
+def get_rate_limit_stats():
+    return get_openai_scheduler().get_rate_limits()
@@ -0,0 +1,153 @@
+"""
+🗄️ Almacenes del estado del limitador de tasa
+El limitador guarda sus cubetas como un dict JSON por clave (modelo) y las modifica
+siempre con transact(clave, función): leer, modificar y escribir de forma atómica.
+- MemoryRateLimitStore: en memoria, solo para un proceso (comportamiento por defecto)
+- SQLiteRateLimitStore: archivo SQLite compartido por todos los workers de un host
+- CompareAndSwapStore: base para almacenes clave-valor en red (Redis, etcd, Consul...):
+  basta con implementar get y compare_and_set con versión
+Así N workers respetan juntos un único presupuesto de solicitudes y tokens.
+"""
+
+import importlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+
+# 'memoria', 'sqlite' o 'paquete.modulo:Clase' (almacén propio, p. ej. en red)
+RATE_LIMIT_STORE = os.getenv('RATE_LIMIT_STORE', 'memoria')
+RATE_LIMIT_STORE_PATH = os.getenv(
+    'RATE_LIMIT_STORE_PATH', os.path.join(tempfile.gettempdir(), 'robot_ai_rate_limit.sqlite3')
+)
+RATE_LIMIT_CAS_RETRIES = 20
+
+
+class RateLimitStoreError(Exception):
+    """El almacén compartido no pudo completar la transacción"""
+
+
+class RateLimitStore(ABC):
+    """Interfaz de los almacenes: una transacción atómica por clave"""
+
+    # True si transact puede esperar un bloqueo o E/S: el limitador la ejecuta en un hilo
+    blocking = True
+
+    @abstractmethod
+    def transact(self, key, function):
+        """
+        Ejecuta function(estado) -> resultado sobre el estado de 'key' ({} si no existe)
+        de forma atómica respecto de todos los procesos que comparten el almacén.
+        function puede modificar el estado en el lugar; se guarda al terminar.
+        """
+
+    def read(self, key):
+        """Copia del estado actual de 'key' (sin bloqueo)"""
+        return self.transact(key, lambda state: json.loads(json.dumps(state)))
+
+
+class MemoryRateLimitStore(RateLimitStore):
+    blocking = False
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def transact(self, key, function):
+        with self._lock:
+            return function(self._states.setdefault(key, {}))
+
+
+class SQLiteRateLimitStore(RateLimitStore):
+    """
+    Estado en un archivo SQLite (modo WAL). BEGIN IMMEDIATE toma el bloqueo de escritura
+    antes de leer, así que las transacciones de distintos procesos se serializan.
+    """
+
+    def __init__(self, path=RATE_LIMIT_STORE_PATH, timeout=10.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS limites_tasa (clave TEXT PRIMARY KEY, estado TEXT NOT NULL, actualizado REAL)"
+        )
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            self._local.connection = connection
+        return connection
+
+    def transact(self, key, function):
+        connection = self._connection()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error as e:
+            raise RateLimitStoreError(f"No se pudo bloquear {self.path}: {e}") from e
+        try:
+            row = connection.execute("SELECT estado FROM limites_tasa WHERE clave = ?", (key,)).fetchone()
+            state = json.loads(row[0]) if row else {}
+            result = function(state)
+            connection.execute(
+                "INSERT INTO limites_tasa (clave, estado, actualizado) VALUES (?, ?, ?) "
+                "ON CONFLICT(clave) DO UPDATE SET estado = excluded.estado, actualizado = excluded.actualizado",
+                (key, json.dumps(state), time.time())
+            )
+            connection.execute("COMMIT")
+            return result
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def read(self, key):
+        row = self._connection().execute("SELECT estado FROM limites_tasa WHERE clave = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else {}
+
+
+class CompareAndSwapStore(RateLimitStore):
+    """
+    Base para almacenes clave-valor en red. Las subclases implementan:
+    - get(key) -> (valor_json | None, versión)
+    - compare_and_set(key, valor_json, versión) -> bool (False si otro proceso escribió antes)
+    La transacción se reintenta con el estado nuevo cuando hay conflicto.
+    """
+
+    @abstractmethod
+    def get(self, key):
+        """(valor_json | None, versión) de 'key'"""
+
+    @abstractmethod
+    def compare_and_set(self, key, value, version):
+        """Escribe 'value' solo si 'key' sigue en 'version'; False si otro proceso escribió antes"""
+
+    def transact(self, key, function):
+        for _ in range(RATE_LIMIT_CAS_RETRIES):
+            value, version = self.get(key)
+            state = json.loads(value) if value else {}
+            result = function(state)
+            if self.compare_and_set(key, json.dumps(state), version):
+                return result
+        raise RateLimitStoreError(f"Conflicto persistente al actualizar '{key}'")
+
+    def read(self, key):
+        value, _ = self.get(key)
+        return json.loads(value) if value else {}
+
+
+def create_rate_limit_store(spec=RATE_LIMIT_STORE):
+    """Almacén según RATE_LIMIT_STORE"""
+    if spec in ("", "memoria"):
+        return MemoryRateLimitStore()
+    if spec == "sqlite":
+        return SQLiteRateLimitStore()
+    module_name, _, class_name = spec.partition(":")
+    if not class_name:
+        raise ValueError(f"RATE_LIMIT_STORE desconocido: {spec!r}")
+    return getattr(importlib.import_module(module_name), class_name)()
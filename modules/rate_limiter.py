@@ -0,0 +1,278 @@
+"""
+🪣 Limitador de tasa para OpenAI (token bucket)
+Dos cubetas por modelo, una de solicitudes y otra de tokens, que se rellenan de forma
+continua. Cada llamada se admite con su estimación de tokens (prompt + max_tokens, que es
+lo que cuenta la API) y la capacidad se ajusta con las cabeceras x-ratelimit-* de cada
+respuesta, descontando las llamadas admitidas que aún no respondieron (reservas).
+Lo usa el planificador global de llamadas.
+El estado de las cubetas se guarda en un almacén intercambiable (modules/rate_limit_store).
+"""
+
+import asyncio
+import os
+import re
+import time
+import uuid
+
+from modules.rate_limit_store import MemoryRateLimitStore
+
+# Límites iniciales (por minuto) hasta recibir las cabeceras de la primera respuesta
+RATE_LIMIT_RPM = int(os.getenv('RATE_LIMIT_RPM', '500'))
+RATE_LIMIT_TPM = int(os.getenv('RATE_LIMIT_TPM', '150000'))
+# Fracción de la capacidad informada por la API que se usa (margen para otros clientes)
+RATE_LIMIT_HEADROOM = float(os.getenv('RATE_LIMIT_HEADROOM', '0.9'))
+# Tokens estimados por imagen cuando no se conoce su tamaño (1024x1024 en detalle alto)
+RATE_LIMIT_IMAGE_TOKENS = int(os.getenv('RATE_LIMIT_IMAGE_TOKENS', '765'))
+RATE_LIMIT_IMAGE_TOKENS_LOW = 85
+# Una reserva sin liberar (proceso caído a mitad de llamada) se descarta pasado este tiempo
+RATE_LIMIT_RESERVATION_SECONDS = float(os.getenv('RATE_LIMIT_RESERVATION_SECONDS', '300'))
+
+_DURATION_PART = re.compile(r'([\d.]+)(ms|h|m|s)')
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_reset(value):
+    """Duración de las cabeceras reset-* ('1s', '6m0s', '20ms') en segundos"""
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(str(value))
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def estimate_request_tokens(kwargs):
+    """Tokens que la API descuenta al admitir una llamada: prompt estimado + max_tokens"""
+    characters, images = 0, 0
+    for message in kwargs.get("messages", []):
+        content = message.get("content") or ""
+        if isinstance(content, str):
+            characters += len(content)
+            continue
+        for part in content:
+            if part.get("type") == "text":
+                characters += len(part.get("text", ""))
+            elif part.get("type") == "image_url":
+                detail = (part.get("image_url") or {}).get("detail", "high")
+                images += RATE_LIMIT_IMAGE_TOKENS_LOW if detail == "low" else RATE_LIMIT_IMAGE_TOKENS
+    if kwargs.get("response_format"):
+        characters += len(str(kwargs["response_format"]))
+    completion = kwargs.get("max_tokens") or kwargs.get("max_completion_tokens") or 0
+    # Misma aproximación que estimate_tokens (1 token ≈ 3 caracteres)
+    return characters // 3 + images + completion
+
+
+class TokenBucket:
+    """
+    Cubeta con relleno continuo: nivel y capacidad se actualizan en O(1) al consultarla.
+    Usa la hora del sistema para que el estado sirva entre procesos (ver rate_limit_store).
+    """
+
+    def __init__(self, capacity, window_seconds=60.0, now=None):
+        self.capacity = float(max(1, capacity))
+        self.rate = self.capacity / window_seconds
+        self.level = self.capacity
+        self.updated = now or time.time()
+
+    @classmethod
+    def from_state(cls, state, default_capacity, now=None):
+        bucket = cls(default_capacity, now=now)
+        if state:
+            bucket.capacity, bucket.rate = state["capacidad"], state["por_segundo"]
+            bucket.level, bucket.updated = state["nivel"], state["actualizado"]
+        return bucket
+
+    def to_state(self):
+        return {"capacidad": self.capacity, "por_segundo": self.rate, "nivel": self.level, "actualizado": self.updated}
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + max(0.0, now - self.updated) * self.rate)
+        self.updated = max(self.updated, now)
+
+    def available(self, now=None):
+        self._refill(now or time.time())
+        return self.level
+
+    def wait_time(self, amount, now):
+        """Segundos hasta que haya 'amount' disponible (una llamada mayor que la capacidad espera a llenarla)"""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def consume(self, amount, now=None):
+        """Descuenta (o devuelve, si es negativo); el nivel puede quedar en deuda"""
+        self._refill(now or time.time())
+        self.level = min(self.capacity, self.level - amount)
+
+    def sync(self, limit, remaining, reset_seconds, now=None, in_flight=0):
+        """
+        Ajusta la cubeta a lo informado por la API. 'remaining' no incluye las llamadas
+        admitidas que siguen en vuelo (in_flight), así que se descuentan del nivel.
+        """
+        now = now or time.time()
+        self._refill(now)
+        if limit:
+            self.capacity = max(1.0, limit * RATE_LIMIT_HEADROOM)
+            self.rate = self.capacity / 60.0
+            if remaining is not None and reset_seconds:
+                # reset-* = tiempo hasta recuperar la capacidad completa
+                self.rate = max(self.rate, (limit - remaining) * RATE_LIMIT_HEADROOM / reset_seconds)
+        if remaining is not None:
+            # Lo no usado por encima del margen queda para otros clientes de la organización
+            reserve = (limit or 0) * (1 - RATE_LIMIT_HEADROOM)
+            self.level = min(self.capacity, remaining - reserve - in_flight)
+
+    def pause(self, seconds, now=None):
+        """Deja la cubeta vacía durante 'seconds' (429 con tiempo de espera sugerido)"""
+        self._refill(now or time.time())
+        self.level = min(self.level, -seconds * self.rate)
+
+    def snapshot(self, now=None):
+        return {
+            "capacidad": round(self.capacity),
+            "disponibles": round(self.available(now)),
+            "por_segundo": round(self.rate, 2)
+        }
+
+
+class RateLimiter:
+    """
+    Limitador de solicitudes y tokens por minuto de un modelo. Las cubetas viven en un
+    almacén (rate_limit_store), compartido entre workers si se configura así; cada
+    admisión es una transacción atómica. Dentro del proceso las llamadas se admiten en
+    orden de llegada: la primera que no cabe espera y las siguientes esperan detrás.
+    Cada llamada admitida queda reservada en el almacén hasta release().
+    """
+
+    def __init__(self, key="", requests_per_minute=RATE_LIMIT_RPM, tokens_per_minute=RATE_LIMIT_TPM, store=None):
+        self.key = f"openai:{key}"
+        self.defaults = {"solicitudes": requests_per_minute, "tokens": tokens_per_minute}
+        self.store = store or MemoryRateLimitStore()
+        self._turn = None
+        self.stats = {
+            "admitidas": 0,
+            "esperas": 0,
+            "segundos_espera_total": 0.0,
+            "sincronizaciones_cabeceras": 0,
+            "pausas": 0,
+            "ultima_sincronizacion": None
+        }
+
+    async def _update(self, operation):
+        """
+        Aplica operation(cubetas, reservas, ahora) dentro de una transacción del almacén.
+        reservas = {id: [tokens, vence]} de las llamadas en vuelo, sin las vencidas.
+        Con almacenes que bloquean (SQLite, red) la transacción corre en un hilo, así el
+        loop del planificador sigue atendiendo las demás llamadas mientras espera el bloqueo.
+        """
+        def transaction(state):
+            now = time.time()
+            buckets = {name: TokenBucket.from_state(state.get(name), capacity, now)
+                       for name, capacity in self.defaults.items()}
+            reservations = {rid: r for rid, r in state.get("reservas", {}).items() if r[1] > now}
+            result = operation(buckets, reservations, now)
+            state.update({name: bucket.to_state() for name, bucket in buckets.items()})
+            state["reservas"] = reservations
+            return result
+        if self.store.blocking:
+            return await asyncio.to_thread(self.store.transact, self.key, transaction)
+        return self.store.transact(self.key, transaction)
+
+    async def acquire(self, tokens):
+        """
+        Espera hasta que la llamada (con 'tokens' estimados) quepa en ambas cubetas.
+        Devuelve el id de su reserva, que se libera con release() al terminar la llamada.
+        """
+        if self._turn is None:
+            self._turn = asyncio.Lock()  # Se crea en el loop del planificador
+        reservation = uuid.uuid4().hex  # Único entre hosts que comparten el almacén
+
+        def take(buckets, reservations, now):
+            wait = max(buckets["solicitudes"].wait_time(1, now), buckets["tokens"].wait_time(tokens, now))
+            if wait <= 0:
+                buckets["solicitudes"].consume(1, now)
+                buckets["tokens"].consume(tokens, now)
+                reservations[reservation] = [tokens, now + RATE_LIMIT_RESERVATION_SECONDS]
+            return wait
+
+        started = time.monotonic()
+        async with self._turn:
+            while True:
+                wait = await self._update(take)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+        waited = time.monotonic() - started
+        self.stats["admitidas"] += 1
+        if waited > 0.01:
+            self.stats["esperas"] += 1
+            self.stats["segundos_espera_total"] += waited
+        return reservation
+
+    async def release(self, reservation, estimated, headers=None, used=None):
+        """
+        Libera la reserva de una llamada terminada (con respuesta o error). Con cabeceras
+        x-ratelimit-* ajusta ambas cubetas descontando las llamadas que siguen en vuelo;
+        sin ellas corrige la cubeta de tokens con el uso real, si se conoce.
+        Devuelve True si se sincronizó con las cabeceras.
+        """
+        values = self._parse_headers(headers)
+
+        def finish(buckets, reservations, now):
+            reservations.pop(reservation, None)
+            if values:
+                in_flight = {"solicitudes": len(reservations), "tokens": sum(r[0] for r in reservations.values())}
+                for name, (limit, remaining, reset_seconds) in values.items():
+                    buckets[name].sync(limit, remaining, reset_seconds, now, in_flight[name])
+            elif used is not None:
+                buckets["tokens"].consume(used - estimated, now)
+
+        await self._update(finish)
+        if values:
+            self.stats["sincronizaciones_cabeceras"] += 1
+            self.stats["ultima_sincronizacion"] = time.time()
+        return bool(values)
+
+    async def pause(self, seconds):
+        """Ninguna llamada del modelo se admite durante 'seconds' (en todos los workers)"""
+        def block(buckets, reservations, now):
+            for bucket in buckets.values():
+                bucket.pause(seconds, now)
+
+        await self._update(block)
+        self.stats["pausas"] += 1
+
+    @staticmethod
+    def _parse_headers(headers):
+        """{cubeta: (límite, restantes, segundos hasta reponerse)} de x-ratelimit-*"""
+        if not headers:
+            return {}
+        values = {}
+        for name, header in (("solicitudes", "requests"), ("tokens", "tokens")):
+            limit = headers.get(f"x-ratelimit-limit-{header}")
+            remaining = headers.get(f"x-ratelimit-remaining-{header}")
+            if limit is None and remaining is None:
+                continue
+            try:
+                values[name] = (
+                    float(limit) if limit is not None else None,
+                    float(remaining) if remaining is not None else None,
+                    parse_reset(headers.get(f"x-ratelimit-reset-{header}"))
+                )
+            except ValueError:
+                continue
+        return values
+
+    def headroom(self):
+        now = time.time()
+        state = self.store.read(self.key)
+        stats = dict(self.stats, segundos_espera_total=round(self.stats["segundos_espera_total"], 2))
+        for name, capacity in self.defaults.items():
+            stats[name] = TokenBucket.from_state(state.get(name), capacity, now).snapshot(now)
+        in_flight = [r for r in state.get("reservas", {}).values() if r[1] > now]
+        stats["en_vuelo"] = {"solicitudes": len(in_flight), "tokens": sum(r[0] for r in in_flight)}
+        stats["almacen"] = type(self.store).__name__
+        return stats
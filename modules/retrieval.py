@@ -0,0 +1,194 @@
+"""
+🔎 Recuperación de pasajes relevantes por pregunta (BM25)
+Los fragmentos del análisis se dividen en pasajes finos (sin repetir el solapamiento),
+se indexan una vez por documento en un índice invertido BM25 sobre términos en español
+sin acentos, y cada pregunta recibe solo sus top-k pasajes dentro de un presupuesto de
+tokens, en el orden en que aparecen en el documento.
+"""
+
+import heapq
+import math
+import os
+
+from modules.chunking import chunk_document, question_terms, text_terms
+
+RETRIEVAL_PASSAGE_TOKENS = int(os.getenv('RETRIEVAL_PASSAGE_TOKENS', '250'))  # Tamaño de cada pasaje
+RETRIEVAL_TOP_K = int(os.getenv('RETRIEVAL_TOP_K', '8'))                       # Pasajes por pregunta
+RETRIEVAL_MAX_TOKENS = int(os.getenv('RETRIEVAL_MAX_TOKENS', '2500'))          # Presupuesto por pregunta
+BM25_K1 = float(os.getenv('BM25_K1', '1.2'))
+BM25_B = float(os.getenv('BM25_B', '0.75'))
+# Peso de los sinónimos agregados a la consulta frente a los términos de la pregunta
+RETRIEVAL_EXPANSION_WEIGHT = 0.5
+PASSAGE_SEPARATOR = "\n\n[...]\n\n"
+
+# Términos de la pregunta (prefijos de 6 letras, sin acentos) -> sinónimos habituales en los pliegos
+QUERY_EXPANSIONS = {
+    "entida": ["instit", "minist", "alcald", "gobern", "empres", "contra"],
+    "nit": ["identi", "tribut", "rut"],
+    "ciudad": ["munici", "sede", "ubicac"],
+    "direcc": ["calle", "carrer", "avenid"],
+    "valor": ["presup", "precio", "costo", "pesos", "millon"],
+    "cronog": ["fecha", "plazo", "termin"],
+    "experi": ["requis", "anos", "simila"],
+    "salud": ["pensio", "seguri", "social", "afilia"],
+    "anexos": ["format", "docume", "certif"]
+}
+
+
+def query_weights(question):
+    """{término: peso} de una pregunta, con los sinónimos de QUERY_EXPANSIONS a menor peso"""
+    weights = {term: 1.0 for term in question_terms(question)}
+    for term in list(weights):
+        for synonym in QUERY_EXPANSIONS.get(term, []):
+            weights.setdefault(synonym, RETRIEVAL_EXPANSION_WEIGHT)
+    return weights
+
+
+class BM25Index:
+    """
+    Índice invertido BM25 incremental: add() agrega un pasaje y search() solo recorre
+    las listas de los términos de la consulta. IDF y longitud media se calculan al buscar.
+    """
+
+    def __init__(self, k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # término -> [(pasaje, frecuencia), ...]
+        self.lengths = []
+        self.total_length = 0
+
+    def add(self, terms):
+        """Indexa un pasaje; devuelve su número"""
+        index = len(self.lengths)
+        frequencies = {}
+        for term in terms:
+            frequencies[term] = frequencies.get(term, 0) + 1
+        for term, frequency in frequencies.items():
+            self.postings.setdefault(term, []).append((index, frequency))
+        self.lengths.append(len(terms))
+        self.total_length += len(terms)
+        return index
+
+    def search(self, weights, top_k=None):
+        """[(puntaje, pasaje), ...] de mayor a menor, solo pasajes con algún término"""
+        count = len(self.lengths)
+        if not count:
+            return []
+        average = self.total_length / count or 1.0
+        scores = {}
+        for term, weight in weights.items():
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for index, frequency in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[index] / average)
+                scores[index] = scores.get(index, 0.0) + weight * idf * frequency * (self.k1 + 1) / (frequency + norm)
+        ranked = ((score, index) for index, score in scores.items())
+        if top_k is None:
+            return sorted(ranked, key=lambda item: (-item[0], item[1]))
+        return heapq.nsmallest(top_k, ranked, key=lambda item: (-item[0], item[1]))
+
+
+class PassageSplitter:
+    """
+    Divide los fragmentos de modules.chunking (que se solapan) en pasajes finos. El texto
+    ya visto en el fragmento anterior se descarta, así cada parte del documento queda en
+    un solo pasaje, con su documento y página.
+    """
+
+    def __init__(self, passage_tokens=RETRIEVAL_PASSAGE_TOKENS):
+        self.passage_tokens = passage_tokens
+        self.covered = 0      # Carácter (del texto completo) hasta donde ya hay pasajes
+        self.document = None
+        self.page = None
+
+    def split(self, chunk):
+        if not isinstance(chunk, dict):
+            chunk = {"texto": chunk, "caracter_inicio": self.covered, "caracter_fin": self.covered + len(chunk)}
+        base = chunk.get("caracter_inicio", 0)
+        skip = max(0, self.covered - base)
+        text = chunk["texto"][skip:]
+        self.covered = max(self.covered, chunk.get("caracter_fin", base + len(chunk["texto"])))
+
+        passages = []
+        for passage in chunk_document(text, self.passage_tokens, 0):
+            self.document = passage["documento"] or self.document
+            start_page = passage["pagina_inicio"] or self.page
+            self.page = passage["pagina_fin"] or start_page
+            passages.append(dict(
+                passage,
+                documento=self.document,
+                pagina_inicio=start_page,
+                pagina_fin=self.page,
+                caracter_inicio=base + skip + passage["caracter_inicio"],
+                caracter_fin=base + skip + passage["caracter_fin"]
+            ))
+        return passages
+
+
+class DocumentRetriever:
+    """Pasajes de un documento y su índice BM25; retrieve() elige los de cada pregunta"""
+
+    def __init__(self, document=None, top_k=RETRIEVAL_TOP_K, max_tokens=RETRIEVAL_MAX_TOKENS):
+        self.document = document
+        self.top_k = top_k
+        self.max_tokens = max_tokens
+        self.index = BM25Index()
+        self.passages = []
+        self.tokens = 0
+
+    def add(self, passage):
+        self.index.add(text_terms(passage["texto"]))
+        self.passages.append(passage)
+        self.tokens += passage["tokens"]
+
+    def retrieve(self, question):
+        """
+        Pasajes de la pregunta (hasta top_k, dentro de max_tokens) en orden del documento.
+        Devuelve (números de pasaje, reporte).
+        """
+        weights = query_weights(question)
+        if weights:
+            candidates = [index for _, index in self.index.search(weights)]
+        else:
+            candidates = list(range(len(self.passages)))  # Sin términos: el inicio del documento
+        selected, tokens, over_budget = [], 0, 0
+        for index in candidates:
+            if len(selected) >= self.top_k:
+                break
+            passage_tokens = self.passages[index]["tokens"]
+            if self.max_tokens and tokens + passage_tokens > self.max_tokens:
+                over_budget += 1
+                continue
+            selected.append(index)
+            tokens += passage_tokens
+        report = {
+            "pasajes_indexados": len(self.passages),
+            "pasajes_candidatos": len(candidates),
+            "pasajes_enviados": len(selected),
+            "omitidos_presupuesto": over_budget,
+            "tokens_enviados": tokens,
+            "tokens_documento": self.tokens
+        }
+        return sorted(selected), report
+
+    def context(self, indexes):
+        """Texto para el modelo: los pasajes en orden, con documento y página"""
+        parts = []
+        for index in sorted(set(indexes)):
+            passage = self.passages[index]
+            page = f"[Página {passage['pagina_inicio']}]\n" if passage["pagina_inicio"] else ""
+            parts.append(page + passage["texto"])
+        header = f"=== DOCUMENTO: {self.document} ===\n\n" if self.document else ""
+        return header + PASSAGE_SEPARATOR.join(parts)
+
+
+def build_retriever(text_chunks, passage_tokens=RETRIEVAL_PASSAGE_TOKENS, **options):
+    """Índice sobre una lista de fragmentos ya completa (str o dicts de modules.chunking)"""
+    splitter = PassageSplitter(passage_tokens)
+    retriever = DocumentRetriever(**options)
+    for chunk in text_chunks:
+        for passage in splitter.split(chunk):
+            retriever.add(passage)
+    return retriever
@@ -0,0 +1,72 @@
+"""
+📄 Calidad de la capa de texto nativa de un PDF
+Decide si el texto incrustado de una página es fiable (densidad, caracteres basura y
+fuentes) para usarlo sin OCR ni Vision AI. Solo usa la biblioteca estándar.
+"""
+
+import os
+import unicodedata
+
+# Calidad mínima de la capa de texto nativa para omitir OCR/Vision en una página
+TEXT_LAYER_MIN_CHARS = int(os.getenv('TEXT_LAYER_MIN_CHARS', '80'))
+TEXT_LAYER_MIN_DENSITY = float(os.getenv('TEXT_LAYER_MIN_DENSITY', '0.4'))  # Caracteres por 1000 pt²
+TEXT_LAYER_MAX_GARBAGE = float(os.getenv('TEXT_LAYER_MAX_GARBAGE', '0.08'))  # Fracción de caracteres basura
+
+# Símbolos habituales en documentos en español que no indican mala codificación
+TEXT_LAYER_COMMON_SYMBOLS = frozenset('ºªµ°§€¶©®™±×÷¿¡«»–—“”‘’•…')
+
+
+def is_garbage_char(char):
+    """
+    Carácter que delata una capa de texto mal codificada: de control, de reemplazo,
+    de uso privado, sin asignar, o una letra fuera del alfabeto latino. Latin-1 y los
+    símbolos frecuentes (º, ª, µ, °, §, €...) son texto válido.
+    """
+    if char.isspace() or (char.isascii() and char.isprintable()) or char in TEXT_LAYER_COMMON_SYMBOLS:
+        return False
+    if char == '\ufffd':
+        return True
+    category = unicodedata.category(char)
+    if category in ('Cc', 'Cf', 'Co', 'Cn', 'Cs'):
+        return True
+    if category.startswith('L') and ord(char) > 0xFF:
+        # Documentos en español/inglés: letras fuera del alfabeto latino son sospechosas
+        return 'LATIN' not in unicodedata.name(char, '')
+    return False
+
+
+def score_text_layer(text, page_area, font_count):
+    """
+    Evalúa la capa de texto nativa de una página.
+    Criterios: densidad de caracteres, proporción de basura y presencia de fuentes.
+    """
+    visible = [char for char in text if not char.isspace()]
+    chars = len(visible)
+    garbage = sum(1 for char in visible if is_garbage_char(char))
+    garbage_ratio = garbage / chars if chars else 0.0
+    density = chars / (page_area / 1000.0) if page_area else 0.0
+
+    if font_count == 0:
+        passed, reason = False, "Sin fuentes (página escaneada)"
+    elif chars < TEXT_LAYER_MIN_CHARS:
+        passed, reason = False, "Texto insuficiente"
+    elif density < TEXT_LAYER_MIN_DENSITY:
+        passed, reason = False, "Densidad de texto baja"
+    elif garbage_ratio > TEXT_LAYER_MAX_GARBAGE:
+        passed, reason = False, "Texto con caracteres basura"
+    else:
+        passed, reason = True, "Capa de texto válida"
+
+    score = min(density / TEXT_LAYER_MIN_DENSITY, 1.0) * (1.0 - garbage_ratio) if TEXT_LAYER_MIN_DENSITY > 0 else 1.0 - garbage_ratio
+    if font_count == 0:
+        score = 0.0
+
+    return {
+        "caracteres": chars,
+        "densidad": round(density, 3),
+        "proporcion_basura": round(garbage_ratio, 4),
+        "fuentes": font_count,
+        "puntaje": round(score, 3),
+        "aprobada": passed,
+        "motivo": reason
+    }
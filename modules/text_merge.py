@@ -0,0 +1,179 @@
+"""
+🧩 Fusión de transcripciones OCR + Vision AI
+Alinea por líneas el texto OCR y el de Vision AI de una misma página, conserva la
+mejor versión de cada región y produce un único texto por página, para no enviar
+el mismo contenido dos veces al análisis con IA.
+También separa por página las respuestas de Vision AI que transcriben varias páginas.
+"""
+
+import difflib
+import os
+import re
+import unicodedata
+
+# Similitud mínima (0-1) para considerar que una línea OCR y una de Vision AI son la misma línea
+MERGE_LINE_SIMILARITY = float(os.getenv('MERGE_LINE_SIMILARITY', '0.75'))
+# Fracción de shingles de una línea OCR presentes en Vision AI para considerarla redundante
+MERGE_LINE_COVERAGE = float(os.getenv('MERGE_LINE_COVERAGE', '0.7'))
+# Ventaja de calidad que necesita el OCR para reemplazar a Vision AI en una línea
+MERGE_OCR_QUALITY_MARGIN = 0.15
+# Calidad mínima de una línea que solo aparece en el OCR para conservarla
+MERGE_MIN_OCR_LINE_QUALITY = 0.5
+
+_BATCH_PAGE_MARKER = re.compile(r'^[ \t]*=+[ \t]*P[ÁA]GINA[ \t]+(\d+)[ \t]*=+[ \t]*$', re.MULTILINE | re.IGNORECASE)
+
+
+def estimate_tokens(text):
+    """Misma aproximación que modules/ai_analyzer.estimate_tokens (1 token ≈ 3 caracteres)"""
+    return len(text) // 3
+
+
+def normalize_text(text):
+    """Minúsculas y sin acentos (forma común para comparar y buscar términos)"""
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def _normalize_line(line):
+    """Forma comparable de una línea: minúsculas, sin acentos ni puntuación"""
+    return ' '.join(re.findall(r'\w+', normalize_text(line)))
+
+
+def _shingles(text, size=3):
+    words = _normalize_line(text).split()
+    if len(words) < size:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def line_quality(lines):
+    """
+    Proporción de palabras 'legibles' (mayoría de letras/dígitos, longitud razonable).
+    El ruido típico del OCR ('|', '~~', 'ﬁ¬', tokens larguísimos) baja el puntaje.
+    """
+    tokens = [token for line in lines for token in line.split()]
+    if not tokens:
+        return 0.0
+    readable = 0
+    for token in tokens:
+        alnum = sum(1 for c in token if c.isalnum())
+        if len(token) <= 30 and alnum / len(token) >= 0.6:
+            readable += 1
+    return readable / len(tokens)
+
+
+def _covered(line, vision_shingles):
+    """True si el contenido de la línea ya está en la transcripción de Vision AI"""
+    shingles = _shingles(line)
+    if not shingles:
+        return True
+    return len(shingles & vision_shingles) / len(shingles) >= MERGE_LINE_COVERAGE
+
+
+def _keep_ocr_line(line, vision_shingles):
+    return not _covered(line, vision_shingles) and line_quality([line]) >= MERGE_MIN_OCR_LINE_QUALITY
+
+
+def _merge_region(ocr_region, vision_region, vision_shingles, counters):
+    """
+    Región que difiere entre OCR y Vision AI: empareja cada línea OCR con la línea
+    de Vision AI más parecida (en orden) y conserva la de mejor calidad; las líneas
+    OCR sin pareja se insertan en su posición si aportan contenido nuevo.
+    """
+    vision_keys = [_normalize_line(l) for l in vision_region]
+    merged = list(vision_region)
+    inserts = {}
+    next_j = 0
+    matcher = difflib.SequenceMatcher(autojunk=False)
+    for line in ocr_region:
+        matcher.set_seq2(_normalize_line(line))
+        best_ratio, best_j = 0.0, None
+        for j in range(next_j, len(vision_region)):
+            matcher.set_seq1(vision_keys[j])
+            if matcher.real_quick_ratio() <= best_ratio or matcher.quick_ratio() <= best_ratio:
+                continue
+            ratio = matcher.ratio()
+            if ratio > best_ratio:
+                best_ratio, best_j = ratio, j
+
+        if best_j is not None and best_ratio >= MERGE_LINE_SIMILARITY:
+            if line_quality([line]) > line_quality([vision_region[best_j]]) + MERGE_OCR_QUALITY_MARGIN:
+                merged[best_j] = line
+                counters["lineas_ocr_preferidas"] += 1
+            next_j = best_j + 1
+        elif _keep_ocr_line(line, vision_shingles):
+            inserts.setdefault(next_j, []).append(line)
+            counters["lineas_solo_ocr"] += 1
+
+    result = []
+    for j, line in enumerate(merged):
+        result.extend(inserts.get(j, []))
+        result.append(line)
+    result.extend(inserts.get(len(merged), []))
+    return result
+
+
+def merge_page_texts(ocr_text, vision_text):
+    """
+    Fusiona las transcripciones OCR y Vision AI de una página.
+    - Líneas iguales (normalizadas): se conserva la versión de Vision AI.
+    - Líneas distintas pero parecidas: se conserva la de mejor calidad.
+    - Líneas solo del OCR: se conservan si Vision AI no las cubre y son legibles.
+    - Líneas solo de Vision AI: se conservan.
+    Devuelve (texto_fusionado, reporte).
+    """
+    ocr_lines = [line.strip() for line in (ocr_text or '').splitlines() if line.strip()]
+    vision_lines = [line.strip() for line in (vision_text or '').splitlines() if line.strip()]
+    if not ocr_lines or not vision_lines:
+        merged = '\n'.join(vision_lines or ocr_lines)
+        return merged, _merge_report(ocr_text, vision_text, merged)
+
+    vision_shingles = _shingles(' '.join(vision_lines))
+    matcher = difflib.SequenceMatcher(
+        None, [_normalize_line(l) for l in ocr_lines], [_normalize_line(l) for l in vision_lines], autojunk=False
+    )
+
+    merged_lines = []
+    counters = {"lineas_ocr_preferidas": 0, "lineas_solo_ocr": 0}
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        ocr_region, vision_region = ocr_lines[i1:i2], vision_lines[j1:j2]
+        if tag in ('equal', 'insert'):
+            merged_lines.extend(vision_region)
+        elif tag == 'replace':
+            merged_lines.extend(_merge_region(ocr_region, vision_region, vision_shingles, counters))
+        else:  # 'delete': solo en el OCR
+            extra = [l for l in ocr_region if _keep_ocr_line(l, vision_shingles)]
+            merged_lines.extend(extra)
+            counters["lineas_solo_ocr"] += len(extra)
+
+    merged = '\n'.join(merged_lines)
+    return merged, _merge_report(ocr_text, vision_text, merged, counters)
+
+
+def _merge_report(ocr_text, vision_text, merged, counters=None):
+    tokens_before = estimate_tokens(ocr_text or '') + estimate_tokens(vision_text or '')
+    tokens_after = estimate_tokens(merged)
+    report = {
+        "tokens_antes": tokens_before,
+        "tokens_despues": tokens_after,
+        "tokens_eliminados": max(0, tokens_before - tokens_after),
+        "lineas_ocr_preferidas": 0,
+        "lineas_solo_ocr": 0
+    }
+    report.update(counters or {})
+    return report
+
+
+def split_batch_response(text, page_count):
+    """
+    Separa la respuesta de una llamada multipágina por sus delimitadores '=== PÁGINA k ==='.
+    Devuelve la lista de textos por página o None si los delimitadores no son fiables.
+    """
+    markers = list(_BATCH_PAGE_MARKER.finditer(text or ""))
+    if [int(m.group(1)) for m in markers] != list(range(1, page_count + 1)):
+        return None
+    texts = []
+    for k, marker in enumerate(markers):
+        end = markers[k + 1].start() if k + 1 < len(markers) else len(text)
+        texts.append(text[marker.end():end].strip())
+    return texts
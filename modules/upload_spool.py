@@ -0,0 +1,74 @@
+"""
+📥 Recepción de archivos subidos en disco
+Copia cada archivo subido, por bloques, a un directorio temporal propio de la solicitud,
+con límites de tamaño por archivo y por solicitud. La extracción trabaja sobre las rutas
+y los originales se suben a Drive desde disco, sin tener los bytes completos en memoria.
+"""
+
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+UPLOAD_SPOOL_DIR = os.getenv('UPLOAD_SPOOL_DIR', os.path.join(tempfile.gettempdir(), 'robot_ai_uploads'))
+UPLOAD_MAX_FILE_MB = float(os.getenv('UPLOAD_MAX_FILE_MB', '100'))        # 0 = sin límite
+UPLOAD_MAX_REQUEST_MB = float(os.getenv('UPLOAD_MAX_REQUEST_MB', '300'))  # 0 = sin límite
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+class UploadLimitError(Exception):
+    """Archivo o solicitud por encima del límite de tamaño configurado"""
+
+
+class UploadSpool:
+    """Directorio temporal de una solicitud con los archivos subidos ya en disco"""
+
+    def __init__(self, directory=UPLOAD_SPOOL_DIR, max_file_mb=UPLOAD_MAX_FILE_MB, max_request_mb=UPLOAD_MAX_REQUEST_MB):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = Path(tempfile.mkdtemp(prefix='solicitud_', dir=directory))
+        self.max_file_bytes = int(max_file_mb * 1024 * 1024)
+        self.max_request_bytes = int(max_request_mb * 1024 * 1024)
+        self.total_bytes = 0
+        self.files = []
+
+    def _check_limits(self, filename, size):
+        if self.max_file_bytes and size > self.max_file_bytes:
+            raise UploadLimitError(
+                f"{filename} supera el límite de {self.max_file_bytes / (1024 * 1024):.0f} MB por archivo"
+            )
+        if self.max_request_bytes and self.total_bytes + size > self.max_request_bytes:
+            raise UploadLimitError(
+                f"Los archivos superan el límite de {self.max_request_bytes / (1024 * 1024):.0f} MB por solicitud"
+            )
+
+    async def add(self, upload):
+        """
+        Copia un UploadFile a disco por bloques, verificando los límites mientras lee.
+        Devuelve {"nombre", "tipo", "ruta", "tamaño"}.
+        """
+        suffix = Path(upload.filename or '').suffix[:10]
+        path = self.directory / f"{len(self.files):03d}{suffix}"
+        size = 0
+        try:
+            with open(path, 'wb') as destination:
+                while True:
+                    block = await upload.read(UPLOAD_CHUNK_BYTES)
+                    if not block:
+                        break
+                    size += len(block)
+                    self._check_limits(upload.filename, size)
+                    destination.write(block)
+        except Exception:
+            path.unlink(missing_ok=True)
+            raise
+        finally:
+            # Liberar la copia temporal del servidor web
+            await upload.close()
+
+        self.total_bytes += size
+        entry = {"nombre": upload.filename, "tipo": upload.content_type, "ruta": path, "tamaño": size}
+        self.files.append(entry)
+        return entry
+
+    def cleanup(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,96 @@
+"""
+Fragmentación incremental (modules.chunking.TokenChunker) y selección por pregunta.
+"""
+
+from modules.chunking import ChunkSelector, TokenChunker, chunk_document, question_terms
+from modules.text_merge import estimate_tokens
+
+
+def make_document(pages=6, paragraphs=5):
+    parts = ["\n\n=== DOCUMENTO: pliego.pdf ===\n\n"]
+    for page in range(1, pages + 1):
+        parts.append(f"\n--- PÁGINA {page} (Texto nativo) ---\n")
+        parts.append("\n\n".join(
+            f"Párrafo {page}.{n}: el contratista entregará los bienes en la sede principal." for n in range(paragraphs)
+        ))
+        parts.append("\n\n")
+    return parts
+
+
+def test_offsets_point_to_the_chunk_text():
+    text = "".join(make_document())
+
+    chunks = chunk_document(text, max_tokens=120, overlap_tokens=20)
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        source = text[chunk["caracter_inicio"]:chunk["caracter_fin"]]
+        assert source.startswith(chunk["texto"][:20])
+        assert source.endswith(chunk["texto"][-20:])
+
+
+def test_offsets_of_long_paragraph_windows_point_to_their_text():
+    text = "\n--- PÁGINA 1 (OCR) ---\n\n" + " ".join(f"palabra{n}" for n in range(300))
+
+    chunks = chunk_document(text, max_tokens=100, overlap_tokens=10)
+
+    assert len(chunks) > 2
+    for chunk in chunks:
+        assert text[chunk["caracter_inicio"]:chunk["caracter_fin"]] == chunk["texto"]
+
+
+def test_every_paragraph_is_in_some_chunk_and_overlap_is_bounded():
+    text = "".join(make_document())
+
+    chunks = chunk_document(text, max_tokens=120, overlap_tokens=20)
+
+    joined = "\n\n".join(chunk["texto"] for chunk in chunks)
+    for page in range(1, 7):
+        for n in range(5):
+            assert f"Párrafo {page}.{n}:" in joined
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk["caracter_inicio"] > previous["caracter_inicio"]
+        repeated = text[chunk["caracter_inicio"]:previous["caracter_fin"]]
+        assert estimate_tokens(repeated) <= 20 + 2
+
+
+def test_streaming_matches_batch():
+    parts = make_document()
+    chunker = TokenChunker(max_tokens=120, overlap_tokens=20)
+    streamed = []
+    for part in parts:
+        streamed.extend(chunker.add(part))
+    streamed.extend(chunker.finish())
+
+    assert streamed == chunk_document("".join(parts), max_tokens=120, overlap_tokens=20)
+
+
+def test_pages_and_document_are_attributed():
+    chunks = chunk_document("".join(make_document()), max_tokens=120, overlap_tokens=0)
+
+    assert all(chunk["documento"] == "pliego.pdf" for chunk in chunks)
+    assert chunks[0]["pagina_inicio"] == 1
+    assert chunks[-1]["pagina_fin"] == 6
+    assert [c["pagina_inicio"] for c in chunks] == sorted(c["pagina_inicio"] for c in chunks)
+
+
+def test_document_header_is_never_a_chunk_of_its_own():
+    long_page = "\n--- PÁGINA 1 (OCR) ---\n" + "palabra " * 400
+    chunks = chunk_document("\n\n=== DOCUMENTO: escaneado.pdf ===\n\n" + long_page, max_tokens=100, overlap_tokens=10)
+
+    assert chunks[0]["texto"].startswith("=== DOCUMENTO: escaneado.pdf ===")
+    assert "palabra" in chunks[0]["texto"]
+    assert chunks[0]["pagina_inicio"] == 1
+
+
+def test_question_terms_ignore_format_instructions():
+    terms = question_terms("¿Cuál es el número de NIT de la entidad? Responde ÚNICAMENTE con los números")
+
+    assert terms == {"numero", "nit", "entida"}
+
+
+def test_selector_reports_irrelevant_chunks():
+    selector = ChunkSelector(["¿Cuál es el cronograma del proceso?", "¿Cuál es el NIT?"])
+
+    assert selector.select({"texto": "Cronogramas y fechas del proceso", "tokens": 10}) == [0]
+    assert selector.report[1]["omitidos_irrelevantes"] == 1
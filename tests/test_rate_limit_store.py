@@ -0,0 +1,105 @@
+"""
+Almacenes compartidos del limitador de tasa (modules.rate_limit_store): estado común
+entre limitadores, vencimiento de reservas y pausas visibles para todos los workers.
+"""
+
+import asyncio
+import time
+
+import pytest
+
+import modules.rate_limiter as rate_limiter
+from modules.rate_limit_store import (
+    CompareAndSwapStore,
+    RateLimitStoreError,
+    SQLiteRateLimitStore,
+    create_rate_limit_store
+)
+from modules.rate_limiter import RateLimiter
+
+
+class DictCompareAndSwapStore(CompareAndSwapStore):
+    """Almacén clave-valor en memoria; 'conflicts' simula escrituras de otros procesos"""
+
+    def __init__(self, conflicts=0):
+        self.values = {}
+        self.conflicts = conflicts
+
+    def get(self, key):
+        return self.values.get(key, (None, 0))
+
+    def compare_and_set(self, key, value, version):
+        if self.conflicts:
+            self.conflicts -= 1
+            return False
+        if self.values.get(key, (None, 0))[1] != version:
+            return False
+        self.values[key] = (value, version + 1)
+        return True
+
+
+def test_sqlite_store_shares_reservations_between_limiters(tmp_path):
+    path = str(tmp_path / "limites.sqlite3")
+    worker_a = RateLimiter("modelo", 100, 10000, SQLiteRateLimitStore(path))
+    worker_b = RateLimiter("modelo", 100, 10000, SQLiteRateLimitStore(path))
+
+    async def run():
+        reservation = await worker_a.acquire(1200)
+        seen = worker_b.headroom()
+        await worker_a.release(reservation, 1200)
+        return reservation, seen
+
+    reservation, seen = asyncio.run(run())
+
+    assert seen["en_vuelo"] == {"solicitudes": 1, "tokens": 1200}
+    assert seen["tokens"]["disponibles"] == pytest.approx(10000 - 1200, abs=5)
+    assert worker_b.headroom()["en_vuelo"]["solicitudes"] == 0
+    assert reservation not in worker_b.store.read("openai:modelo")["reservas"]
+
+
+def test_expired_reservations_are_dropped(tmp_path, monkeypatch):
+    monkeypatch.setattr(rate_limiter, "RATE_LIMIT_RESERVATION_SECONDS", 0.05)
+    limiter = RateLimiter("modelo", 100, 10000, SQLiteRateLimitStore(str(tmp_path / "limites.sqlite3")))
+
+    asyncio.run(limiter.acquire(700))
+    assert limiter.headroom()["en_vuelo"]["tokens"] == 700
+    time.sleep(0.1)
+
+    assert limiter.headroom()["en_vuelo"] == {"solicitudes": 0, "tokens": 0}
+    # La siguiente transacción la borra del almacén
+    asyncio.run(limiter.release("otra", 0))
+    assert limiter.store.read("openai:modelo")["reservas"] == {}
+
+
+def test_pause_blocks_every_limiter_sharing_the_store(tmp_path):
+    path = str(tmp_path / "limites.sqlite3")
+    worker_a = RateLimiter("modelo", 6000, 100000, SQLiteRateLimitStore(path))
+    worker_b = RateLimiter("modelo", 6000, 100000, SQLiteRateLimitStore(path))
+
+    asyncio.run(worker_a.pause(0.3))
+    started = time.monotonic()
+    asyncio.run(worker_b.acquire(10))
+    waited = time.monotonic() - started
+
+    assert waited >= 0.25
+    assert worker_a.stats["pausas"] == 1
+    assert worker_b.stats["esperas"] == 1
+
+
+def test_compare_and_swap_store_retries_conflicts():
+    store = DictCompareAndSwapStore(conflicts=3)
+
+    assert store.transact("clave", lambda state: state.setdefault("n", 1)) == 1
+    assert store.read("clave") == {"n": 1}
+
+    store.conflicts = 100
+    with pytest.raises(RateLimitStoreError):
+        store.transact("clave", lambda state: None)
+
+
+def test_create_rate_limit_store_from_spec(tmp_path):
+    assert type(create_rate_limit_store("memoria")).__name__ == "MemoryRateLimitStore"
+    store = create_rate_limit_store(f"{__name__}:DictCompareAndSwapStore")
+    assert isinstance(store, CompareAndSwapStore)
+    with pytest.raises(ValueError):
+        create_rate_limit_store("redis")
@@ -0,0 +1,109 @@
+"""
+Limitador de tasa (modules.rate_limiter): cubetas, cabeceras x-ratelimit-* y reservas
+de las llamadas en vuelo.
+"""
+
+import asyncio
+
+import pytest
+
+from modules.rate_limiter import (
+    RATE_LIMIT_HEADROOM,
+    RateLimiter,
+    TokenBucket,
+    estimate_request_tokens,
+    parse_reset
+)
+
+
+def test_parse_reset_durations():
+    assert parse_reset("1s") == 1.0
+    assert parse_reset("6m0s") == 360.0
+    assert parse_reset("20ms") == pytest.approx(0.02)
+    assert parse_reset("1h2m") == 3720.0
+    assert parse_reset("2.5") == 2.5
+    assert parse_reset("") is None
+    assert parse_reset("pronto") is None
+
+
+def test_estimate_request_tokens_counts_prompt_images_and_completion():
+    kwargs = {
+        "messages": [
+            {"role": "system", "content": "x" * 30},
+            {"role": "user", "content": [
+                {"type": "text", "text": "y" * 60},
+                {"type": "image_url", "image_url": {"url": "data:", "detail": "high"}},
+                {"type": "image_url", "image_url": {"url": "data:", "detail": "low"}}
+            ]}
+        ],
+        "max_tokens": 500
+    }
+
+    assert estimate_request_tokens(kwargs) == 30 + 765 + 85 + 500
+
+
+def test_sync_subtracts_in_flight_reservations():
+    bucket = TokenBucket(1000, now=100.0)
+
+    bucket.sync(limit=1000, remaining=800, reset_seconds=12.0, now=100.0, in_flight=150)
+
+    reserve = 1000 * (1 - RATE_LIMIT_HEADROOM)
+    assert bucket.capacity == pytest.approx(1000 * RATE_LIMIT_HEADROOM)
+    assert bucket.level == pytest.approx(800 - reserve - 150)
+    # Lo consumido (200) se repone en los 12 s que indica reset
+    assert bucket.rate == pytest.approx(max(bucket.capacity / 60.0, 200 * RATE_LIMIT_HEADROOM / 12.0))
+
+
+def test_sync_never_exceeds_capacity():
+    bucket = TokenBucket(1000, now=100.0)
+
+    bucket.sync(limit=1000, remaining=1000, reset_seconds=None, now=100.0)
+
+    assert bucket.level == bucket.capacity
+
+
+def test_pause_leaves_the_bucket_in_debt():
+    bucket = TokenBucket(600, now=100.0)
+
+    bucket.pause(5, now=100.0)
+
+    assert bucket.level == pytest.approx(-5 * bucket.rate)
+    assert bucket.wait_time(1, now=100.0) == pytest.approx(5 + 1 / bucket.rate)
+
+
+def test_release_with_headers_discounts_calls_still_in_flight():
+    limiter = RateLimiter("prueba", requests_per_minute=100, tokens_per_minute=10000)
+    headers = {
+        "x-ratelimit-limit-requests": "100",
+        "x-ratelimit-remaining-requests": "90",
+        "x-ratelimit-reset-requests": "6s",
+        "x-ratelimit-limit-tokens": "10000",
+        "x-ratelimit-remaining-tokens": "8000",
+        "x-ratelimit-reset-tokens": "12s"
+    }
+
+    async def run():
+        first = await limiter.acquire(300)
+        await limiter.acquire(500)
+        return await limiter.release(first, 300, headers)
+
+    assert asyncio.run(run())
+    stats = limiter.headroom()
+    assert stats["en_vuelo"] == {"solicitudes": 1, "tokens": 500}
+    reserve = 10000 * (1 - RATE_LIMIT_HEADROOM)
+    # Nivel = restantes - margen - en vuelo (más lo repuesto en el instante transcurrido)
+    assert stats["tokens"]["disponibles"] == pytest.approx(8000 - reserve - 500, abs=20)
+    assert stats["sincronizaciones_cabeceras"] == 1
+
+
+def test_release_without_headers_corrects_with_actual_usage():
+    limiter = RateLimiter("prueba", requests_per_minute=100, tokens_per_minute=6000)
+
+    async def run():
+        reservation = await limiter.acquire(1000)
+        return await limiter.release(reservation, 1000, used=400)
+
+    assert not asyncio.run(run())
+    stats = limiter.headroom()
+    assert stats["en_vuelo"] == {"solicitudes": 0, "tokens": 0}
+    assert stats["tokens"]["disponibles"] == pytest.approx(6000 - 400, abs=5)
@@ -0,0 +1,103 @@
+"""
+Recuperación BM25 por pregunta (modules.retrieval): índice, división en pasajes sin
+repetir el solapamiento y presupuesto de pasajes y tokens.
+"""
+
+from modules.chunking import chunk_document
+from modules.retrieval import BM25Index, DocumentRetriever, PassageSplitter, build_retriever, query_weights
+
+
+def make_document():
+    topics = [
+        "La entidad contratante es la Alcaldía de Medellín con NIT 890905211.",
+        "El presupuesto oficial del proceso es de cien millones de pesos.",
+        "El cronograma fija la fecha de cierre para el 15 de marzo de 2024.",
+        "El proponente debe acreditar experiencia en contratos similares.",
+        "Se exigen aportes al sistema de seguridad social y salud.",
+    ]
+    parts = ["\n\n=== DOCUMENTO: pliego.pdf ===\n\n"]
+    for page, topic in enumerate(topics, 1):
+        filler = " ".join(f"Cláusula general número {n} sin relación con el tema." for n in range(12))
+        parts.append(f"\n--- PÁGINA {page} (Texto nativo) ---\n{topic}\n\n{filler}\n\n")
+    return "".join(parts)
+
+
+def test_bm25_ranks_by_term_frequency_and_rarity():
+    index = BM25Index()
+    index.add(["nit", "entida", "alcald"])
+    index.add(["presup", "valor", "valor"])
+    index.add(["presup", "pesos"])
+    index.add(["clausu", "genera"])
+
+    ranked = index.search({"valor": 1.0, "presup": 1.0})
+
+    assert [passage for _, passage in ranked] == [1, 2]
+    assert ranked[0][0] > ranked[1][0] > 0
+    assert index.search({"valor": 1.0, "presup": 1.0}, top_k=1) == ranked[:1]
+    assert index.search({"inexis": 1.0}) == []
+    assert BM25Index().search({"valor": 1.0}) == []
+
+
+def test_splitter_skips_the_overlap_between_chunks():
+    text = make_document()
+    chunks = chunk_document(text, max_tokens=150, overlap_tokens=60)
+    assert any(b["caracter_inicio"] < a["caracter_fin"] for a, b in zip(chunks, chunks[1:]))
+
+    splitter = PassageSplitter(passage_tokens=40)
+    passages = [passage for chunk in chunks for passage in splitter.split(chunk)]
+
+    for previous, passage in zip(passages, passages[1:]):
+        assert passage["caracter_inicio"] >= previous["caracter_fin"]
+    for passage in passages:
+        assert text[passage["caracter_inicio"]:passage["caracter_fin"]].strip() == passage["texto"].strip()
+    assert all(passage["documento"] == "pliego.pdf" for passage in passages)
+    assert [p["pagina_inicio"] for p in passages] == sorted(p["pagina_inicio"] for p in passages)
+
+
+def test_retrieve_finds_the_relevant_page():
+    retriever = build_retriever(chunk_document(make_document(), 150, 60), passage_tokens=40, document="pliego.pdf")
+
+    question = "¿Cuál es el presupuesto oficial del proceso?"
+    indexes, report = retriever.retrieve(question)
+
+    best = retriever.index.search(query_weights(question), top_k=1)[0][1]
+    assert "presupuesto oficial" in retriever.passages[best]["texto"]
+    assert best in indexes
+    assert report["pasajes_indexados"] == len(retriever.passages)
+    assert report["pasajes_enviados"] == len(indexes)
+    assert report["tokens_documento"] == sum(p["tokens"] for p in retriever.passages)
+
+
+def test_retrieve_respects_top_k_and_token_budget():
+    passages = [{"texto": f"El valor del contrato {'y el valor ' * n}es fijo", "tokens": 40 + n * 30} for n in range(6)]
+    retriever = DocumentRetriever(top_k=3, max_tokens=150)
+    for passage in passages:
+        retriever.add(passage)
+
+    indexes, report = retriever.retrieve("¿Cuál es el valor?")
+
+    assert indexes == sorted(indexes)
+    assert len(indexes) <= 3
+    assert report["tokens_enviados"] == sum(passages[i]["tokens"] for i in indexes) <= 150
+    assert report["omitidos_presupuesto"] > 0
+    assert report["pasajes_candidatos"] == 6
+
+
+def test_question_without_terms_takes_the_start_of_the_document():
+    retriever = DocumentRetriever(top_k=2, max_tokens=0)
+    for n in range(4):
+        retriever.add({"texto": f"Sección {n}", "tokens": 5})
+
+    indexes, _ = retriever.retrieve("¿Y?")
+
+    assert indexes == [0, 1]
+
+
+def test_context_lists_passages_in_document_order():
+    retriever = DocumentRetriever(document="pliego.pdf")
+    retriever.add({"texto": "Primero", "tokens": 2, "pagina_inicio": 1})
+    retriever.add({"texto": "Segundo", "tokens": 2, "pagina_inicio": None})
+
+    context = retriever.context([1, 0, 1])
+
+    assert context == "=== DOCUMENTO: pliego.pdf ===\n\n[Página 1]\nPrimero\n\n[...]\n\nSegundo"
@@ -0,0 +1,106 @@
+"""
+Extracción estructurada (modules.ai_analyzer.analyze_chunk_structured) con un cliente
+falso: interpretación de la respuesta JSON y reintento pregunta por pregunta.
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("openai")
+
+from modules.ai_analyzer import (
+    DEFAULT_QUESTIONS,
+    STRUCTURED_NOT_FOUND,
+    analyze_chunk_structured,
+    build_answers_schema,
+    is_valid_answer
+)
+
+
+def make_response(content, prompt_tokens=100, completion_tokens=20):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+        usage=SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens
+        )
+    )
+
+
+class FakeClient:
+    """Devuelve las respuestas en orden y guarda los argumentos de cada llamada"""
+
+    def __init__(self, *contents):
+        self.contents = list(contents)
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        content = self.contents.pop(0)
+        if isinstance(content, Exception):
+            raise content
+        return make_response(content)
+
+
+CHUNK = {"texto": "La Alcaldía de Medellín, NIT 890.905.211-1, convoca a la licitación..."}
+
+
+def test_build_answers_schema_requires_one_field_per_question():
+    schema = build_answers_schema([0, 1, 4])
+    assert schema["required"] == ["p1", "p2", "p5"]
+    assert set(schema["properties"]) == {"p1", "p2", "p5"}
+    assert schema["additionalProperties"] is False
+
+
+def test_is_valid_answer_rejects_not_found_marker():
+    assert is_valid_answer("Alcaldía de Medellín")
+    assert not is_valid_answer(STRUCTURED_NOT_FOUND)
+    assert not is_valid_answer("No se encontró la información")
+    assert not is_valid_answer("  ")
+
+
+def test_structured_answers_are_parsed_in_one_call():
+    client = FakeClient(json.dumps({"p1": "Alcaldía de Medellín", "p2": STRUCTURED_NOT_FOUND}))
+
+    answers, tokens, cost = asyncio.run(analyze_chunk_structured(client, CHUNK, DEFAULT_QUESTIONS, [0, 1]))
+
+    assert answers == {0: "Alcaldía de Medellín", 1: None}
+    assert tokens == 120
+    assert cost > 0
+    assert len(client.calls) == 1
+    schema = client.calls[0]["response_format"]["json_schema"]["schema"]
+    assert schema["required"] == ["p1", "p2"]
+
+
+def test_missing_field_counts_as_not_found():
+    client = FakeClient(json.dumps({"p1": "Alcaldía de Medellín"}))
+
+    answers, _, _ = asyncio.run(analyze_chunk_structured(client, CHUNK, DEFAULT_QUESTIONS, [0, 1]))
+
+    assert answers == {0: "Alcaldía de Medellín", 1: None}
+
+
+def test_invalid_json_falls_back_to_one_call_per_question():
+    client = FakeClient("esto no es JSON", "Alcaldía de Medellín", "890905211")
+
+    answers, tokens, _ = asyncio.run(analyze_chunk_structured(client, CHUNK, DEFAULT_QUESTIONS, [0, 1]))
+
+    assert answers == {0: "Alcaldía de Medellín", 1: "890905211"}
+    assert len(client.calls) == 3
+    assert all("response_format" not in call for call in client.calls[1:])
+    # Se suman los tokens de la consulta fallida y de las dos individuales
+    assert tokens == 360
+
+
+def test_api_error_falls_back_to_one_call_per_question():
+    client = FakeClient(RuntimeError("500"), "Alcaldía de Medellín", STRUCTURED_NOT_FOUND)
+
+    answers, tokens, _ = asyncio.run(analyze_chunk_structured(client, CHUNK, DEFAULT_QUESTIONS, [0, 1]))
+
+    assert answers == {0: "Alcaldía de Medellín", 1: None}
+    assert tokens == 240
@@ -0,0 +1,60 @@
+"""
+Calidad de la capa de texto nativa (modules.text_layer): caracteres basura y decisión
+de usar el texto del PDF sin OCR ni Vision AI.
+"""
+
+import pytest
+
+from modules.text_layer import TEXT_LAYER_MIN_CHARS, is_garbage_char, score_text_layer
+
+# Página carta (612 x 792 pt)
+PAGE_AREA = 612 * 792
+PARAGRAPH = "El contratista entregará el 1º y 2ª lote con un valor de € 1.500, plazo de 30 días. "
+
+
+@pytest.mark.parametrize("char", list("aZ9 .,;$%\náéíóúñÑüÜ") + list("ºªµ°§€¿¡«»–—“”•…"))
+def test_spanish_text_and_common_symbols_are_not_garbage(char):
+    assert not is_garbage_char(char)
+
+
+@pytest.mark.parametrize("char", ["\ufffd", "\x00", "\x07", "\u200b", "\ue000", "д", "Ж", "中", "α"])
+def test_replacement_control_private_use_and_foreign_letters_are_garbage(char):
+    assert is_garbage_char(char)
+
+
+def test_latin_extended_letters_are_not_garbage():
+    assert not is_garbage_char("ā")
+    assert not is_garbage_char("ő")
+
+
+def test_valid_text_layer_passes():
+    evaluation = score_text_layer(PARAGRAPH * 20, PAGE_AREA, font_count=2)
+
+    assert evaluation["aprobada"]
+    assert evaluation["motivo"] == "Capa de texto válida"
+    assert evaluation["proporcion_basura"] == 0
+    assert 0 < evaluation["puntaje"] <= 1
+
+
+def test_symbols_do_not_fail_a_spanish_page():
+    # Regresión: º, ª, µ y € contaban como basura y mandaban la página a OCR
+    text = "Artículo 1º: la 2ª cuota de 5 µm cuesta € 30. " * 30
+
+    assert score_text_layer(text, PAGE_AREA, font_count=1)["aprobada"]
+
+
+@pytest.mark.parametrize("text, area, fonts, reason", [
+    (PARAGRAPH * 20, PAGE_AREA, 0, "Sin fuentes (página escaneada)"),
+    ("Página 1", PAGE_AREA, 1, "Texto insuficiente"),
+    ("x" * TEXT_LAYER_MIN_CHARS, PAGE_AREA * 100, 1, "Densidad de texto baja"),
+    ("�" * 400 + PARAGRAPH * 10, PAGE_AREA, 1, "Texto con caracteres basura"),
+])
+def test_poor_text_layer_fails_with_its_reason(text, area, fonts, reason):
+    evaluation = score_text_layer(text, area, fonts)
+
+    assert not evaluation["aprobada"]
+    assert evaluation["motivo"] == reason
+
+
+def test_scanned_page_scores_zero():
+    assert score_text_layer(PARAGRAPH * 20, PAGE_AREA, font_count=0)["puntaje"] == 0.0
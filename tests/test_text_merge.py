@@ -0,0 +1,80 @@
+"""
+Fusión de transcripciones OCR + Vision AI por página (modules.text_merge.merge_page_texts)
+y separación por página de las respuestas multipágina (split_batch_response).
+"""
+
+from modules.text_merge import line_quality, merge_page_texts, split_batch_response
+
+
+def test_identical_lines_keep_vision_version_once():
+    ocr = "CONTRATO DE OBRA\nValor: $ 1.000.000"
+    vision = "Contrato de obra\nValor: $ 1.000.000"
+
+    merged, report = merge_page_texts(ocr, vision)
+
+    assert merged == vision
+    assert report["lineas_solo_ocr"] == 0
+    assert report["tokens_eliminados"] == report["tokens_antes"] - report["tokens_despues"]
+
+
+def test_ocr_only_line_is_kept_in_position():
+    ocr = "Entidad contratante\nNIT 890905211 expedido en Medellín\nPlazo de ejecución"
+    vision = "Entidad contratante\nPlazo de ejecución"
+
+    merged, report = merge_page_texts(ocr, vision)
+
+    assert merged.splitlines() == ["Entidad contratante", "NIT 890905211 expedido en Medellín", "Plazo de ejecución"]
+    assert report["lineas_solo_ocr"] == 1
+
+
+def test_ocr_only_noise_is_dropped():
+    ocr = "Entidad contratante\n|~~ ¬¬ ||| ~~\nPlazo de ejecución"
+    vision = "Entidad contratante\nPlazo de ejecución"
+
+    merged, report = merge_page_texts(ocr, vision)
+
+    assert merged == vision
+    assert report["lineas_solo_ocr"] == 0
+
+
+def test_ocr_only_line_already_covered_by_vision_is_dropped():
+    ocr = "el presupuesto oficial del proceso es de cien millones\nFirma"
+    vision = "Firma\nel presupuesto oficial del proceso es de cien millones de pesos"
+
+    merged, _ = merge_page_texts(ocr, vision)
+
+    assert merged.count("presupuesto oficial") == 1
+
+
+def test_similar_line_prefers_better_quality():
+    ocr = "Fecha de cierre: 15 de marzo de 2024"
+    vision = "F|e|c|h|a de ci|e|rre: 1|5 de m|a|r|z|o de 2024"
+
+    merged, report = merge_page_texts(ocr, vision)
+
+    assert line_quality([ocr]) > line_quality([vision])
+    assert merged == ocr
+    assert report["lineas_ocr_preferidas"] == 1
+
+
+def test_empty_side_returns_the_other_text():
+    assert merge_page_texts("", "Texto de Vision")[0] == "Texto de Vision"
+    assert merge_page_texts("Texto del OCR\n\n", None)[0] == "Texto del OCR"
+    merged, report = merge_page_texts(None, "")
+    assert merged == ""
+    assert report["tokens_despues"] == 0
+
+
+def test_batch_response_is_split_by_page_markers():
+    text = "=== PÁGINA 1 ===\nContrato de obra\n\n== Pagina 2 ==\nValor: $ 1.000.000\n=== PÁGINA 3 ===\n"
+
+    assert split_batch_response(text, 3) == ["Contrato de obra", "Valor: $ 1.000.000", ""]
+
+
+def test_batch_response_with_unreliable_markers_is_rejected():
+    assert split_batch_response("=== PÁGINA 1 ===\nA\n=== PÁGINA 3 ===\nC", 2) is None
+    assert split_batch_response("=== PÁGINA 1 ===\nA", 2) is None
+    assert split_batch_response("Texto sin delimitadores", 1) is None
+    assert split_batch_response(None, 1) is None
+    # Un delimitador dentro de una línea de texto no separa páginas
+    assert split_batch_response("=== PÁGINA 1 ===\nVer la === PÁGINA 2 === del anexo", 2) is None